@@ -1,4 +1,9 @@
 # flake8: noqa
 from .version import __version__
 from .kmatch import K
+from .profiling import NodeProfile
+from .index import KIndex
+from .router import KRouter
+from .incremental import KRecordMatcher
+from .cache import KCache
 from .mixins import KmatchTestMixin
@@ -0,0 +1,5 @@
+from .jsonl import main
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
@@ -0,0 +1,91 @@
+"""
+Matches values from iterables and async iterables in asyncio code, a chunk at a time, without blocking the event loop
+for longer than it takes to match one chunk.
+"""
+import asyncio
+
+from .parallel import _chunks
+
+
+async def _achunks(values, chunksize):
+    """
+    Splits an async iterable, or an iterable, of values into lists of up to chunksize values without reading ahead of
+    the current chunk.
+    """
+    if not hasattr(values, '__aiter__'):
+        for chunk in _chunks(values, chunksize):
+            yield chunk
+        return
+
+    chunk = []
+    async for value in values:
+        chunk.append(value)
+        if len(chunk) >= chunksize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def _match_chunk(k, chunk, executor):
+    """
+    Matches a chunk of values in the executor, or in the event loop and then lets other tasks run.
+    """
+    if executor is not None:
+        return await asyncio.get_running_loop().run_in_executor(executor, k.match_many, chunk)
+    results = k.match_many(chunk)
+    await asyncio.sleep(0)
+    return results
+
+
+async def afilter(k, values, chunksize=1000, executor=None):
+    """
+    Filters the values down to those that match the pattern of a K object. Values are read and matched a chunk at a
+    time, and control returns to the event loop after each chunk. The next chunk is only read once every match of the
+    current chunk has been consumed, so a slow consumer slows down reading.
+
+    :param k: The K object whose pattern is matched
+    :type k: :class:`K <kmatch.K>`
+    :param values: The values to be filtered
+    :type values: async iterable or iterable of dict
+    :param chunksize: The number of values matched at a time
+    :type chunksize: int
+    :param executor: The executor to match chunks in, or None to match them in the event loop
+    :type executor: concurrent.futures.Executor
+    :rtype: async generator of dict
+    :returns: An async generator of the values that match the pattern, in the order of values
+    """
+    chunks = _achunks(values, chunksize)
+    try:
+        async for chunk in chunks:
+            results = await _match_chunk(k, chunk, executor)
+            for value, result in zip(chunk, results):
+                if result:
+                    yield value
+    finally:
+        await chunks.aclose()
+
+
+async def amatch_many(k, values, chunksize=1000, executor=None):
+    """
+    Matches each of the values to the pattern of a K object, a chunk at a time as in afilter.
+
+    :param k: The K object whose pattern is matched
+    :type k: :class:`K <kmatch.K>`
+    :param values: The values to be matched
+    :type values: async iterable or iterable of dict
+    :param chunksize: The number of values matched at a time
+    :type chunksize: int
+    :param executor: The executor to match chunks in, or None to match them in the event loop
+    :type executor: concurrent.futures.Executor
+    :rtype: list of bool
+    :returns: A list with True for each value that matches the pattern and False otherwise, in the order of values
+    """
+    results = []
+    chunks = _achunks(values, chunksize)
+    try:
+        async for chunk in chunks:
+            results.extend(await _match_chunk(k, chunk, executor))
+    finally:
+        await chunks.aclose()
+    return results
@@ -0,0 +1,14 @@
+"""
+Benchmarks for the kmatch hot paths. Run them with ``python -m kmatch.benchmarks``.
+"""
+# flake8: noqa
+from .deep_patterns import benchmark_deep_patterns
+from .hot_paths import (
+    benchmark_codegen, benchmark_construction, benchmark_field_keys, benchmark_regex, benchmark_suppressed,
+    benchmark_trees
+)
+from .incremental import benchmark_incremental
+from .runner import BENCHMARKS, compare_results, run_benchmarks
+from .routing import benchmark_routing
+from .short_circuit import benchmark_short_circuit
+from .startup import benchmark_startup
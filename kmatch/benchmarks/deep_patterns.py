@@ -0,0 +1,28 @@
+from kmatch import K
+
+from .hot_paths import deep_pattern, make_value
+from .timing import time_matches
+
+
+class TreeK(K):
+    """
+    A K that always lowers its pattern into a tree of callables evaluated by nested calls, which is how patterns of
+    any depth were matched before branch programs. Used as the baseline branch programs are measured against.
+    """
+    _MAX_TREE_DEPTH = float('inf')
+
+
+def benchmark_deep_patterns(depth=200, num_values=2000):
+    """
+    Times matching values that satisfy every filter against depth nested & and | operators, as a tree of callables
+    and as a branch program. Returns a dictionary of the time taken per match by each and the speedup of the branch
+    program.
+    """
+    pattern = deep_pattern(depth)
+    values = [make_value(i) for i in range(num_values)]
+    timings = {
+        'tree': time_matches(TreeK(pattern), values) / num_values,
+        'program': time_matches(K(pattern), values) / num_values,
+    }
+    timings['speedup'] = timings['tree'] / timings['program']
+    return timings
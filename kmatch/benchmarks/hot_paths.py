@@ -0,0 +1,158 @@
+"""
+Benchmarks of K construction, matching and get_field_keys on generated patterns. Each benchmark takes a scale that
+multiplies the amount of work done and returns a dictionary of the time in seconds taken per operation.
+"""
+from kmatch import K
+
+from .timing import best_time, time_matches
+
+
+def _scaled(count, scale):
+    return max(1, int(count * scale))
+
+
+def filter_pattern(i):
+    """
+    Returns one of a mix of filters on the key 'f<i>' that all match the values of make_value.
+    """
+    key = 'f{0}'.format(i % 100)
+    return [
+        ['==', key, i % 100],
+        ['>=', key, 0],
+        ['?', key],
+        ['=~', 'name', '^user'],
+    ][i % 4]
+
+
+def tree_pattern(depth, width):
+    """
+    Returns a pattern that alternates & and | operators with width operands for depth levels, with width ** depth
+    filters at the leaves.
+    """
+    counter = iter(range(width ** depth))
+
+    def build(level):
+        if level == depth:
+            return filter_pattern(next(counter))
+        return ['&' if level % 2 == 0 else '|', [build(level + 1) for _ in range(width)]]
+    return build(0)
+
+
+def deep_pattern(depth):
+    """
+    Returns a pattern of depth nested operators, each with a filter and the next operator as operands.
+    """
+    p = filter_pattern(0)
+    for i in range(1, depth + 1):
+        p = ['&' if i % 2 else '|', [filter_pattern(i), p] if i % 2 else [p, filter_pattern(i)]]
+    return p
+
+
+def make_value(i=0):
+    """
+    Returns a value with the keys f0 to f99 that matches every filter of filter_pattern.
+    """
+    value = dict(('f{0}'.format(j), j) for j in range(100))
+    value['name'] = 'user{0}'.format(i)
+    return value
+
+
+def benchmark_construction(scale=1.0):
+    """
+    Times constructing K objects for patterns of 1, 100, 1000 and 10000 filters, and for the pattern of 1000 filters
+    with lazy.
+    """
+    sizes = [('small', filter_pattern(0), 10000, {}), ('medium', tree_pattern(2, 10), 100, {})]
+    sizes.append(('large', tree_pattern(3, 10), 10, {}))
+    sizes.append(('large_lazy', tree_pattern(3, 10), 10, {'lazy': True}))
+    sizes.append(('huge', tree_pattern(4, 10), 1, {}))
+    return dict(
+        (name, best_time(lambda: K(p, **kwargs), number=_scaled(count, scale)))
+        for name, p, count, kwargs in sizes
+    )
+
+
+def benchmark_trees(scale=1.0):
+    """
+    Times matching values that satisfy every filter against wide & and | operators and deeply nested operators. The
+    | only evaluates its first operand, so it measures the cost of stopping early.
+    """
+    values = [make_value(i) for i in range(_scaled(2000, scale))]
+    wide = [filter_pattern(i) for i in range(200)]
+    patterns = {
+        'wide_and': ['&', wide],
+        'wide_or': ['|', wide],
+        'deep': deep_pattern(100),
+        'tree': tree_pattern(3, 5),
+    }
+    return dict((name, time_matches(K(p), values) / len(values)) for name, p in patterns.items())
+
+
+def benchmark_regex(scale=1.0):
+    """
+    Times regex filters that only match literal text, general regexes and | of many regexes on the same key.
+    """
+    values = [{'message': '{0} request {1} took {2}ms'.format(level, i, i % 97)}
+              for i in range(_scaled(20000, scale)) for level in ['INFO', 'ERROR']]
+    patterns = {
+        'prefix': ['=~', 'message', '^ERROR'],
+        'contains': ['=~', 'message', '.*took 5ms.*'],
+        'general': ['=~', 'message', r'^[A-Z]+ request \d+ took \d{2}ms$'],
+        'or_same_key': ['|', [['=~', 'message', '^LEVEL{0} '.format(i)] for i in range(20)]],
+        'or_same_key_general': ['|', [['=~', 'message', r'.*request \d+ took {0}ms'.format(i)] for i in range(20)]],
+    }
+    return dict((name, time_matches(K(p), values) / len(values)) for name, p in patterns.items())
+
+
+def benchmark_suppressed(scale=1.0):
+    """
+    Times matching an & of filters on values missing most of its keys, with suppressed key errors and suppressed
+    exceptions, against values that have every key.
+    """
+    p = ['|', [['&', [['>', 'f{0}'.format(i), 0], ['<', 'g{0}'.format(i), 'z']]] for i in range(20)]]
+    missing_values = [{'f{0}'.format(i % 20): 1} for i in range(_scaled(5000, scale))]
+    present_values = [
+        dict([('f{0}'.format(j), 0) for j in range(20)] + [('g{0}'.format(j), 'z') for j in range(20)])
+        for _ in range(len(missing_values))
+    ]
+    type_error_values = [dict((key, str(item)) for key, item in value.items()) for value in present_values]
+    return {
+        'all_keys_present': time_matches(K(p), present_values) / len(present_values),
+        'key_errors': time_matches(K(p, suppress_key_errors=True), missing_values) / len(missing_values),
+        'exceptions': time_matches(K(p, suppress_exceptions=True), type_error_values) / len(type_error_values),
+    }
+
+
+def benchmark_field_keys(scale=1.0):
+    """
+    Times get_field_keys on a pattern of 1000 filters and a pattern of 100 nested operators. The large and deep results
+    walk the pattern, which is passed to get_field_keys, and the cached results get the field keys computed when the K
+    object was constructed.
+    """
+    number = _scaled(10, scale)
+    large_p, deep_p = tree_pattern(3, 10), deep_pattern(100)
+    large_k, deep_k = K(large_p), K(deep_p)
+    return {
+        'large': best_time(lambda: large_k.get_field_keys(large_p), number=number),
+        'deep': best_time(lambda: deep_k.get_field_keys(deep_p), number=number),
+        'large_cached': best_time(large_k.get_field_keys, number=number),
+        'deep_cached': best_time(deep_k.get_field_keys, number=number),
+    }
+
+
+def benchmark_codegen(scale=1.0):
+    """
+    Times matching values that satisfy every filter against an & of 20 == filters and a tree of 125 filters, with the
+    tree of callables and with a generated function, and returns the speedup of the generated function on the tree.
+    """
+    values = [make_value(i) for i in range(_scaled(2000, scale))]
+    patterns = {
+        'equal': ['&', [['==', 'f{0}'.format(i), i] for i in range(20)]],
+        'tree': tree_pattern(3, 5),
+    }
+    timings = {}
+    for name, p in patterns.items():
+        timings[name] = time_matches(K(p), values) / len(values)
+        timings['{0}_codegen'.format(name)] = time_matches(K(p, codegen=True), values) / len(values)
+    timings['speedup'] = timings['tree'] / timings['tree_codegen']
+    return timings
@@ -0,0 +1,47 @@
+"""
+Benchmarks matching a record that is updated one key at a time against many patterns, with a KRecordMatcher and by
+matching every K object again after each update.
+"""
+from kmatch import K, KRecordMatcher
+
+from .timing import best_time
+
+
+def record_pattern(i, num_keys):
+    """
+    Returns the pattern of one of the rules a record is matched against, which use a few of its keys each.
+    """
+    return ['|', [
+        ['&', [['>', 'k{0}'.format((i + j) % num_keys), 10], ['<', 'k{0}'.format((i + j + 1) % num_keys), 90]]]
+        for j in range(5)
+    ]]
+
+
+def benchmark_incremental(num_patterns=40, num_keys=200, num_updates=2000):
+    """
+    Times updating one key of a record of num_keys keys and finding which of num_patterns patterns it matches, with a
+    KRecordMatcher and by matching every K object. Returns a dictionary of the time taken per update by each and the
+    speedup of the KRecordMatcher.
+    """
+    ks = [K(record_pattern(i, num_keys)) for i in range(num_patterns)]
+    keys = ['k{0}'.format(i * 7 % num_keys) for i in range(num_updates)]
+
+    def rematch():
+        record = dict(('k{0}'.format(i), i % 100) for i in range(num_keys))
+        for i, key in enumerate(keys):
+            record[key] = i % 100
+            [k for k in ks if k.match(record)]
+
+    def update():
+        record = dict(('k{0}'.format(i), i % 100) for i in range(num_keys))
+        matcher = KRecordMatcher(ks, record)
+        for i, key in enumerate(keys):
+            record[key] = i % 100
+            matcher.update([key])
+
+    timings = {
+        'rematch': best_time(rematch) / num_updates,
+        'update': best_time(update) / num_updates,
+    }
+    timings['speedup'] = timings['rematch'] / timings['update']
+    return timings
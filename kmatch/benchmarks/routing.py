@@ -0,0 +1,52 @@
+"""
+Benchmarks routing values to the first, or every, matching pattern of an ordered list of patterns that repeat the same
+filters, with a KRouter and by matching each K object in turn.
+"""
+from kmatch import K, KRouter
+
+from .timing import best_time
+
+
+def route_pattern(i):
+    """
+    Returns the pattern of one of a list of routes, which repeat filters on the environment, the region and the event.
+    """
+    return ['&', [
+        ['==', 'env', 'prod'],
+        ['|', [['==', 'region', 'eu'], ['==', 'region', 'us']]],
+        ['=~', 'event', '^(login|logout|purchase)'],
+        ['==', 'shard', i],
+    ]]
+
+
+def make_route_value(i, num_routes):
+    return {'env': 'prod', 'region': 'us', 'event': 'purchase', 'shard': i % (num_routes * 2)}
+
+
+def benchmark_routing(num_routes=40, num_values=2000):
+    """
+    Times routing values to the first matching pattern and to every matching pattern out of num_routes patterns, with
+    a KRouter and by matching the K objects in order. Half of the values match no pattern. Returns a dictionary of the
+    time taken per value by each and the speedups of the router.
+    """
+    routes = [(K(route_pattern(i), suppress_key_errors=True), i) for i in range(num_routes)]
+    router = KRouter(routes)
+    values = [make_route_value(i, num_routes) for i in range(num_values)]
+
+    def route_in_order(value):
+        for k, target in routes:
+            if k.match(value):
+                return target
+        return None
+
+    route, route_all = router.route, router.route_all
+    timings = {
+        'first_in_order': best_time(lambda: [route_in_order(value) for value in values]) / num_values,
+        'first_router': best_time(lambda: [route(value) for value in values]) / num_values,
+        'all_in_order': best_time(
+            lambda: [[target for k, target in routes if k.match(value)] for value in values]) / num_values,
+        'all_router': best_time(lambda: [route_all(value) for value in values]) / num_values,
+    }
+    timings['first_speedup'] = timings['first_in_order'] / timings['first_router']
+    timings['all_speedup'] = timings['all_in_order'] / timings['all_router']
+    return timings
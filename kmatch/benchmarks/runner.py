@@ -0,0 +1,115 @@
+"""
+Runs the benchmarks, writes their results as JSON and compares them to the results of a saved baseline run.
+"""
+import argparse
+from collections import namedtuple, OrderedDict
+import json
+import platform
+import sys
+
+from kmatch.version import __version__
+
+from .deep_patterns import benchmark_deep_patterns
+from .hot_paths import (
+    benchmark_codegen, benchmark_construction, benchmark_field_keys, benchmark_regex, benchmark_suppressed,
+    benchmark_trees
+)
+from .incremental import benchmark_incremental
+from .routing import benchmark_routing
+from .short_circuit import benchmark_short_circuit
+from .startup import benchmark_startup
+
+
+# Each benchmark takes a scale for the amount of work done and returns a dictionary of named results
+BENCHMARKS = OrderedDict([
+    ('construction', benchmark_construction),
+    ('trees', benchmark_trees),
+    ('regex', benchmark_regex),
+    ('suppressed', benchmark_suppressed),
+    ('field_keys', benchmark_field_keys),
+    ('codegen', benchmark_codegen),
+    ('short_circuit', lambda scale: benchmark_short_circuit(num_values=max(1, int(20000 * scale)))),
+    ('deep_patterns', lambda scale: benchmark_deep_patterns(num_values=max(1, int(2000 * scale)))),
+    ('startup', lambda scale: benchmark_startup(num_rules=max(1, int(5000 * scale)))),
+    ('routing', lambda scale: benchmark_routing(num_values=max(1, int(2000 * scale)))),
+    ('incremental', lambda scale: benchmark_incremental(num_updates=max(1, int(2000 * scale)))),
+])
+
+
+Comparison = namedtuple('Comparison', ['name', 'baseline', 'result', 'change', 'regressed'])
+
+
+def run_benchmarks(names=None, scale=1.0):
+    """
+    Runs the named benchmarks, or all of them, and returns a dictionary of their results keyed on
+    '<benchmark>.<result>'. Results are times in seconds, except for the ratios named speedup.
+    """
+    results = OrderedDict()
+    for name in names or BENCHMARKS:
+        for result_name, result in sorted(BENCHMARKS[name](scale).items()):
+            results['{0}.{1}'.format(name, result_name)] = result
+    return results
+
+
+def compare_results(results, baseline, threshold=0.1):
+    """
+    Compares results to the results of a baseline run. The change is the relative increase of a time, or the relative
+    decrease of a speedup, so a positive change is always worse. A result regressed if its change is above threshold.
+    Results missing from either run are skipped.
+    """
+    comparisons = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        change = (result - baseline[name]) / baseline[name]
+        if name.endswith('speedup'):
+            change = -change
+        comparisons.append(Comparison(name, baseline[name], result, change, change > threshold))
+    return comparisons
+
+
+def main(args=None, stdout=None):
+    """
+    Runs the benchmarks from the command line. Returns 1 if a baseline was given and a result regressed, or 0.
+    """
+    parser = argparse.ArgumentParser(prog='python -m kmatch.benchmarks', description='Benchmark kmatch.')
+    parser.add_argument('names', nargs='*', help='the benchmarks to run: {0}'.format(', '.join(BENCHMARKS)))
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply the work done by each benchmark')
+    parser.add_argument('--json', action='store_true', help='write the results to stdout as JSON')
+    parser.add_argument('--save', metavar='FILE', help='save the results as JSON for use as a baseline')
+    parser.add_argument('--baseline', metavar='FILE', help='compare the results to a saved baseline')
+    parser.add_argument('--threshold', type=float, default=0.1, help='the relative change counted as a regression')
+    args = parser.parse_args(args)
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark - {0}'.format(name))
+    stdout = stdout or sys.stdout
+
+    run = {
+        'kmatch_version': __version__,
+        'python_version': platform.python_version(),
+        'scale': args.scale,
+        'results': run_benchmarks(args.names, args.scale),
+    }
+    if args.save:
+        with open(args.save, 'w') as save_file:
+            json.dump(run, save_file, indent=2)
+
+    comparisons = []
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            comparisons = compare_results(run['results'], json.load(baseline_file)['results'], args.threshold)
+        run['comparisons'] = [comparison._asdict() for comparison in comparisons]
+
+    if args.json:
+        json.dump(run, stdout, indent=2)
+        stdout.write('\n')
+    elif comparisons:
+        for comparison in comparisons:
+            stdout.write('{0}: {1:.4g} -> {2:.4g} ({3:+.1%}){4}\n'.format(
+                comparison.name, comparison.baseline, comparison.result, comparison.change,
+                ' REGRESSED' if comparison.regressed else ''))
+    else:
+        for name, result in run['results'].items():
+            stdout.write('{0}: {1:.4g}\n'.format(name, result))
+    return 1 if any(comparison.regressed for comparison in comparisons) else 0
@@ -0,0 +1,45 @@
+from kmatch import K
+
+from .timing import time_matches
+
+
+class FullEvaluationK(K):
+    """
+    A K whose & and | operators evaluate every operand before combining the results, which is how they behaved before
+    short-circuiting. Used as the baseline the short-circuiting operators are measured against.
+    """
+    def _build_junction_matcher(self, p, path=()):
+        operator_func = self._OPERATOR_MAP[p[0]]
+        operands = [self._build_matcher(operator_or_filter) for operator_or_filter in p[1]]
+        return lambda value: operator_func([operand(value) for operand in operands])
+
+
+def benchmark_short_circuit(num_filters=50, num_values=20000):
+    """
+    Times a wide | of num_filters regex and equality filters against values that almost always match one of the
+    first few filters, and against values that almost always match one of the last few. Returns a dictionary of the
+    time taken with full evaluation, short-circuiting and short-circuiting with reorder_filters for the first values,
+    and with short-circuiting and reorder_filters for the last, when reordering moves the deciding filters first.
+    """
+    pattern = ['|', [
+        ['=~', 'f{0}'.format(i), '^value'] if i % 2 else ['==', 'f{0}'.format(i), 'value']
+        for i in range(num_filters)
+    ]]
+    values = [
+        dict(('f{0}'.format(i), 'value' if i == hit else 'other') for i in range(num_filters))
+        for hit in (i % 3 if i % 100 else num_filters for i in range(num_values))
+    ]
+    late_values = [
+        dict(('f{0}'.format(i), 'value' if i == hit else 'other') for i in range(num_filters))
+        for hit in (num_filters - 1 - i % 3 if i % 100 else num_filters for i in range(num_values))
+    ]
+    timings = {
+        'full_evaluation': time_matches(FullEvaluationK(pattern), values),
+        'short_circuit': time_matches(K(pattern), values),
+        'short_circuit_reordered': time_matches(K(pattern, reorder_filters=True), values),
+        'late_short_circuit': time_matches(K(pattern), late_values),
+        'late_short_circuit_reordered': time_matches(K(pattern, reorder_filters=True), late_values),
+    }
+    timings['speedup'] = timings['full_evaluation'] / timings['short_circuit']
+    timings['reorder_speedup'] = timings['late_short_circuit'] / timings['late_short_circuit_reordered']
+    return timings
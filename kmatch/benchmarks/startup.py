@@ -0,0 +1,41 @@
+"""
+Benchmarks the startup of a worker that loads a rule set, either by constructing K objects from JSON or by loading K
+objects that were serialized once they were constructed.
+"""
+import json
+
+from kmatch import K
+from kmatch.serialization import dumps, loads
+
+from .timing import best_time
+
+
+def rule_pattern(i):
+    """
+    Returns the pattern of a typical routing rule, with a regex and an in filter.
+    """
+    return ['&', [
+        ['==', 'event', 'event{0}'.format(i % 50)],
+        ['|', [
+            ['=~', 'path', '^/api/v{0}/.*[0-9]+$'.format(i % 30)],
+            ['>', 'n', i],
+            ['in', 'level', ['debug', 'info', i]],
+        ]],
+        ['!', ['?', 'skip']],
+    ]]
+
+
+def benchmark_startup(num_rules=5000):
+    """
+    Times constructing num_rules K objects from JSON and loading the same K objects serialized, both with garbage
+    collection enabled as it is in a worker. Returns a dictionary of the time taken by each and the speedup of
+    loading.
+    """
+    rules_json = json.dumps([rule_pattern(i) for i in range(num_rules)])
+    data = dumps([K(pattern) for pattern in json.loads(rules_json)])
+    timings = {
+        'json': best_time(lambda: [K(pattern) for pattern in json.loads(rules_json)], repeat=3, gc_enabled=True),
+        'load': best_time(lambda: loads(data), repeat=3, gc_enabled=True),
+    }
+    timings['speedup'] = timings['json'] / timings['load']
+    return timings
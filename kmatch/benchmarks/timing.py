@@ -0,0 +1,18 @@
+from timeit import Timer
+
+
+def best_time(func, repeat=5, number=1, gc_enabled=False):
+    """
+    Returns the best time in seconds, out of repeat runs, that number calls of func take, divided by number. Garbage
+    collection is disabled while func is timed unless gc_enabled.
+    """
+    timer = Timer(func, setup='import gc; gc.enable()' if gc_enabled else 'pass')
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def time_matches(k, values, repeat=5):
+    """
+    Returns the best time in seconds, out of repeat runs, that k takes to match every value.
+    """
+    match = k.match
+    return best_time(lambda: [match(value) for value in values], repeat=repeat)
@@ -0,0 +1,104 @@
+from collections import namedtuple, OrderedDict
+from threading import Lock
+
+from .kmatch import K
+
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+def _freeze(p):
+    """
+    Returns a hashable form of a pattern or filter value. Lists and tuples are flattened into one tuple of their type
+    and length followed by their items. Every value is tagged with its type so that, for example, the filter values
+    [1] and (1,) do not share an entry.
+    """
+    frozen = []
+    stack = [p]
+    while stack:
+        p = stack.pop()
+        if isinstance(p, (list, tuple)):
+            frozen.append((type(p), len(p)))
+            stack.extend(reversed(p))
+        elif isinstance(p, dict):
+            frozen.append((type(p), frozenset((_freeze(key), _freeze(item)) for key, item in p.items())))
+        elif isinstance(p, (set, frozenset)):
+            frozen.append((type(p), frozenset(_freeze(item) for item in p)))
+        else:
+            hash(p)
+            frozen.append((type(p), p))
+    return tuple(frozen)
+
+
+class KCache(object):
+    """
+    A bounded cache of K objects keyed on their pattern and options, which evicts the least recently used K object
+    when it is full. The same K object is returned for equal patterns and options, so the K objects it returns should
+    not be modified.
+    """
+    def __init__(self, maxsize=1024):
+        """
+        :param maxsize: The maximum number of K objects kept in the cache
+        :type maxsize: int
+        """
+        self._maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, p, **kwargs):
+        """
+        Gets the K object for a pattern and options, constructing and caching it if it is not in the cache.
+
+        :param p: The kmatch pattern
+        :type p: list
+        :param kwargs: The options passed to :class:`K <kmatch.K>`
+        :rtype: :class:`K <kmatch.K>`
+        :raises: :class:`ValueError <exceptions.ValueError>` on an invalid pattern or regex
+        """
+        try:
+            cache_key = (_freeze(p), _freeze(sorted(kwargs.items())))
+        except TypeError:
+            # Patterns with unhashable filter values of unknown types are never cached
+            with self._lock:
+                self._misses += 1
+            return K(p, **kwargs)
+
+        with self._lock:
+            k = self._entries.get(cache_key)
+            if k is not None:
+                self._entries.move_to_end(cache_key)
+                self._hits += 1
+                return k
+            self._misses += 1
+
+        k = K(p, **kwargs)
+        with self._lock:
+            self._entries[cache_key] = k
+            if len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+        return k
+
+    def info(self):
+        """
+        Gets the cache statistics.
+
+        :rtype: CacheInfo
+        :returns: A named tuple of the hits, misses, maxsize and current size of the cache
+        """
+        with self._lock:
+            return CacheInfo(self._hits, self._misses, self._maxsize, len(self._entries))
+
+    def clear(self):
+        """
+        Removes every K object from the cache and resets its statistics.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._hits = 0
+            self._misses = 0
+
+
+# The cache used by K.cached
+default_cache = KCache()
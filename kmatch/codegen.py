@@ -0,0 +1,119 @@
+"""
+Generates the source of a Python function that matches a compiled pattern with inline comparisons and the native and
+and or operators, and compiles it with exec.
+"""
+from math import isfinite
+
+from .kmatch import _membership_filter, _path_getter, _regex_filter
+
+
+# The value filters that are written as comparisons
+_COMPARISONS = {'==': '==', '!=': '!=', '<': '<', '>': '>', '<=': '<=', '>=': '>='}
+# The prefixes of the names of the callables that match fields for the other value filters
+_FIELD_FILTER_PREFIXES = {'=~': 'regex', 'in': 'in', '!in': 'not_in'}
+# Values of these types are written as literals, since their reprs evaluate back to equal values of the same type
+_LITERAL_TYPES = (str, bytes, int, bool, type(None))
+
+
+def build_source_matcher(k, p):
+    """
+    Generates and compiles the source of a function that matches the compiled pattern (p) of a K object exactly as
+    the tree of callables built by the K object does, short-circuiting & and | and raising or suppressing the same
+    exceptions. Filters are inlined as expressions on the value, except when errors are suppressed, where each filter
+    gets its own function with a try statement.
+
+    :returns: The tuple of the source and the compiled match function
+    """
+    generator = _SourceGenerator(k)
+    body = generator.expression(p, '    ')
+    if k._is_operator(p) and p[0] in '&|':
+        body = 'True if {0} else False'.format(body)
+    source = ''.join(generator.functions) + 'def match(value):\n    return {0}\n'.format(body)
+    namespace = generator.namespace
+    exec(compile(source, '<kmatch>', 'exec'), namespace)
+    return source, namespace['match']
+
+
+class _SourceGenerator(object):
+    """
+    Writes the expressions of operators and filters. Filter values and callables that can not be written as literals
+    are added to the namespace the source is executed in.
+    """
+    def __init__(self, k):
+        self._k = k
+        self.namespace = {}
+        self.functions = []
+        if k._suppress_exceptions:
+            self._suppressed_errors = '(KeyError, TypeError)'
+        elif k._suppress_key_errors:
+            self._suppressed_errors = 'KeyError'
+        else:
+            self._suppressed_errors = None
+
+    def _name(self, prefix, item):
+        name = '_{0}{1}'.format(prefix, len(self.namespace))
+        self.namespace[name] = item
+        return name
+
+    def _literal(self, item):
+        if type(item) in _LITERAL_TYPES or (type(item) is float and isfinite(item)):
+            return repr(item)
+        return self._name('value', item)
+
+    def expression(self, p, indent):
+        """
+        Returns the expression of the compiled pattern (p), continuing lines that are nested in operators at indent.
+        """
+        if not self._k._is_operator(p):
+            return self._filter_expression(p)
+        elif p[0] == '!':
+            return 'not {0}'.format(self.expression(p[1], indent))
+        elif p[0] == '^':
+            # ^ combines its operands' results as the tree of callables does, where & and | return True or False
+            left, right = [
+                ('(True if {0} else False)' if operand[0] in '&|' else '({0})').format(self.expression(operand, indent))
+                for operand in p[1]
+            ]
+            return '({0} ^ {1})'.format(left, right)
+
+        operands_or_filters = p[1] if p[0] == '&' else self._k._merge_filters(p[1])
+        if not operands_or_filters:
+            return 'True' if p[0] == '&' else 'False'
+        operand_indent = indent + '    '
+        separator = '\n{0}{1} '.format(operand_indent, 'and' if p[0] == '&' else 'or')
+        return '(\n{0}{1}\n{2})'.format(
+            operand_indent,
+            separator.join(self.expression(operator_or_filter, operand_indent)
+                           for operator_or_filter in operands_or_filters),
+            indent)
+
+    def _filter_expression(self, p):
+        """
+        Returns the expression of a filter, which calls a function that suppresses its errors if any are suppressed.
+        """
+        key_path = self._k._key_path(p[1])
+        get_field = _path_getter(p[1], key_path) if key_path is not None else None
+        if self._k._is_value_filter(p):
+            field = 'value[{0}]'.format(self._literal(p[1])) if get_field is None else '{0}(value)'.format(
+                self._name('get', get_field))
+
+        if p[0] in _COMPARISONS:
+            expression = '{0} {1} {2}'.format(field, _COMPARISONS[p[0]], self._literal(p[2]))
+        elif p[0] in ('=~', 'in', '!in'):
+            if p[0] == '=~':
+                field_filter = _regex_filter(p[2] if isinstance(p[2], tuple) else (p[2],))
+            else:
+                field_filter = _membership_filter(p[2], p[0] == '!in')
+            expression = '{0}({1})'.format(self._name(_FIELD_FILTER_PREFIXES[p[0]], field_filter), field)
+        elif get_field is not None:
+            expression = '{0}(value)'.format(self._name('has', self._k._build_key_filter_matcher(p, get_field)))
+        else:
+            expression = '{0} {1} value'.format(self._literal(p[1]), 'in' if p[0] == '?' else 'not in')
+
+        if self._suppressed_errors is None:
+            return expression
+        name = '_filter{0}'.format(len(self.functions))
+        self.functions.append(
+            'def {0}(value):\n    try:\n        return {1}\n    except {2}:\n        return False\n\n\n'.format(
+                name, expression, self._suppressed_errors))
+        return '{0}(value)'.format(name)
@@ -0,0 +1,198 @@
+"""
+Evaluates kmatch patterns over column-oriented data with NumPy. NumPy is an optional dependency of kmatch and is only
+needed when this module is used.
+"""
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+def _to_array(column):
+    """
+    Converts a column to a NumPy array. Arrays (including masked arrays) are used as they are, while any other
+    sequence becomes an object array so its values compare exactly as they would in K.match.
+    """
+    if isinstance(column, np.ndarray):
+        return column
+    array = np.empty(len(column), dtype=object)
+    array[:] = list(column)
+    return array
+
+
+def _to_columns(data):
+    """
+    Converts a dictionary of sequences or a structured (record) array to a dictionary of column arrays and returns it
+    along with the number of rows.
+    """
+    if isinstance(data, np.ndarray):
+        columns = dict((name, data[name]) for name in data.dtype.names or ())
+        return columns, len(data)
+
+    columns = dict((key, _to_array(column)) for key, column in data.items())
+    lengths = set(len(column) for column in columns.values())
+    if len(lengths) > 1:
+        raise ValueError('All columns must have the same length, got lengths {0}'.format(sorted(lengths)))
+    return columns, lengths.pop() if lengths else 0
+
+
+class ColumnarMatcher(object):
+    """
+    Evaluates the compiled pattern of a K object over columns, producing one boolean mask per batch. A row is taken to
+    have a key when the key's column exists and the row's value in it is not masked.
+
+    The & and | operators only evaluate their later operands on the rows that are still undecided, so the masks and
+    any exceptions raised agree row for row with calling K.match on each row.
+    """
+    _VECTORIZED_FILTERS = ('==', '!=', '<', '>', '<=', '>=')
+
+    def __init__(self, k):
+        if np is None:  # pragma: no cover
+            raise ImportError('NumPy is required to match columns')
+        self._k = k
+        if k._suppress_exceptions:
+            self._suppressed_errors = (KeyError, TypeError)
+        elif k._suppress_key_errors:
+            self._suppressed_errors = (KeyError,)
+        else:
+            self._suppressed_errors = ()
+
+    def match(self, data):
+        """
+        Matches every row of the columns to the pattern.
+
+        :param data: The columns to be matched
+        :type data: dict of sequences or a structured NumPy array
+        :rtype: numpy.ndarray of bool
+        :returns: A mask that is True for each row that matches the pattern and False otherwise
+        :raises: :class:`KeyError <exceptions.KeyError>` if key from pattern is missing for a row that is evaluated
+                and key errors are not suppressed
+        """
+        columns, num_rows = _to_columns(data)
+        return self._match(self._k._compiled_pattern, columns, np.arange(num_rows))
+
+    def _match(self, p, columns, rows):
+        """
+        Returns the mask of the pattern (p) for the given row indexes. Each operator is evaluated by a generator that
+        asks for the masks of its operands, and the generators are kept on a stack.
+        """
+        operators = []
+        while True:
+            if self._k._is_operator(p):
+                operators.append(self._match_operator(p, rows))
+                mask = None
+            elif self._k._is_value_filter(p):
+                mask = self._match_value_filter(p, columns, rows)
+            else:
+                present = self._present(p[1], columns, rows)
+                mask = present if p[0] == '?' else ~present
+
+            # Send the mask to the operator that asked for it, until an operator asks for the mask of an operand
+            while operators:
+                try:
+                    p, rows = operators[-1].send(mask)
+                    break
+                except StopIteration as stop:
+                    operators.pop()
+                    mask = stop.value
+            else:
+                return mask
+
+    def _match_operator(self, p, rows):
+        """
+        Combines the masks of the operands of an operator with boolean mask algebra. This is a generator that yields
+        each operand with the row indexes to match it on, and is sent the operand's mask.
+        """
+        if p[0] == '!':
+            return ~(yield p[1], rows)
+        elif p[0] == '^':
+            left = yield p[1][0], rows
+            return left ^ (yield p[1][1], rows)
+
+        # Only the rows that are still undecided are passed on to each operand
+        decisive_result = p[0] == '|'
+        result = np.full(len(rows), decisive_result)
+        undecided = np.arange(len(rows))
+        for operator_or_filter in p[1]:
+            if not len(undecided):
+                break
+            operand_result = yield operator_or_filter, rows[undecided]
+            undecided = undecided[operand_result != decisive_result]
+        result[undecided] = not decisive_result
+        return result
+
+    def _present(self, key, columns, rows):
+        """
+        Returns a mask that is True for each of the rows that has the key.
+        """
+        if key not in columns:
+            return np.zeros(len(rows), dtype=bool)
+        return ~np.ma.getmaskarray(columns[key][rows])
+
+    def _match_value_filter(self, p, columns, rows):
+        """
+        Returns the mask of a value filter, treating rows without the key as they are treated by K.match.
+        """
+        result = np.zeros(len(rows), dtype=bool)
+        present = self._present(p[1], columns, rows)
+        if not present.all():
+            if KeyError not in self._suppressed_errors:
+                raise KeyError(p[1])
+            if not present.any():
+                return result
+        values = np.ma.getdata(columns[p[1]][rows][present])
+        result[present] = self._compare(p[0], values, p[2])
+        return result
+
+    def _compare(self, filter_name, values, filter_value):
+        """
+        Applies a value filter to an array of values, falling back to applying it one value at a time when it can not
+        be vectorized.
+        """
+        if filter_name in ('in', '!in') and self._is_vectorized_membership(values, filter_value):
+            result = np.isin(values, list(filter_value.filter_values))
+            return result if filter_name == 'in' else ~result
+        elif filter_name in self._VECTORIZED_FILTERS and not isinstance(filter_value, (list, tuple, np.ndarray)):
+            try:
+                result = self._k._VALUE_FILTER_MAP[filter_name](values, filter_value)
+            except TypeError:
+                pass
+            else:
+                if isinstance(result, np.ndarray) and result.shape == values.shape:
+                    return result.astype(bool)
+        return np.fromiter(
+            (self._compare_one(filter_name, value, filter_value) for value in values), dtype=bool, count=len(values))
+
+    def _is_vectorized_membership(self, values, filter_value_set):
+        """
+        Returns whether an in filter can be applied to the values with numpy.isin, which is when the values and filter
+        values are all numbers or all strings.
+        """
+        if values.dtype.kind in 'iuf':
+            return all(isinstance(item, (int, float)) for item in filter_value_set.filter_values)
+        elif values.dtype.kind == 'U':
+            return all(isinstance(item, str) for item in filter_value_set.filter_values)
+        return False
+
+    def _compare_one(self, filter_name, value, filter_value):
+        """
+        Applies a value filter to a single value, suppressing the same exceptions as K.match.
+        """
+        try:
+            return bool(self._k._VALUE_FILTER_MAP[filter_name](value, filter_value))
+        except self._suppressed_errors:
+            return False
+
+
+def match_columns(k, data):
+    """
+    Matches every row of column-oriented data to the pattern of a K object.
+
+    :param k: The K object whose pattern is matched
+    :type k: :class:`K <kmatch.K>`
+    :param data: The columns to be matched
+    :type data: dict of sequences or a structured NumPy array
+    :rtype: numpy.ndarray of bool
+    :returns: A mask that is True for each row that matches the pattern and False otherwise
+    """
+    return ColumnarMatcher(k).match(data)
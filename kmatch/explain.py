@@ -0,0 +1,100 @@
+"""
+Explains the result of matching a value to a pattern with the filters that decided it.
+"""
+from collections import namedtuple
+
+from .kmatch import _path_getter
+
+
+class FilterTrace(namedtuple('FilterTrace', ['path', 'pattern', 'result', 'error'])):
+    """
+    The result of one filter that decided a match. The path is the tuple of operand indexes leading to the filter from
+    the root of the pattern, as in profiles, and the error is the exception the filter suppressed, or None.
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        text = '{0!r} at {1!r} is {2}'.format(self.pattern, self.path, self.result)
+        if self.error is not None:
+            text += ' (suppressed {0!r})'.format(self.error)
+        return text
+
+
+class Explanation(namedtuple('Explanation', ['result', 'filters'])):
+    """
+    The result of a match and the traces of the filters that decided it.
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        return '\n'.join(str(filter_trace) for filter_trace in self.filters)
+
+
+def explain(k, value):
+    """
+    Matches the value to the compiled pattern of a K object and returns the Explanation of the result. The pattern is
+    walked with an explicit stack of the operators leading to the operator or filter being explained. Each item of the
+    stack is an operator or filter, its index among its operator's operands and the explanations of its operands
+    evaluated so far, so the path of a filter is only built when it is traced.
+    """
+    suppressed_errors = k._suppressed_errors()
+    stack = [(k._compiled_pattern, None, [])]
+    returned = None
+    while True:
+        p, i, operand_explanations = stack[-1]
+        if returned is not None:
+            operand_explanations.append(returned)
+        if not k._is_operator(p):
+            path = tuple(item[1] for item in stack[1:])
+            returned = _explain_filter(k, p, path, value, suppressed_errors)
+        else:
+            returned = _explain_operator(p, operand_explanations)
+            if returned is None:
+                i = len(operand_explanations)
+                stack.append((p[1] if p[0] == '!' else p[1][i], i, []))
+                continue
+        stack.pop()
+        if not stack:
+            return returned
+
+
+def _explain_operator(p, operand_explanations):
+    """
+    Returns the Explanation of an operator once the operands that decide it are explained, or None if the next
+    operand must be evaluated first.
+    """
+    if p[0] == '!':
+        if operand_explanations:
+            return Explanation(not operand_explanations[0].result, operand_explanations[0].filters)
+    elif p[0] == '^':
+        if len(operand_explanations) == 2:
+            left, right = operand_explanations
+            return Explanation(left.result is not right.result, left.filters + right.filters)
+    else:
+        decisive_result = p[0] == '|'
+        if operand_explanations and operand_explanations[-1].result is decisive_result:
+            return Explanation(decisive_result, operand_explanations[-1].filters)
+        elif len(operand_explanations) == len(p[1]):
+            return Explanation(not decisive_result, [
+                filter_trace for operand_explanation in operand_explanations
+                for filter_trace in operand_explanation.filters
+            ])
+    return None
+
+
+def _explain_filter(k, p, path, value, suppressed_errors):
+    """
+    Returns the Explanation of a filter, which is matched without suppressing errors so the suppressed error can be
+    recorded.
+    """
+    key_path = k._key_path(p[1])
+    get_field = _path_getter(p[1], key_path) if key_path is not None else None
+    if k._is_value_filter(p):
+        matcher = k._build_value_filter_matcher(p, get_field)
+    else:
+        matcher = k._build_key_filter_matcher(p, get_field)
+    try:
+        result, error = bool(matcher(value)), None
+    except suppressed_errors as suppressed_error:
+        result, error = False, suppressed_error
+    return Explanation(result, [FilterTrace(path, k._decompile(p), result, error)])
@@ -0,0 +1,156 @@
+from collections import defaultdict
+
+from .kmatch import _path_getter
+
+
+class KRecordMatcher(object):
+    """
+    Matches one record, a dictionary that is updated a few keys at a time, against K objects and keeps the result of
+    every operator and filter of their patterns. After the record is updated, only the results that depend on the
+    changed keys are forgotten and evaluated again, so the cost of an update depends on the parts of the patterns that
+    use the changed keys rather than on the size of the patterns.
+
+    Filters depend on the key of the record that their field is looked up in, which is the first segment of the path
+    of a nested key, and operators depend on the keys of their operands. A change anywhere inside the value of a key,
+    such as to record['user']['name'], is a change of that key ('user'). Patterns are evaluated in order, stopping at
+    the first operand of each & and | that decides its result as match does, and operands that were skipped are only
+    evaluated once they are needed.
+    """
+    def __init__(self, patterns, record):
+        """
+        Builds the nodes of the patterns and matches the record against them.
+
+        :param patterns: The K objects to match the record against
+        :type patterns: iterable of :class:`K <kmatch.K>`
+        :param record: The record, which is updated in place between calls to update
+        :type record: dict
+        :raises: :class:`KeyError <exceptions.KeyError>` if key from pattern does not exist in the record and the
+                suppress_key_errors option of the K object is False
+        """
+        self._patterns = []
+        self._record = record
+        # Each node is an operator with the ids of its operand nodes, or a filter (None) with its callable. The result
+        # of a node is None until it is evaluated.
+        self._operators = []
+        self._operand_ids = []
+        self._matchers = []
+        self._results = []
+        self._node_ids_by_key = defaultdict(list)
+        self._root_ids = []
+        for k in patterns:
+            self._patterns.append(k)
+            self._root_ids.append(self._add_nodes(k))
+        self.update(())
+
+    def __len__(self):
+        return len(self._patterns)
+
+    @property
+    def record(self):
+        """
+        Gets the record being matched.
+
+        :rtype: dict
+        """
+        return self._record
+
+    def _add_nodes(self, k):
+        """
+        Adds a node for every operator and filter of the pattern of a K object and returns the id of its root.
+        """
+        def add_filter(p):
+            key_path = k._key_path(p[1])
+            get_field = _path_getter(p[1], key_path) if key_path is not None else None
+            keys = frozenset([p[1] if key_path is None else key_path[0]])
+            return self._add_node(None, (), k._build_filter_matcher(p, get_field), keys), keys
+
+        def add_operator(p, operands):
+            keys = frozenset().union(*[keys for node_id, keys in operands])
+            return self._add_node(p[0], [node_id for node_id, keys in operands], None, keys), keys
+
+        return k._fold(k._compiled_pattern, add_filter, add_operator)[0]
+
+    def _add_node(self, operator, operand_ids, matcher, keys):
+        node_id = len(self._operators)
+        self._operators.append(operator)
+        self._operand_ids.append(operand_ids)
+        self._matchers.append(matcher)
+        self._results.append(None)
+        for key in keys:
+            self._node_ids_by_key[key].append(node_id)
+        return node_id
+
+    def update(self, changed_keys=None):
+        """
+        Matches the record again after the values of changed_keys were set, changed or deleted. Only the operators
+        and filters that depend on those keys are evaluated again.
+
+        :param changed_keys: The keys of the record that changed, or None to evaluate everything again
+        :type changed_keys: iterable
+        :rtype: list of :class:`K <kmatch.K>`
+        :returns: The K objects that match the record, in the order they were given
+        :raises: :class:`KeyError <exceptions.KeyError>` if key from pattern does not exist in the record and the
+                suppress_key_errors option of the K object is False
+        """
+        results = self._results
+        if changed_keys is None:
+            results[:] = [None] * len(results)
+        else:
+            node_ids_by_key = self._node_ids_by_key
+            for key in changed_keys:
+                for node_id in node_ids_by_key.get(key, ()):
+                    results[node_id] = None
+        for root_id in self._root_ids:
+            if results[root_id] is None:
+                self._evaluate(root_id)
+        return self.matches()
+
+    def matches(self):
+        """
+        Gets the K objects that matched the record when it was last matched, without matching it again.
+
+        :rtype: list of :class:`K <kmatch.K>`
+        """
+        results = self._results
+        return [k for k, root_id in zip(self._patterns, self._root_ids) if results[root_id]]
+
+    def _evaluate(self, node_id):
+        """
+        Evaluates a node whose result is not known, evaluating its operands that are needed and not known first from
+        an explicit stack of nodes.
+        """
+        results = self._results
+        stack = [node_id]
+        while stack:
+            node_id = stack[-1]
+            if self._operators[node_id] is None:
+                results[node_id] = bool(self._matchers[node_id](self._record))
+                stack.pop()
+            else:
+                operand_id = self._decide(node_id)
+                if operand_id is None:
+                    stack.pop()
+                else:
+                    stack.append(operand_id)
+
+    def _decide(self, node_id):
+        """
+        Sets the result of an operator from the known results of its operands, stopping at the first operand of an &
+        or | that decides it. Returns the id of the first operand that is needed and not known instead, if any.
+        """
+        operator, operand_ids, results = self._operators[node_id], self._operand_ids[node_id], self._results
+        for operand_id in operand_ids:
+            result = results[operand_id]
+            if result is None:
+                return operand_id
+            elif (operator == '&' and not result) or (operator == '|' and result):
+                results[node_id] = result
+                return None
+
+        if operator == '!':
+            results[node_id] = not results[operand_ids[0]]
+        elif operator == '^':
+            results[node_id] = results[operand_ids[0]] is not results[operand_ids[1]]
+        else:
+            results[node_id] = operator == '&'
+        return None
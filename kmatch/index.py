@@ -0,0 +1,222 @@
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+
+def _shared_keys(index, value):
+    """
+    Returns the keys of the value that are in the index, looping over whichever of the two is smaller.
+    """
+    if len(value) < len(index):
+        return [key for key in value if key in index]
+    return [key for key in index if key in value]
+
+
+def _range_group(value):
+    """
+    Returns the group of values that the value can be ordered against, or None if the index does not order it.
+    """
+    if isinstance(value, (int, float)):
+        # NaN can not be ordered against any number
+        return 'number' if value == value else None
+    elif isinstance(value, str):
+        return 'str'
+    return None
+
+
+class _SortedFilterValues(object):
+    """
+    The filter values of the range filters for one key and operator, kept sorted so the filters that can match a value
+    are found with a binary search.
+    """
+    def __init__(self):
+        self._entries = []
+        self._filter_values = None
+        self._pattern_ids = None
+
+    def add(self, filter_value, pattern_id):
+        self._entries.append((filter_value, pattern_id))
+        self._filter_values = None
+
+    def pattern_ids(self):
+        return [pattern_id for filter_value, pattern_id in self._entries]
+
+    def _sort(self):
+        self._entries.sort(key=lambda entry: entry[0])
+        self._filter_values = [filter_value for filter_value, pattern_id in self._entries]
+        self._pattern_ids = [pattern_id for filter_value, pattern_id in self._entries]
+
+    def matching_pattern_ids(self, filter_name, value):
+        """
+        Returns the pattern ids of the filters whose filter_name comparison of value to their filter value is True.
+        """
+        if self._filter_values is None:
+            self._sort()
+        if filter_name == '>':
+            return self._pattern_ids[:bisect_left(self._filter_values, value)]
+        elif filter_name == '>=':
+            return self._pattern_ids[:bisect_right(self._filter_values, value)]
+        elif filter_name == '<':
+            return self._pattern_ids[bisect_right(self._filter_values, value):]
+        else:
+            return self._pattern_ids[bisect_left(self._filter_values, value):]
+
+
+class KIndex(object):
+    """
+    Indexes many K objects so the ones that match a value can be found without matching the value against every one
+    of them.
+
+    Each pattern is indexed by filters that at least one of must be True for the pattern to match, such as an ==
+    filter of an & or one filter from every operand of an |. == and in filters are looked up in hash tables, <, <=, >
+    and >= filters with binary searches over their sorted filter values, and any other value or key filter by the
+    presence of its key. Filters on nested keys are not indexed. Patterns with no indexed filters, for example ones
+    made only of ! or ^ operators, are always matched.
+
+    Only the patterns found this way are matched against the value, so the result is exactly the patterns whose match
+    returns True as long as matching does not raise. A pattern that would raise for the value may be skipped instead:
+    one that would raise a KeyError because a key is missing, or a TypeError because a <, <=, > or >= filter compares
+    the field to a filter value it can't be ordered against, such as a string to a number. Index patterns with
+    suppress_exceptions when the same behavior as calling match is needed, or with suppress_key_errors when fields are
+    known to have the types of their filter values.
+    """
+    _RANGE_FILTERS = ('<', '<=', '>', '>=')
+    # How well each kind of indexed filter narrows down the patterns, from best to worst
+    _SELECTIVITY = {
+        '==': 0,
+        '<': 1,
+        '<=': 1,
+        '>': 1,
+        '>=': 1,
+        '?': 2,
+    }
+
+    def __init__(self, patterns=()):
+        """
+        Builds the index from the K objects.
+
+        :param patterns: The K objects to be indexed
+        :type patterns: iterable of :class:`K <kmatch.K>`
+        """
+        self._patterns = []
+        self._unindexed_ids = []
+        self._present_ids = defaultdict(list)
+        self._equal_ids = defaultdict(lambda: defaultdict(list))
+        self._range_values = defaultdict(lambda: defaultdict(_SortedFilterValues))
+        for k in patterns:
+            self.add(k)
+
+    def __len__(self):
+        return len(self._patterns)
+
+    def add(self, k):
+        """
+        Adds a K object to the index.
+
+        :param k: The K object to be indexed
+        :type k: :class:`K <kmatch.K>`
+        """
+        pattern_id = len(self._patterns)
+        self._patterns.append(k)
+        indexed_filters = self._indexed_filters(k, k._compiled_pattern)
+        if indexed_filters is None:
+            self._unindexed_ids.append(pattern_id)
+            return
+        for indexed_filter in indexed_filters:
+            if indexed_filter[0] == '?':
+                self._present_ids[indexed_filter[1]].append(pattern_id)
+            elif indexed_filter[0] == '==':
+                self._equal_ids[indexed_filter[1]][indexed_filter[2]].append(pattern_id)
+            else:
+                filter_name, key, filter_value = indexed_filter
+                self._range_values[key][filter_name, _range_group(filter_value)].add(filter_value, pattern_id)
+
+    def _indexed_filters(self, k, p):
+        """
+        Returns the filters of the compiled pattern (p) that at least one of must be True for it to match, or None if
+        there are none that can be indexed.
+        """
+        return k._fold(p, lambda p: self._filter_indexed_filters(k, p), self._operator_indexed_filters)
+
+    def _operator_indexed_filters(self, p, operand_filters):
+        """
+        Returns the indexed filters of an operator from the indexed filters of its operands.
+        """
+        if p[0] == '&':
+            return min((filters for filters in operand_filters if filters is not None), key=self._rank, default=None)
+        elif p[0] == '|':
+            if any(filters is None for filters in operand_filters):
+                return None
+            return [indexed_filter for filters in operand_filters for indexed_filter in filters]
+        return None
+
+    def _filter_indexed_filters(self, k, p):
+        """
+        Returns how a filter is indexed, or None if it can not be.
+        """
+        if k._key_path(p[1]) is not None:
+            return None
+        elif k._is_value_filter(p):
+            return self._indexed_value_filters(p)
+        elif p[0] == '?':
+            return [('?', p[1])]
+        return None
+
+    def _indexed_value_filters(self, p):
+        """
+        Returns how a value filter is indexed, which is by its key's presence when the filter values can not be
+        hashed or ordered. An in filter is indexed as an == filter for each of its filter values.
+        """
+        if p[0] == '==' or p[0] == 'in':
+            filter_values = p[2].filter_values if p[0] == 'in' else (p[2],)
+            try:
+                for filter_value in filter_values:
+                    hash(filter_value)
+            except TypeError:
+                return [('?', p[1])]
+            return [('==', p[1], filter_value) for filter_value in filter_values]
+        elif p[0] in self._RANGE_FILTERS and _range_group(p[2]) is not None:
+            return [(p[0], p[1], p[2])]
+        return [('?', p[1])]
+
+    def _rank(self, filters):
+        # An in filter without filter values never matches, so it has no indexed filters and ranks first
+        return (max((self._SELECTIVITY[indexed_filter[0]] for indexed_filter in filters), default=-1), len(filters))
+
+    def _candidate_ids(self, value):
+        """
+        Returns the ids of the patterns that might match the value.
+        """
+        candidate_ids = set(self._unindexed_ids)
+        for key in _shared_keys(self._present_ids, value):
+            candidate_ids.update(self._present_ids[key])
+        for key in _shared_keys(self._equal_ids, value):
+            pattern_ids_by_value = self._equal_ids[key]
+            try:
+                candidate_ids.update(pattern_ids_by_value.get(value[key], ()))
+            except TypeError:
+                # An unhashable value is compared against every == filter on the key
+                for pattern_ids in pattern_ids_by_value.values():
+                    candidate_ids.update(pattern_ids)
+        for key in _shared_keys(self._range_values, value):
+            value_group = _range_group(value[key])
+            for (filter_name, group), filter_values in self._range_values[key].items():
+                if value_group is None:
+                    candidate_ids.update(filter_values.pattern_ids())
+                elif value_group == group:
+                    candidate_ids.update(filter_values.matching_pattern_ids(filter_name, value[key]))
+        return candidate_ids
+
+    def match(self, value):
+        """
+        Finds the indexed K objects that match the value.
+
+        :param value: The value to be matched
+        :type value: dict
+        :rtype: list of :class:`K <kmatch.K>`
+        :returns: The K objects that match the value, in the order they were added to the index
+        """
+        patterns = self._patterns
+        return [
+            patterns[pattern_id] for pattern_id in sorted(self._candidate_ids(value))
+            if patterns[pattern_id].match(value)
+        ]
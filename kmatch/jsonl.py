@@ -0,0 +1,153 @@
+"""
+Filters JSON lines with kmatch patterns, writing the matching lines through unchanged. This module is also the command
+line interface run by ``python -m kmatch``.
+"""
+import argparse
+import json
+import sys
+
+from .kmatch import K
+
+
+def _literal(item):
+    """
+    Returns the bytes a JSON encoded string is expected to contain, or None if the string might be encoded with escapes.
+    """
+    if not isinstance(item, str) or '/' in item:
+        return None
+    encoded = json.dumps(item)
+    if encoded != '"{0}"'.format(item):
+        return None
+    return encoded.encode('utf-8')
+
+
+def _required_literals(k, p):
+    """
+    Returns a list of clauses for the compiled pattern (p), where each clause is a list of literals and a line that
+    does not contain any literal of a clause can not match. Literals are only required when K suppresses key errors,
+    since a line without a key would otherwise raise a KeyError instead of not matching.
+    """
+    return k._fold(p, lambda p: _filter_required_literals(k, p), _operator_required_literals)
+
+
+def _operator_required_literals(p, operand_clauses):
+    """
+    Returns the clauses of an operator from the clauses of its operands.
+    """
+    if p[0] == '&':
+        return [clause for clauses in operand_clauses for clause in clauses]
+    elif p[0] == '|':
+        if not all(operand_clauses):
+            return []
+        return [[literal for clauses in operand_clauses for literal in clauses[-1]]]
+    return []
+
+
+def _filter_required_literals(k, p):
+    """
+    Returns the clauses of a filter.
+    """
+    if p[0] == '!?' or not (k._suppress_key_errors or k._suppress_exceptions):
+        return []
+
+    clauses = []
+    key_literal = _literal(p[1]) if k._key_path(p[1]) is None else None
+    if key_literal is not None:
+        clauses.append([key_literal])
+    value_literals = _filter_value_literals(p)
+    if value_literals is not None:
+        clauses.append(value_literals)
+    return clauses
+
+
+def _filter_value_literals(p):
+    """
+    Returns the literals of the filter values of an == or in filter that one of must be in a matching line, or None.
+    """
+    if p[0] == '==':
+        literals = [_literal(p[2])]
+    elif p[0] == 'in':
+        literals = [_literal(filter_value) for filter_value in p[2].filter_values]
+    else:
+        return None
+    return literals if None not in literals else None
+
+
+def filter_jsonl(k, lines, prefilter=True):
+    """
+    Filters lines of JSON objects down to those that match the pattern of a K object.
+
+    With prefilter, lines that do not contain the JSON encoded keys or == and in string filter values the pattern
+    requires are skipped without being decoded. This assumes that the lines are JSON objects whose strings are not
+    encoded with unnecessary escapes, and is only done when the K object suppresses key errors.
+
+    :param k: The K object whose pattern is matched
+    :type k: :class:`K <kmatch.K>`
+    :param lines: The lines to be filtered
+    :type lines: iterable of bytes
+    :param prefilter: Skip lines that can not match without decoding them
+    :type prefilter: bool
+    :rtype: generator of bytes
+    :returns: A generator of the lines that match the pattern, unchanged. Blank lines are skipped.
+    :raises: :class:`ValueError <exceptions.ValueError>` on a line that is not valid JSON
+    """
+    clauses = _required_literals(k, k._compiled_pattern) if prefilter else []
+    match = k.match
+    for line in lines:
+        if all(any(literal in line for literal in clause) for clause in clauses) and line.strip():
+            if match(json.loads(line)):
+                yield line
+
+
+def filter_jsonl_file(k, infile, outfile, prefilter=True, chunk_size=1 << 20):
+    """
+    Writes the lines of JSON objects in a binary file that match the pattern of a K object to another binary file.
+    The input is read roughly chunk_size bytes at a time. Matching lines are written unchanged, except that a newline
+    is added to a last line without one, so the output of several files written one after another is JSON lines.
+
+    :param k: The K object whose pattern is matched
+    :type k: :class:`K <kmatch.K>`
+    :param infile: The binary file to read lines from
+    :param outfile: The binary file to write matching lines to
+    :param prefilter: Skip lines that can not match without decoding them, as in filter_jsonl
+    :type prefilter: bool
+    :param chunk_size: The approximate number of bytes read at a time
+    :type chunk_size: int
+    :rtype: int
+    :returns: The number of lines written
+    """
+    num_matches = 0
+    lines = infile.readlines(chunk_size)
+    while lines:
+        matches = list(filter_jsonl(k, lines, prefilter=prefilter))
+        outfile.writelines(match if match.endswith(b'\n') else match + b'\n' for match in matches)
+        num_matches += len(matches)
+        lines = infile.readlines(chunk_size)
+    return num_matches
+
+
+def main(args=None, stdin=None, stdout=None):
+    """
+    Filters JSON lines files, or standard input, to standard output.
+    """
+    parser = argparse.ArgumentParser(prog='python -m kmatch', description='Filter JSON lines with a kmatch pattern.')
+    parser.add_argument('pattern', help='the kmatch pattern as JSON')
+    parser.add_argument('files', nargs='*', default=['-'], help='the JSON lines files to filter, or - for stdin')
+    parser.add_argument('-k', '--suppress-key-errors', action='store_true', help='treat missing keys as no match')
+    parser.add_argument('-e', '--suppress-exceptions', action='store_true', help='treat any filter error as no match')
+    parser.add_argument('-n', '--nested-keys', action='store_true', help='treat dotted keys as nested paths')
+    parser.add_argument('--no-prefilter', action='store_true', help='decode every line before matching it')
+    args = parser.parse_intermixed_args(args)
+
+    stdin = stdin or sys.stdin.buffer
+    stdout = stdout or sys.stdout.buffer
+    k = K(
+        json.loads(args.pattern), suppress_key_errors=args.suppress_key_errors,
+        suppress_exceptions=args.suppress_exceptions, nested_keys=args.nested_keys)
+    for file_name in args.files:
+        if file_name == '-':
+            filter_jsonl_file(k, stdin, stdout, prefilter=not args.no_prefilter)
+        else:
+            with open(file_name, 'rb') as infile:
+                filter_jsonl_file(k, infile, stdout, prefilter=not args.no_prefilter)
+    stdout.flush()
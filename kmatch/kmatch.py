@@ -1,6 +1,320 @@
 from copy import deepcopy
-from operator import not_, lt, le, eq, ge, ne, gt, xor
+from functools import lru_cache
+from operator import itemgetter, not_, lt, le, eq, ge, ne, gt, xor
 import re
+from threading import Lock
+
+from .profiling import NodeProfile, profile_matcher
+
+
+def _step_getter(segment):
+    """
+    Returns a callable that steps from a container into one segment of a nested key path. Segments that are strings of
+    digits index into lists and tuples.
+    """
+    if isinstance(segment, str) and segment.isdigit():
+        index = int(segment)
+        return lambda container: container[index] if isinstance(container, (list, tuple)) else container[segment]
+    return itemgetter(segment)
+
+
+def _path_getter(key, path):
+    """
+    Returns a callable that looks up the nested key path in a value, raising a KeyError of the key when any segment of
+    the path is missing or is looked up in a value that is not a container.
+    """
+    step_getters = [_step_getter(segment) for segment in path]
+
+    def get_field(value):
+        try:
+            for step_getter in step_getters:
+                value = step_getter(value)
+        except (LookupError, TypeError):
+            raise KeyError(key)
+        return value
+    return get_field
+
+
+def _common_prefix(paths):
+    """
+    Returns the longest tuple that every path starts with.
+    """
+    prefix = paths[0]
+    for path in paths[1:]:
+        length = 0
+        while length < min(len(prefix), len(path)) and prefix[length] == path[length]:
+            length += 1
+        prefix = prefix[:length]
+    return prefix
+
+
+def _prefix_runs(parent_paths):
+    """
+    Splits the indexes of the parent paths into runs of consecutive parent paths that start with the same segment.
+    Indexes whose parent path is None or empty are in runs of their own.
+    """
+    runs = []
+    last_segment = None
+    for i, parent_path in enumerate(parent_paths):
+        segment = parent_path[:1] if parent_path else None
+        if segment is not None and segment == last_segment:
+            runs[-1].append(i)
+        else:
+            runs.append([i])
+        last_segment = segment
+    return runs
+
+
+# Characters with a special meaning in a regex outside of a character class
+_REGEX_SPECIAL_CHARS = frozenset('.^$*+?{}[]\\|()')
+# Constructs whose meaning depends on the rest of the regex, which can not be joined into an alternation
+_UNCOMBINABLE_REGEX = re.compile(r'\\\d|\(\?P=|\(\?\(|\(\?[aiLmsux-]')
+
+
+@lru_cache(maxsize=1024)
+def _compile_regex(regex):
+    """
+    Compiles the regex of a regex filter. Compiled regexes are shared by every K object.
+    """
+    return re.compile(regex, re.DOTALL)
+
+
+class _LazyRegex(object):
+    """
+    The regex of a regex filter, compiled the first time it is matched. An invalid regex raises a ValueError then.
+    """
+    def __init__(self, pattern):
+        self.pattern = pattern
+
+    def match(self, string):
+        try:
+            match = _compile_regex(self.pattern).match
+        except:  # Python doesn't document exactly what exceptions re.compile throws
+            raise ValueError('Bad regex - {0}'.format(self.pattern))
+        # Later matches call the match method of the compiled regex directly
+        self.match = match
+        return match(string)
+
+    def __eq__(self, other):
+        return isinstance(other, _LazyRegex) and self.pattern == other.pattern
+
+    def __hash__(self):
+        return hash(self.pattern)
+
+    def __reduce__(self):
+        return (_LazyRegex, (self.pattern,))
+
+
+def _unescape_regex(text):
+    """
+    Returns the literal text a regex without special characters matches, or None if the regex has special characters.
+    """
+    chars = []
+    escaped = False
+    for char in text:
+        if escaped:
+            if char.isalnum():
+                return None
+            chars.append(char)
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif char in _REGEX_SPECIAL_CHARS:
+            return None
+        else:
+            chars.append(char)
+    return None if escaped else ''.join(chars)
+
+
+def _regex_literal(source):
+    """
+    Returns how a regex filter with the regex source matches a literal text ('prefix', 'equal', 'suffix' or
+    'contains') and the literal text, or None if the regex does not only match a literal text.
+    """
+    if not isinstance(source, str):
+        return None
+    body = source[1:] if source.startswith('^') else source
+    anywhere = body.startswith('.*')
+    if anywhere:
+        body = body[3:] if body.startswith('.*?') else body[2:]
+
+    to_end = False
+    if body.endswith('.*?'):
+        body = body[:-3]
+    elif body.endswith('.*'):
+        body = body[:-2]
+    elif body.endswith('$') and (len(body) - len(body[:-1].rstrip('\\'))) % 2 == 1:
+        body, to_end = body[:-1], True
+
+    text = _unescape_regex(body)
+    if text is None:
+        return None
+    return ('suffix' if to_end else 'contains') if anywhere else ('equal' if to_end else 'prefix'), text
+
+
+def _combine_regexes(regexes):
+    """
+    Returns one compiled regex that matches where any of the regexes matches, or None if they can not be combined.
+    """
+    sources = [regex.pattern for regex in regexes]
+    if not all(isinstance(source, str) and not _UNCOMBINABLE_REGEX.search(source) for source in sources):
+        return None
+    try:
+        return _compile_regex('|'.join('(?:{0})'.format(source) for source in sources))
+    except re.error:
+        return None
+
+
+def _regex_test(regexes):
+    """
+    Returns a callable that tests whether a string matches any of the compiled regexes. Regexes that only match a
+    literal text are tested with string methods instead of the regex engine.
+    """
+    literals = [_regex_literal(regex.pattern) for regex in regexes]
+    kinds = set(literal[0] for literal in literals) if None not in literals else None
+    texts = tuple(literal[1] for literal in literals) if kinds else None
+    if kinds == {'prefix'}:
+        return lambda match_str: match_str.startswith(texts)
+    elif kinds == {'equal'}:
+        return frozenset(texts + tuple(text + '\n' for text in texts)).__contains__
+    elif kinds == {'suffix'}:
+        suffixes = texts + tuple(text + '\n' for text in texts)
+        return lambda match_str: match_str.endswith(suffixes)
+    elif kinds == {'contains'}:
+        return lambda match_str: any(text in match_str for text in texts)
+
+    regex = regexes[0] if len(regexes) == 1 else _combine_regexes(regexes)
+    if regex is not None:
+        return lambda match_str: regex.match(match_str) is not None
+    return lambda match_str: any(regex.match(match_str) for regex in regexes)
+
+
+def _regex_filter(regexes):
+    """
+    Returns the callable for a regex filter that matches a field value against any of the compiled regexes. Values
+    that are not strings are matched by the regexes themselves, so they raise the same errors.
+    """
+    test = _regex_test(regexes)
+
+    def regex_filter(match_str):
+        if isinstance(match_str, str):
+            return test(match_str)
+        elif match_str is None:
+            return False
+        return any(regex.match(match_str) for regex in regexes)
+    return regex_filter
+
+
+class _FilterValueSet(object):
+    """
+    The compiled filter values of an in or !in filter. Hashable filter values are looked up in a frozenset, and the
+    rest, as well as fields that can't be hashed, are compared one by one like the in operator of a list.
+    """
+    def __init__(self, filter_values):
+        self.filter_values = tuple(filter_values)
+        hashed_values, unhashed_values = [], []
+        for filter_value in self.filter_values:
+            try:
+                hash(filter_value)
+            except TypeError:
+                unhashed_values.append(filter_value)
+            else:
+                hashed_values.append(filter_value)
+        self._hashed_values = frozenset(hashed_values)
+        self._unhashed_values = tuple(unhashed_values)
+
+    def __contains__(self, field):
+        try:
+            if field in self._hashed_values:
+                return True
+        except TypeError:
+            return field in self.filter_values
+        return field in self._unhashed_values
+
+    def __eq__(self, other):
+        return isinstance(other, _FilterValueSet) and self.filter_values == other.filter_values
+
+    def __hash__(self):
+        return hash(self.filter_values)
+
+
+class _ListKey(tuple):
+    """
+    A key given as a list, frozen so later changes to the caller's list can't affect matching. It can't be hashed, so
+    like the list it is only looked up as a path of nested keys.
+    """
+    __hash__ = None
+
+
+def _membership_filter(filter_value_set, negate):
+    """
+    Returns the callable for an in filter, or a !in filter if negate, on a _FilterValueSet.
+    """
+    if filter_value_set._unhashed_values:
+        return lambda field: (field in filter_value_set) is not negate
+    hashed_values, filter_values = filter_value_set._hashed_values, filter_value_set.filter_values
+
+    def membership_filter(field):
+        try:
+            return (field in hashed_values) is not negate
+        except TypeError:
+            return (field in filter_values) is not negate
+    return membership_filter
+
+
+class _AdaptiveJunction(object):
+    """
+    An & or | operator that learns the order in which to evaluate its operands. For the first sample_size calls it
+    records how often each operand decides the result, then settles on evaluating the operands that decide the result
+    most often per unit of cost first. The count of remaining samples is only changed under a lock, so a junction
+    shared between threads reorders exactly once and then stops sampling.
+    """
+    def __init__(self, operands, costs, decisive_result, sample_size):
+        self._operands = operands
+        self._costs = costs
+        self._decisive_result = decisive_result
+        self._remaining_samples = sample_size
+        self._evaluated_counts = [0] * len(operands)
+        self._decided_counts = [0] * len(operands)
+        self._lock = Lock()
+
+    def __call__(self, value):
+        if self._remaining_samples > 0:
+            return self._sample(value)
+        decisive_result = self._decisive_result
+        for operand in self._operands:
+            if bool(operand(value)) is decisive_result:
+                return decisive_result
+        return not decisive_result
+
+    def _sample(self, value):
+        """
+        Evaluates the operands in their current order while recording how often each one decides the result.
+        """
+        result = not self._decisive_result
+        for i, operand in enumerate(self._operands):
+            self._evaluated_counts[i] += 1
+            if bool(operand(value)) is self._decisive_result:
+                self._decided_counts[i] += 1
+                result = self._decisive_result
+                break
+        with self._lock:
+            self._remaining_samples -= 1
+            if self._remaining_samples == 0:
+                self._reorder()
+        return result
+
+    def _reorder(self):
+        """
+        Sorts the operands by their cost divided by the (smoothed) observed probability of deciding the result.
+        """
+        ranks = [
+            cost * (evaluated + 2) / (decided + 1)
+            for cost, evaluated, decided in zip(self._costs, self._evaluated_counts, self._decided_counts)
+        ]
+        order = sorted(range(len(self._operands)), key=ranks.__getitem__)
+        self._operands = [self._operands[i] for i in order]
+        self._costs = [self._costs[i] for i in order]
 
 
 class K(object):
@@ -21,45 +335,228 @@ class K(object):
         '>': gt,
         '<=': le,
         '>=': ge,
-        '=~': lambda match_str, regex: regex.match(match_str) if match_str is not None else False,
+        '=~': lambda match_str, regex: regex.match(match_str) is not None if match_str is not None else False,
+        'in': lambda field, filter_values: field in filter_values,
+        '!in': lambda field, filter_values: field not in filter_values,
     }
     _KEY_FILTER_MAP = {
         '?': lambda key, value: key in value,
         '!?': lambda key, value: key not in value,
     }
+    # Relative evaluation costs of the filters, used to order operands when reorder_filters is enabled
+    _FILTER_COSTS = {
+        '?': 1,
+        '!?': 1,
+        '==': 2,
+        '!=': 2,
+        '<': 2,
+        '>': 2,
+        '<=': 2,
+        '>=': 2,
+        '=~': 8,
+        'in': 2,
+        '!in': 2,
+    }
+    # Filter values of these types are shared with the pattern instead of being copied
+    _IMMUTABLE_FILTER_VALUE_TYPES = (str, bytes, int, float, complex, bool, type(None))
+    # Filter values of these types are equal exactly when their hashes are, so == filters on them can be merged into
+    # an in filter
+    _SET_FILTER_VALUE_TYPES = (str, bytes, int, float, bool, type(None))
+    # Patterns with more nested operators than this are lowered into a flat branch program evaluated in a loop,
+    # instead of a tree of callables evaluated by nested calls
+    _MAX_TREE_DEPTH = 8
+    # The number of matches an operator observes before settling on an operand order when reorder_filters is enabled
+    _REORDER_SAMPLE_SIZE = 1000
 
-    def __init__(self, p, suppress_key_errors=False, suppress_exceptions=False):
+    def __init__(self, p, suppress_key_errors=False, suppress_exceptions=False, reorder_filters=False,
+                 nested_keys=False, profile=False, optimize=False, codegen=False, lazy=False, validate_regexes=False):
         """
         Sets the pattern, performs validation on the pattern, and compiles its regexs if it has any.
 
-        :param p: The kmatch pattern
-        :type p: list
+        The & and | operators stop evaluating their operands as soon as the result is known. With reorder_filters,
+        their operands are first sorted so cheap key filters run before comparisons and regexs run last, and each
+        operator then re-sorts its operands by how often they decided the result over its first matches. Reordering
+        never changes the result of a match, but when exceptions are not suppressed it can change whether a match
+        raises, since an operand that would raise may no longer be reached (or may now be reached). Reordering helps
+        when the operands that usually decide the result come late in the pattern or after more expensive ones. When
+        the pattern is already in a good order, the cost of sampling makes matching slightly slower.
+
+        With nested_keys, keys that are tuples or lists, or strings containing dots, are paths into nested values. For
+        example 'user.address.zip' and ('user', 'address', 'zip') both look up value['user']['address']['zip'].
+        Segments of dotted strings that are digits index into lists. A segment that is missing anywhere on the path, or
+        that is looked up in a value that is not a container, is treated like a missing key. Consecutive filters of an
+        & or | whose paths share a prefix, such as 'a.b.c' and 'a.b.d.e', look the prefix up once.
+
+        With optimize, the pattern is simplified before it is lowered. Nested operators of the same kind are
+        flattened, duplicated operands are removed, comparisons on the same key are merged into a single range, parts
+        of the pattern that always or never match are folded away and ! is moved through operators with De Morgan's
+        laws so double negations cancel. The pattern property then returns the optimized pattern. Like
+        reorder_filters, optimizing never changes the result of a match, but can change whether a match raises when
+        exceptions are not suppressed.
+
+        With codegen, the pattern is matched by a Python function generated for it, with filters written as inline
+        expressions such as value['f'] == 1 joined with and and or, which can be read from the source property. When
+        errors are suppressed, each filter is instead a generated function with a try statement. Patterns that are
+        nested too deeply for the generated expression, profiled or reordered are matched as they are without codegen.
+
+        With lazy, work is put off until it is needed, which makes constructing large patterns whose branches are
+        rarely evaluated faster. Regexes are compiled the first time they are matched, the pattern is lowered on the
+        first match and each operand of & and | that is an operator or a regex filter is lowered the first time it is
+        evaluated. Invalid regexes then raise a ValueError when they are first matched instead of at construction,
+        unless validate_regexes, which compiles every regex at construction into the cache shared by every K object.
+        Patterns that are profiled or reordered are lowered whole on the first match.
+
+        Patterns can be nested to any depth: they are compiled, matched, explained, optimized, cached, indexed,
+        pickled and serialized without recursion. Patterns nested more than a few operators deep are matched by a
+        flat branch program, where each filter continues at the next filter to evaluate, instead of by nested calls.
+        Patterns that are profiled or reordered are always matched by nested calls, so their depth is limited by the
+        recursion limit.
+
+        With profile, every operator and filter records how often it is evaluated, how often it returns True, how many
+        exceptions it suppresses and the time spent evaluating it, which can be read from the profile attribute or
+        with profile_tree. Each node is then evaluated on its own, without the lookups shared by filters on the same
+        field. Without profile, matching does no recording at all.
+
+        :param p: The kmatch pattern, or a K object whose validated and compiled pattern is shared
+        :type p: list or :class:`K <kmatch.K>`
         :param suppress_key_errors: Suppress KeyError exceptions on filters and return False instead
         :type suppress_key_errors: bool
         :param suppress_exceptions: Suppress all exceptions on filters and return False instead
         :type suppress_exceptions: bool
+        :param reorder_filters: Evaluate the operands of & and | in order of cost and observed selectivity
+        :type reorder_filters: bool
+        :param nested_keys: Treat tuple, list and dotted string keys as paths into nested values
+        :type nested_keys: bool
+        :param profile: Record statistics for every operator and filter of the pattern
+        :type profile: bool
+        :param optimize: Simplify the pattern before it is lowered
+        :type optimize: bool
+        :param codegen: Match the pattern with a generated Python function
+        :type codegen: bool
+        :param lazy: Compile regexes and lower the pattern and its branches when they are first evaluated
+        :type lazy: bool
+        :param validate_regexes: With lazy, still compile every regex at construction to validate it
+        :type validate_regexes: bool
         :raises: :class:`ValueError <exceptions.ValueError>` on an invalid pattern or regex
         """
-        self._raw_pattern = deepcopy(p)
-        self._compiled_pattern = deepcopy(p)
+        self._set_options(suppress_key_errors, suppress_exceptions, reorder_filters, nested_keys, profile, optimize,
+                          codegen, lazy, validate_regexes)
+
+        # Validate the pattern and build its immutable compiled form in one pass. Compiled patterns are never
+        # modified, so they can be shared between K objects.
+        if isinstance(p, K):
+            self._compiled_pattern = p._compiled_pattern
+        else:
+            self._compiled_pattern = self._compile(p)
+        if optimize:
+            from .optimizer import optimize_pattern
+            self._compiled_pattern = optimize_pattern(self, self._compiled_pattern)
+        if isinstance(p, K) and p._compiled_pattern is self._compiled_pattern:
+            self._initialize(p._field_key_usage, p._field_keys, lazy_matcher=lazy)
+        else:
+            self._initialize(lazy_matcher=lazy)
+
+    def _set_options(self, suppress_key_errors=False, suppress_exceptions=False, reorder_filters=False,
+                     nested_keys=False, profile=False, optimize=False, codegen=False, lazy=False,
+                     validate_regexes=False):
         self._suppress_key_errors = suppress_key_errors
         self._suppress_exceptions = suppress_exceptions
+        self._reorder_filters = reorder_filters
+        self._nested_keys = nested_keys
+        self._profiling = profile
+        self._optimize = optimize
+        self._codegen = codegen
+        self._lazy = lazy
+        self._validate_regexes = validate_regexes
 
-        # Validate the pattern is in the appropriate format
-        self._validate(self._compiled_pattern)
+    def _options(self):
+        """
+        Returns the options the K object was constructed with, as keyword arguments of the constructor.
+        """
+        return {
+            'suppress_key_errors': self._suppress_key_errors,
+            'suppress_exceptions': self._suppress_exceptions,
+            'reorder_filters': self._reorder_filters,
+            'nested_keys': self._nested_keys,
+            'profile': self._profiling,
+            'optimize': self._optimize,
+            'codegen': self._codegen,
+            'lazy': self._lazy,
+            'validate_regexes': self._validate_regexes,
+        }
 
-        # Compile any regexs in the pattern
-        self._compile(self._compiled_pattern)
+    def _initialize(self, field_key_usage=None, field_keys=None, lazy_matcher=False):
+        """
+        Sets up what is derived from the compiled pattern. The field key usage and field keys are computed unless they
+        are given, and the matcher is only built on the first match with lazy_matcher.
+        """
+        # The field keys are computed once, since they are often needed for every value being matched
+        if field_key_usage is None:
+            field_key_usage = dict(
+                (key, frozenset(filter_names)) for key, filter_names in self._walk_field_keys(self._compiled_pattern))
+        self._field_key_usage = field_key_usage
+        self._field_keys = frozenset(field_key_usage) if field_keys is None else field_keys
+
+        # Lower the compiled pattern into a tree of callables so that matching does no interpretation
+        if lazy_matcher:
+            self._profile = self._source = None
+            self._matcher = self._match_first
+        else:
+            self._rebuild_matcher()
+
+    def _match_first(self, value):
+        """
+        Stands in for the matcher of a K object whose matcher is built on the first match.
+        """
+        self._build_lazy_matcher()
+        return self._matcher(value)
+
+    def _build_lazy_matcher(self):
+        """
+        Builds the matcher if it is built on the first match and has not been yet.
+        """
+        if self._matcher == self._match_first:
+            self._rebuild_matcher()
+
+    def __getstate__(self):
+        # The callables built from the compiled pattern can't be pickled, so they are rebuilt when unpickling. The
+        # compiled pattern is pickled flattened, since pickle recurses into nested tuples.
+        state = self.__dict__.copy()
+        del state['_matcher']
+        del state['_profile']
+        del state['_source']
+        state['_compiled_pattern'] = self._flatten(self._compiled_pattern)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._compiled_pattern = self._unflatten(self._compiled_pattern)
+        self._rebuild_matcher()
+
+    @classmethod
+    def cached(cls, p, **kwargs):
+        """
+        Gets a K object for the pattern and options from a shared, bounded cache, constructing it only when it is not
+        already cached. The same K object is returned for equal patterns and options, so it should not be modified.
+
+        :param p: The kmatch pattern
+        :type p: list
+        :param kwargs: The options passed to the K constructor
+        :rtype: :class:`K <kmatch.K>`
+        :raises: :class:`ValueError <exceptions.ValueError>` on an invalid pattern or regex
+        """
+        from .cache import default_cache
+        return default_cache.get(p, **kwargs)
 
     @property
     def pattern(self):
         """
         Gets the kmatch pattern.
 
-        :returns: The kmatch pattern dictionary originally provided to the K object
+        :returns: A copy of the kmatch pattern originally provided to the K object, rebuilt from the compiled pattern
         :rtype: list
         """
-        return self._raw_pattern
+        return self._decompile(self._compiled_pattern)
 
     def _is_operator(self, p):
         return len(p) == 2 and p[0] in self._OPERATOR_MAP and isinstance(p[1], (list, tuple))
@@ -70,30 +567,119 @@ class K(object):
     def _is_key_filter(self, p):
         return len(p) == 2 and p[0] in self._KEY_FILTER_MAP
 
+    def _fold(self, p, fold_filter, fold_operator):
+        """
+        Folds the pattern or compiled pattern (p) from its filters up with an explicit stack instead of recursion, so
+        patterns can be nested to any depth. Each filter is folded with fold_filter(p) and each operator with
+        fold_operator(p, operands), where operands is the list of its folded operands. Operators are checked before
+        their operands and operands are folded in order, so errors are raised in the order of a recursive walk.
+        """
+        if not self._is_operator(p):
+            return fold_filter(p)
+        folded = []
+        stack = [(p, False)]
+        while stack:
+            p, operands_folded = stack.pop()
+            if operands_folded:
+                start = len(folded) - (1 if p[0] == '!' else len(p[1]))
+                operands = folded[start:]
+                del folded[start:]
+                folded.append(fold_operator(p, operands))
+            elif self._is_operator(p):
+                if p[0] == '^':
+                    self._validate_xor_args(p)
+                stack.append((p, True))
+                stack.extend((operand, False) for operand in reversed(p[1] if p[0] != '!' else [p[1]]))
+            else:
+                folded.append(fold_filter(p))
+        return folded[0]
+
     def _compile(self, p):
         """
-        Recursively compiles the regexs in the pattern (p).
+        Validates the pattern (p), ensuring it adheres to the proper key names and structure, and returns it as nested
+        tuples with its regexs compiled.
+        """
+        return self._fold(
+            p, self._compile_filter, lambda p, operands: (p[0], operands[0] if p[0] == '!' else tuple(operands)))
+
+    def _compile_filter(self, p):
+        self._validate_filter(p)
+        key = _ListKey(p[1]) if isinstance(p[1], list) else p[1]
+        if self._is_value_filter(p):
+            return (p[0], key, self._compile_filter_value(p[0], p[2]))
+        return (p[0], key)
+
+    def _compile_filter_value(self, filter_name, filter_value):
         """
-        if self._is_value_filter(p) and p[0] == '=~':
+        Compiles the regex of a regex filter. Other filter values are copied only when they could be mutated.
+        """
+        if filter_name == '=~':
+            if self._lazy and not self._validate_regexes:
+                if not isinstance(filter_value, (str, bytes)):
+                    raise ValueError('Bad regex - {0}'.format(filter_value))
+                return _LazyRegex(filter_value)
             try:
-                p[2] = re.compile(p[2], re.DOTALL)
+                regex = _compile_regex(filter_value)
             except:  # Python doesn't document exactly what exceptions re.compile throws
-                raise ValueError('Bad regex - {0}'.format(p[2]))
-        elif self._is_operator(p):
-            for operator_or_filter in (p[1] if p[0] != '!' else [p[1]]):
-                self._compile(operator_or_filter)
+                raise ValueError('Bad regex - {0}'.format(filter_value))
+            return _LazyRegex(filter_value) if self._lazy else regex
+        elif filter_name in ('in', '!in'):
+            return _FilterValueSet(self._compile_filter_value('==', item) for item in filter_value)
+        elif isinstance(filter_value, self._IMMUTABLE_FILTER_VALUE_TYPES):
+            return filter_value
+        return deepcopy(filter_value)
+
+    def _decompile(self, p):
+        """
+        Rebuilds a kmatch pattern from the compiled pattern (p).
+        """
+        return self._fold(
+            p, self._decompile_filter, lambda p, operands: [p[0], operands[0] if p[0] == '!' else operands])
+
+    def _decompile_filter(self, p):
+        key = list(p[1]) if isinstance(p[1], _ListKey) else p[1]
+        if p[0] == '=~':
+            return [p[0], key, p[2].pattern]
+        elif p[0] in ('in', '!in'):
+            return [p[0], key, [self._compile_filter_value('==', item) for item in p[2].filter_values]]
+        elif self._is_value_filter(p):
+            return [p[0], key, self._compile_filter_value(p[0], p[2])]
+        return [p[0], key]
+
+    def _flatten(self, p):
+        """
+        Returns the compiled pattern (p) as a flat list of its filters and operators in postfix order, where each
+        operator is a tuple of its name and its number of operands.
+        """
+        flattened = []
+        self._fold(p, flattened.append, lambda p, operands: flattened.append((p[0], len(operands))))
+        return flattened
+
+    def _unflatten(self, flattened):
+        """
+        Rebuilds a compiled pattern from its flat list of filters and operators.
+        """
+        stack = []
+        for p in flattened:
+            if p[0] in self._OPERATOR_MAP:
+                operands = stack[len(stack) - p[1]:]
+                del stack[len(stack) - p[1]:]
+                stack.append((p[0], operands[0] if p[0] == '!' else tuple(operands)))
+            else:
+                stack.append(p)
+        return stack[0]
 
     def _validate(self, p):
         """
-        Recursively validates the pattern (p), ensuring it adheres to the proper key names and structure.
+        Validates the pattern (p), ensuring it adheres to the proper key names and structure.
         """
-        if self._is_operator(p):
-            for operator_or_filter in (p[1] if p[0] != '!' else [p[1]]):
-                if p[0] == '^':
-                    self._validate_xor_args(p)
-                self._validate(operator_or_filter)
-        elif not self._is_value_filter(p) and not self._is_key_filter(p):
+        self._fold(p, self._validate_filter, lambda p, operands: None)
+
+    def _validate_filter(self, p):
+        if not self._is_value_filter(p) and not self._is_key_filter(p):
             raise ValueError('Not a valid operator or filter - {0}'.format(p))
+        elif p[0] in ('in', '!in') and not isinstance(p[2], (list, tuple, set, frozenset)):
+            raise ValueError('Filter values of {0} must be a list - {1}'.format(p[0], p[2]))
 
     def _validate_xor_args(self, p):
         """
@@ -102,51 +688,310 @@ class K(object):
         if len(p[1]) != 2:
             raise ValueError('Invalid syntax: XOR only accepts 2 arguments, got {0}: {1}'.format(len(p[1]), p))
 
-    def _match(self, p, value):
+    def _key_path(self, key):
         """
-        Calls either _match_operator or _match_operand depending on the pattern (p) provided.
+        Returns the path of a nested key as a tuple, or None if the key is not nested.
+        """
+        if not self._nested_keys:
+            return None
+        elif isinstance(key, (list, tuple)):
+            return tuple(key)
+        elif isinstance(key, str) and '.' in key:
+            return tuple(key.split('.'))
+        return None
+
+    def _parent_path(self, p):
+        """
+        Returns the path of the container holding the nested key of the filter (p), or None if there is none.
         """
         if self._is_operator(p):
-            return self._match_operator(p, value)
+            return None
+        path = self._key_path(p[1])
+        return path[:-1] if path is not None and len(path) > 1 else None
+
+    def _rebuild_matcher(self):
+        """
+        Lowers the compiled pattern into the callable used by match, starting a new profile when profiling.
+        """
+        self._profile = {} if self._profiling else None
+        self._source = None
+        if self._profiling or self._reorder_filters:
+            self._matcher = self._build_matcher(self._compiled_pattern)
+        elif self._is_deep():
+            from .program import build_program, program_matcher
+            self._matcher = program_matcher(*build_program(self, self._compiled_pattern))
+        elif self._codegen:
+            from .codegen import build_source_matcher
+            self._source, self._matcher = build_source_matcher(self, self._compiled_pattern)
         else:
-            try:
-                if self._is_value_filter(p):
-                    return self._match_value_filter(p, value)
-                else:
-                    return self._match_key_filter(p, value)
-            except KeyError:
-                if self._suppress_key_errors or self._suppress_exceptions:
-                    return False
-                else:
-                    raise
-            except TypeError:
-                if self._suppress_exceptions:
-                    return False
-                else:
-                    raise
+            self._matcher = self._build_matcher(self._compiled_pattern)
+
+    def _is_deep(self):
+        """
+        Returns True if the compiled pattern has more than _MAX_TREE_DEPTH nested operators.
+        """
+        stack = [(self._compiled_pattern, 1)] if self._is_operator(self._compiled_pattern) else []
+        while stack:
+            p, depth = stack.pop()
+            if depth > self._MAX_TREE_DEPTH:
+                return True
+            stack.extend(
+                (operand, depth + 1) for operand in (p[1] if p[0] != '!' else [p[1]]) if self._is_operator(operand))
+        return False
+
+    def _build_matcher(self, p, path=()):
+        """
+        Recursively lowers the compiled pattern (p) into a callable that takes the value to be matched. The path is
+        the tuple of operand indexes leading to p, used to identify it when profiling.
+        """
+        node_profile = None
+        if self._profile is not None:
+            node_profile = self._profile[path] = NodeProfile(path, self._decompile(p))
+
+        if self._is_operator(p):
+            matcher = self._build_operator_matcher(p, path)
+        else:
+            key_path = self._key_path(p[1])
+            matcher = self._build_filter_matcher(
+                p, _path_getter(p[1], key_path) if key_path is not None else None, node_profile)
+        return matcher if node_profile is None else profile_matcher(matcher, node_profile)
+
+    def _build_filter_matcher(self, p, get_field, node_profile=None):
+        """
+        Builds the callable for a filter that looks up its field with get_field, or directly if get_field is None.
+        """
+        if self._is_value_filter(p):
+            return self._suppress_errors(self._build_value_filter_matcher(p, get_field), node_profile)
+        else:
+            return self._suppress_errors(self._build_key_filter_matcher(p, get_field), node_profile)
 
-    def _match_operator(self, p, value):
+    def _build_operator_matcher(self, p, path=()):
         """
-        Returns True or False if the operator (&, |, or ! with filters, or ^ with filters) matches the value dictionary
+        Builds the callable for an operator (&, |, or ! with filters, or ^ with filters) from its operand callables.
         """
+        operator_func = self._OPERATOR_MAP[p[0]]
         if p[0] == '!':
-            return self._OPERATOR_MAP[p[0]](self._match(p[1], value))
+            operand = self._build_matcher(p[1], path + (0,))
+            return lambda value: operator_func(operand(value))
         elif p[0] == '^':
-            return self._OPERATOR_MAP[p[0]](self._match(p[1][0], value), self._match(p[1][1], value))
+            left, right = self._build_matcher(p[1][0], path + (0,)), self._build_matcher(p[1][1], path + (1,))
+            return lambda value: operator_func(left(value), right(value))
+        else:
+            return self._build_junction_matcher(p, path)
+
+    def _build_junction_matcher(self, p, path=()):
+        """
+        Builds the callable for an & or | operator, which stops at the first operand that decides the result.
+        """
+        # When profiling, every operand is kept as its own node so its statistics can be recorded
+        profiling = self._profile is not None
+        operands_or_filters = p[1] if p[0] == '&' or profiling else self._merge_filters(p[1])
+        indexes = range(len(operands_or_filters))
+        if self._reorder_filters:
+            indexes = sorted(indexes, key=lambda i: self._cost(operands_or_filters[i]))
+        groups = [[i] for i in indexes] if profiling else self._group_by_path_prefix(operands_or_filters, indexes)
+        operands = self._build_operand_matchers(
+            operands_or_filters, groups, p[0] == '|', self._lazy and not profiling and not self._reorder_filters, path)
+        if self._reorder_filters:
+            costs = [sum(self._cost(operands_or_filters[i]) for i in group) for group in groups]
+            return _AdaptiveJunction(operands, costs, p[0] == '|', self._REORDER_SAMPLE_SIZE)
+        elif p[0] == '&':
+            def match_all(value):
+                for operand in operands:
+                    if not operand(value):
+                        return False
+                return True
+            return match_all
         else:
-            return self._OPERATOR_MAP[p[0]]([self._match(operator_or_filter, value) for operator_or_filter in p[1]])
+            def match_any(value):
+                for operand in operands:
+                    if operand(value):
+                        return True
+                return False
+            return match_any
 
-    def _match_value_filter(self, p, value):
+    def _build_operand_matchers(self, operands_or_filters, groups, disjunction, lazy, path):
         """
-        Returns True of False if value in the pattern p matches the filter.
+        Builds the list of callables for the groups of operands of an & or |, or of an | if disjunction. With lazy,
+        operands that are branches are lowered the first time they are evaluated.
         """
-        return self._VALUE_FILTER_MAP[p[0]](value[p[1]], p[2])
+        operands = []
+        for group in groups:
+            if len(group) > 1:
+                operands.append(
+                    self._build_shared_prefix_matcher([operands_or_filters[i] for i in group], disjunction))
+            elif lazy and self._is_branch(operands_or_filters[group[0]]):
+                operands.append(self._build_lazy_operand_matcher(
+                    operands, len(operands), operands_or_filters[group[0]], path + (group[0],)))
+            else:
+                operands.append(self._build_matcher(operands_or_filters[group[0]], path + (group[0],)))
+        return operands
 
-    def _match_key_filter(self, p, value):
+    def _is_branch(self, p):
         """
-        Returns True of False if key in the pattern p and the value matches the filter.
+        Returns True if the operand (p) of an & or | is lowered the first time it is evaluated with lazy.
         """
-        return self._KEY_FILTER_MAP[p[0]](p[1], value)
+        return self._is_operator(p) or p[0] == '=~'
+
+    def _build_lazy_operand_matcher(self, operands, i, p, path):
+        """
+        Builds the callable for the operand i of an & or | that lowers it the first time it is evaluated, replacing
+        itself in the list of operand callables with the lowered callable.
+        """
+        def match_lazily(value):
+            operands[i] = self._build_matcher(p, path)
+            return operands[i](value)
+        return match_lazily
+
+    def _merge_filters(self, operands_or_filters):
+        """
+        Merges consecutive regex filters on the same key in the operands of an | into one regex filter on a tuple of
+        regexes, and consecutive == filters on the same key into one in filter, so the field is looked up and matched
+        once.
+        """
+        runs = []
+        for p in operands_or_filters:
+            mergeable = p[0] == '=~' or (
+                p[0] == '==' and isinstance(p[2], self._SET_FILTER_VALUE_TYPES) and p[2] == p[2])
+            if mergeable and runs and isinstance(runs[-1], list) and runs[-1][0] == p[0] and runs[-1][1] == p[1]:
+                runs[-1][2].append(p[2])
+            elif mergeable:
+                runs.append([p[0], p[1], [p[2]]])
+            else:
+                runs.append(p)
+
+        merged = []
+        for run in runs:
+            if not isinstance(run, list):
+                merged.append(run)
+            elif len(run[2]) == 1:
+                merged.append((run[0], run[1], run[2][0]))
+            else:
+                filter_value = tuple(run[2]) if run[0] == '=~' else _FilterValueSet(run[2])
+                merged.append(('=~' if run[0] == '=~' else 'in', run[1], filter_value))
+        return merged
+
+    def _group_by_path_prefix(self, operands_or_filters, indexes):
+        """
+        Splits the indexes of the operands of an & or | into runs, putting consecutive filters on nested keys whose
+        parent paths start with the same segment in the same run.
+        """
+        indexes = list(indexes)
+        return [
+            [indexes[i] for i in run]
+            for run in _prefix_runs([self._parent_path(operands_or_filters[i]) for i in indexes])
+        ]
+
+    def _build_shared_prefix_matcher(self, filters, decisive_result):
+        """
+        Builds the callable for consecutive operands of an & or | that are filters on nested keys whose parent paths
+        start with the same segment, such as 'a.b.c' and 'a.b.d.e'. The prefix their parent paths share is looked up
+        once, and runs of them that share a longer prefix below it share its lookup in turn, like the branches of a
+        trie. If looking up a prefix fails, each filter below it is matched on its own so it raises or is suppressed
+        exactly as it would be outside the group.
+        """
+        return self._build_prefix_matcher([(p, self._key_path(p[1])) for p in filters], decisive_result)
+
+    def _build_prefix_matcher(self, filters_and_paths, decisive_result):
+        """
+        Builds the callable for filters paired with the paths of their keys relative to the value it is given, whose
+        parent paths start with the same segment.
+        """
+        prefix = _common_prefix([path[:-1] for p, path in filters_and_paths])
+        get_prefix = _path_getter(prefix, prefix)
+        relative_filters_and_paths = [(p, path[len(prefix):]) for p, path in filters_and_paths]
+        relative_matchers = []
+        for run in _prefix_runs([path[:-1] for p, path in relative_filters_and_paths]):
+            if len(run) > 1:
+                relative_matchers.append(
+                    self._build_prefix_matcher([relative_filters_and_paths[i] for i in run], decisive_result))
+            else:
+                p, path = relative_filters_and_paths[run[0]]
+                relative_matchers.append(self._build_filter_matcher(p, _path_getter(p[1], path)))
+        matchers = [self._build_filter_matcher(p, _path_getter(p[1], path)) for p, path in filters_and_paths]
+
+        def match_shared_prefix(value):
+            try:
+                value_matchers, value = relative_matchers, get_prefix(value)
+            except KeyError:
+                value_matchers = matchers
+            for matcher in value_matchers:
+                if bool(matcher(value)) is decisive_result:
+                    return decisive_result
+            return not decisive_result
+        return match_shared_prefix
+
+    def _cost(self, p):
+        """
+        Estimates the relative cost of evaluating the compiled pattern (p) from the costs of its filters.
+        """
+        return self._fold(p, lambda p: self._FILTER_COSTS[p[0]], lambda p, costs: 1 + sum(costs))
+
+    def _build_value_filter_matcher(self, p, get_field=None):
+        """
+        Builds the callable that returns True or False if the value in the pattern p matches the filter.
+        """
+        filter_func, key, filter_value = self._VALUE_FILTER_MAP[p[0]], p[1], p[2]
+        if p[0] in ('=~', 'in', '!in'):
+            if p[0] == '=~':
+                field_filter = _regex_filter(filter_value if isinstance(filter_value, tuple) else (filter_value,))
+            else:
+                field_filter = _membership_filter(filter_value, p[0] == '!in')
+            if get_field is None:
+                return lambda value: field_filter(value[key])
+            return lambda value: field_filter(get_field(value))
+        if get_field is None:
+            return lambda value: filter_func(value[key], filter_value)
+        return lambda value: filter_func(get_field(value), filter_value)
+
+    def _build_key_filter_matcher(self, p, get_field=None):
+        """
+        Builds the callable that returns True or False if the key in the pattern p and the value match the filter.
+        """
+        filter_func, key = self._KEY_FILTER_MAP[p[0]], p[1]
+        if get_field is None:
+            return lambda value: filter_func(key, value)
+
+        def has_field(value):
+            try:
+                get_field(value)
+            except KeyError:
+                return False
+            return True
+        return has_field if p[0] == '?' else lambda value: not has_field(value)
+
+    def _suppressed_errors(self):
+        """
+        Returns the tuple of the exceptions that filters suppress, which is empty when none are suppressed.
+        """
+        if self._suppress_exceptions:
+            return (KeyError, TypeError)
+        elif self._suppress_key_errors:
+            return (KeyError,)
+        return ()
+
+    def _suppress_errors(self, matcher, node_profile=None):
+        """
+        Wraps a filter callable so that the exceptions being suppressed return False instead, counting them in the
+        NodeProfile of the filter when profiling.
+        """
+        suppressed_errors = self._suppressed_errors()
+        if not suppressed_errors:
+            return matcher
+
+        def suppressed_matcher(value):
+            try:
+                return matcher(value)
+            except suppressed_errors:
+                return False
+
+        def profiled_suppressed_matcher(value):
+            try:
+                return matcher(value)
+            except suppressed_errors:
+                node_profile.suppressed_errors += 1
+                return False
+        return suppressed_matcher if node_profile is None else profiled_suppressed_matcher
 
     def match(self, value):
         """
@@ -159,39 +1004,285 @@ class K(object):
         :raises: :class:`KeyError <exceptions.KeyError>` if key from pattern does not exist in input value and the
                 suppress_key_errors class variable is False
         """
-        return self._match(self._compiled_pattern, value)
+        return self._matcher(value)
+
+    def match_many(self, values):
+        """
+        Matches each of the values to the pattern.
+
+        :param values: The values to be matched
+        :type values: iterable of dict
+        :rtype: list of bool
+        :returns: A list with True for each value that matches the pattern and False otherwise, in the order of values
+        :raises: :class:`KeyError <exceptions.KeyError>` if key from pattern does not exist in an input value and the
+                suppress_key_errors class variable is False
+        """
+        matcher = self._matcher
+        return [bool(matcher(value)) for value in values]
 
-    def get_field_keys(self, pattern=None):
+    def filter(self, values):
         """
-        Builds a set of all field keys used in the pattern including nested fields.
+        Lazily filters the values down to those that match the pattern.
+
+        :param values: The values to be filtered
+        :type values: iterable of dict
+        :rtype: generator of dict
+        :returns: A generator of the values that match the pattern, in the order of values
+        :raises: :class:`KeyError <exceptions.KeyError>` if key from pattern does not exist in an input value and the
+                suppress_key_errors class variable is False
+        """
+        matcher = self._matcher
+        return (value for value in values if matcher(value))
+
+    def match_parallel(self, values, workers=None, chunksize=1000):
+        """
+        Matches each of the values to the pattern in a pool of worker processes. The K object is sent to each worker
+        once, and values are streamed to the workers in chunks with a bounded number of chunks in flight.
+
+        :param values: The values to be matched, which must be picklable
+        :type values: iterable of dict
+        :param workers: The number of worker processes, or None for one per CPU
+        :type workers: int
+        :param chunksize: The number of values sent to a worker process at a time
+        :type chunksize: int
+        :rtype: generator of bool
+        :returns: A generator of True for each value that matches the pattern and False otherwise, in the order of
+                values
+        :raises: :class:`KeyError <exceptions.KeyError>` if key from pattern does not exist in an input value and the
+                suppress_key_errors class variable is False
+        """
+        from .parallel import match_parallel
+        return match_parallel(self, values, workers=workers, chunksize=chunksize)
+
+    def filter_parallel(self, values, workers=None, chunksize=1000, ordered=True):
+        """
+        Filters the values down to those that match the pattern in a pool of worker processes, in the same way as
+        match_parallel.
+
+        :param values: The values to be filtered, which must be picklable
+        :type values: iterable of dict
+        :param workers: The number of worker processes, or None for one per CPU
+        :type workers: int
+        :param chunksize: The number of values sent to a worker process at a time
+        :type chunksize: int
+        :param ordered: Yield the matching values in the order of values rather than as soon as their chunk is matched
+        :type ordered: bool
+        :rtype: generator of dict
+        :returns: A generator of the values that match the pattern
+        :raises: :class:`KeyError <exceptions.KeyError>` if key from pattern does not exist in an input value and the
+                suppress_key_errors class variable is False
+        """
+        from .parallel import filter_parallel
+        return filter_parallel(self, values, workers=workers, chunksize=chunksize, ordered=ordered)
+
+    def afilter(self, values, chunksize=1000, executor=None):
+        """
+        Filters the values down to those that match the pattern in asyncio code. Values are read and matched a chunk
+        at a time, and control returns to the event loop after each chunk, or each chunk is matched in an executor.
+        The next chunk is only read once every match of the current chunk has been consumed.
+
+        :param values: The values to be filtered
+        :type values: async iterable or iterable of dict
+        :param chunksize: The number of values matched at a time
+        :type chunksize: int
+        :param executor: The executor to match chunks in, or None to match them in the event loop
+        :type executor: concurrent.futures.Executor
+        :rtype: async generator of dict
+        :returns: An async generator of the values that match the pattern, in the order of values
+        :raises: :class:`KeyError <exceptions.KeyError>` if key from pattern does not exist in an input value and the
+                suppress_key_errors class variable is False
+        """
+        from .aio import afilter
+        return afilter(self, values, chunksize=chunksize, executor=executor)
+
+    def amatch_many(self, values, chunksize=1000, executor=None):
+        """
+        Matches each of the values to the pattern in asyncio code, a chunk at a time as in afilter.
+
+        :param values: The values to be matched
+        :type values: async iterable or iterable of dict
+        :param chunksize: The number of values matched at a time
+        :type chunksize: int
+        :param executor: The executor to match chunks in, or None to match them in the event loop
+        :type executor: concurrent.futures.Executor
+        :rtype: coroutine of list of bool
+        :returns: A coroutine of a list with True for each value that matches the pattern and False otherwise, in the
+                order of values
+        :raises: :class:`KeyError <exceptions.KeyError>` if key from pattern does not exist in an input value and the
+                suppress_key_errors class variable is False
+        """
+        from .aio import amatch_many
+        return amatch_many(self, values, chunksize=chunksize, executor=executor)
+
+    def match_columns(self, columns):
+        """
+        Matches every row of column-oriented data to the pattern using vectorized NumPy operations. A row is taken to
+        have a key when the key's column exists and the row's value in it is not masked. Nested keys are used as
+        column names as they are. Requires NumPy.
+
+        :param columns: The columns to be matched
+        :type columns: dict of sequences or a structured NumPy array
+        :rtype: numpy.ndarray of bool
+        :returns: A mask that is True for each row that matches the pattern and False otherwise, agreeing row for row
+                with match
+        :raises: :class:`KeyError <exceptions.KeyError>` if key from pattern is missing for an evaluated row and the
+                suppress_key_errors class variable is False
+        """
+        from .columnar import match_columns
+        return match_columns(self, columns)
+
+    def explain(self, value):
+        """
+        Matches the value to the pattern and explains the result with the filters that decided it. The pattern is
+        evaluated once, in order and stopping at the first operand of each & and | that decides its result, and only
+        the filters that the result depends on are kept: the deciding operand of an & or | that stopped early, or
+        every operand of one that did not. Matching is not slowed down by explanations, which are only made when
+        explain is called.
+
+        :param value: The value to be matched
+        :type value: dict
+        :rtype: :class:`Explanation <kmatch.explain.Explanation>`
+        :returns: A named tuple of the result of the match and the list of the
+            :class:`FilterTrace <kmatch.explain.FilterTrace>` of each filter that decided it, in pattern order
+        :raises: :class:`KeyError <exceptions.KeyError>` if key from pattern does not exist in input value and the
+                suppress_key_errors class variable is False
+        """
+        from .explain import explain
+        return explain(self, value)
+
+    def to_sql(self, columns=None, regexp=False, paramstyle='qmark'):
+        """
+        Translates the pattern into a parameterized SQL WHERE clause that selects the rows of a table matching the
+        pattern, for rows where matching does not raise an exception. Filters on keys that are not columns, nested
+        keys, filter values that can not be parameters and regex filters without regexp are not translated. When
+        they are operands of an & at the root of the pattern they are left to the residual K object, which the
+        selected rows must also match, and otherwise the whole pattern is.
+
+        :param columns: The columns of the rows being matched, or None to take every key of the pattern to be a column
+        :type columns: iterable of str
+        :param regexp: Translate regex filters into the REGEXP operator, which must match as re.match does, such as
+            the REGEXP function installed by :func:`register_regexp <kmatch.sql.register_regexp>`
+        :type regexp: bool
+        :param paramstyle: The DB-API paramstyle of the placeholders, either 'qmark' or 'format'
+        :type paramstyle: str
+        :rtype: :class:`SqlWhere <kmatch.sql.SqlWhere>`
+        :returns: A named tuple of the WHERE clause, the list of its parameters and the residual K object, which is
+            None when the whole pattern is translated
+        :raises: :class:`ValueError <exceptions.ValueError>` on an unsupported paramstyle
+        """
+        from .sql import to_sql
+        return to_sql(self, columns=columns, regexp=regexp, paramstyle=paramstyle)
+
+    @property
+    def field_keys(self):
+        """
+        Gets the field keys used in the pattern, computed once when the K object is constructed. Nested key paths are
+        returned as they appear in the pattern, with lists converted to tuples.
+
+        :rtype: frozenset
+        """
+        return self._field_keys
+
+    def get_field_keys(self, pattern=None, details=False):
+        """
+        Builds a set of all field keys used in the pattern including nested fields. Nested key paths are returned as
+        they appear in the pattern, with lists converted to tuples.
 
         :param pattern: The kmatch pattern to get field keys from or None to use self.pattern
         :type pattern: list or None
-        :returns: A set object of all field keys used in the pattern
-        :rtype: set
+        :param details: Return the names of the filters used on each field key as well
+        :type details: bool
+        :returns: A set object of all field keys used in the pattern, or with details a dictionary of each field key to
+            the set of filter names, such as '==' or '?', used on it
+        :rtype: set or dict
+        :raises: :class:`ValueError <exceptions.ValueError>` on an invalid pattern
         """
-        # Use own pattern or passed in argument for recursion
-        pattern = pattern or self.pattern
-
-        # Validate the pattern so we can make assumptions about the data
-        self._validate(pattern)
+        if pattern:
+            # Validate the pattern so we can make assumptions about the data
+            self._validate(pattern)
+            field_key_usage = self._walk_field_keys(pattern)
+        else:
+            field_key_usage = self._field_key_usage.items()
 
-        keys = set()
+        if details:
+            return dict((key, set(filter_names)) for key, filter_names in field_key_usage)
+        return set(key for key, filter_names in field_key_usage)
 
-        # Valid pattern length can only be 2 or 3
-        # With key filters, field key is second item just like 3 item patterns
-        if len(pattern) == 2 and pattern[0] not in self._KEY_FILTER_MAP:
-            if pattern[0] in ('&', '|', '^'):
-                # Pass each nested pattern to get_field_keys
-                for filter_item in pattern[1]:
-                    keys = keys.union(self.get_field_keys(filter_item))
+    def _walk_field_keys(self, p):
+        """
+        Walks the valid pattern or compiled pattern (p) without recursing and returns a list of each field key paired
+        with the set of filter names used on it.
+        """
+        field_key_usage = {}
+        stack = [p]
+        while stack:
+            p = stack.pop()
+            if self._is_operator(p):
+                stack.extend(reversed(p[1]) if p[0] != '!' else [p[1]])
             else:
-                # pattern[0] == '!'
-                keys = keys.union(self.get_field_keys(pattern[1]))
-        else:
-            # Pattern length is 3
-            keys.add(pattern[1])
-        return keys
+                # Nested key paths that are lists are returned as tuples so they can be in a set
+                key = tuple(p[1]) if isinstance(p[1], (list, _ListKey)) else p[1]
+                field_key_usage.setdefault(key, set()).add(p[0])
+        return list(field_key_usage.items())
+
+    def optimize(self):
+        """
+        Gets a K object with the same options for the optimized pattern, as if it was constructed with optimize=True.
+
+        :rtype: :class:`K <kmatch.K>`
+        """
+        return type(self)(self, **dict(self._options(), optimize=True))
+
+    @property
+    def source(self):
+        """
+        Gets the source of the Python function generated to match the pattern when the K object was constructed with
+        codegen=True.
+
+        :rtype: str or None
+        :returns: The source of the generated function, or None when the pattern is not matched by one
+        """
+        self._build_lazy_matcher()
+        return self._source
+
+    @property
+    def profile(self):
+        """
+        Gets the statistics recorded for each operator and filter when the K object was constructed with profile=True.
+
+        :rtype: dict or None
+        :returns: A dictionary of :class:`NodeProfile <kmatch.NodeProfile>` objects keyed on node path, in pattern
+            order, or None when not profiling
+        """
+        self._build_lazy_matcher()
+        return self._profile
+
+    def profile_tree(self):
+        """
+        Gets the recorded statistics as a tree that mirrors the pattern.
+
+        :rtype: dict or None
+        :returns: The dictionary of the root's statistics, where each operator also has a list of dictionaries for
+            its operands under 'operands', or None when not profiling
+        """
+        if self.profile is None:
+            return None
+
+        def build_node(p, path):
+            node = self._profile[path].as_dict()
+            if self._is_operator(p):
+                operands = [p[1]] if p[0] == '!' else p[1]
+                node['operands'] = [build_node(operand, path + (i,)) for i, operand in enumerate(operands)]
+            return node
+        return build_node(self._compiled_pattern, ())
+
+    def reset_profile(self):
+        """
+        Resets the statistics recorded for every operator and filter to zero.
+        """
+        for node_profile in (self._profile or {}).values():
+            node_profile.evaluations = node_profile.matches = node_profile.suppressed_errors = node_profile.errors = 0
+            node_profile.time = 0.0
 
     @property
     def suppress_exceptions(self):
@@ -200,3 +1291,4 @@ class K(object):
     @suppress_exceptions.setter
     def suppress_exceptions(self, suppress_exceptions):
         self._suppress_exceptions = suppress_exceptions
+        self._rebuild_matcher()
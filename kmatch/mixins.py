@@ -1,9 +1,43 @@
 from .kmatch import K
 
 
+def _pattern_repr(p):
+    """
+    Returns the same string as repr(p) for a pattern, built from a stack where each item is a flag of whether it is
+    text to be written as it is, and the text or value.
+    """
+    pieces = []
+    stack = [(False, p)]
+    while stack:
+        is_text, item = stack.pop()
+        if is_text:
+            pieces.append(item)
+        elif isinstance(item, list):
+            stack.append((True, ']'))
+            for i in reversed(range(len(item))):
+                stack.append((False, item[i]))
+                if i:
+                    stack.append((True, ', '))
+            stack.append((True, '['))
+        else:
+            pieces.append(repr(item))
+    return ''.join(pieces)
+
+
+def _failure_message(k, value, outcome):
+    """
+    Returns the message of a failed assertion on the value, explained by the filters that decided the match.
+    """
+    explanation = k.explain(value)
+    return '{0!r} {1} {2}, decided by:\n{3}'.format(
+        value, outcome, _pattern_repr(k.pattern),
+        '\n'.join('    {0}'.format(filter_trace) for filter_trace in explanation.filters))
+
+
 class KmatchTestMixin(object):
     """
-    A mixin for test classes to perform kmatch validation on dictionaries
+    A mixin for test classes to perform kmatch validation on dictionaries. Failed assertions are explained with the
+    filters that decided the match.
     """
     def assertKmatches(self, pattern, value, suppress_key_errors=False):
         """
@@ -23,7 +57,9 @@ class KmatchTestMixin(object):
             suppress_key_errors class variable is False
             * :class:`AssertionError <exceptions.AssertionError>` if the value **does not** match the pattern
         """
-        assert K(pattern, suppress_key_errors=suppress_key_errors).match(value)
+        k = K.cached(pattern, suppress_key_errors=suppress_key_errors)
+        if not k.match(value):
+            raise AssertionError(_failure_message(k, value, 'does not match'))
 
     def assertNotKmatches(self, pattern, value, suppress_key_errors=True):
         """
@@ -43,4 +79,6 @@ class KmatchTestMixin(object):
             suppress_key_errors class variable is False
             * :class:`AssertionError <exceptions.AssertionError>` if the value **does match** the pattern
         """
-        assert not K(pattern, suppress_key_errors=suppress_key_errors).match(value)
+        k = K.cached(pattern, suppress_key_errors=suppress_key_errors)
+        if k.match(value):
+            raise AssertionError(_failure_message(k, value, 'matches'))
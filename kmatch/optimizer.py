@@ -0,0 +1,310 @@
+"""
+Rewrites compiled patterns into simpler compiled patterns that match the same values.
+"""
+from .index import _range_group
+from .kmatch import _FilterValueSet
+
+
+# The compiled patterns that always match and never match
+ALWAYS = ('&', ())
+NEVER = ('|', ())
+
+_BOUND_SIDES = {'>': 'lower', '>=': 'lower', '<': 'upper', '<=': 'upper'}
+
+
+def optimize_pattern(k, p):
+    """
+    Optimizes the compiled pattern (p) of a K object from its filters up. Operators of the same kind are flattened,
+    duplicated operands are removed, comparisons on the same key are merged into the tightest (for &) or loosest (for
+    |) range, operands that can never be True together, or never be False together, fold their operator into a
+    constant, and ! is moved through operators with De Morgan's laws until it only applies to filters, where double
+    negations cancel. The == and in filters on the same key in an | are merged into one in filter.
+
+    ! is never folded into a filter, since for example ['!', ['>', 'f', 1]] matches values where f is missing or not
+    comparable to 1 and ['<=', 'f', 1] does not.
+    """
+    return _PatternOptimizer(k).optimize(p)
+
+
+def _fold_up(p, children, combine):
+    """
+    Folds p from the bottom up with an explicit stack, where children(p) returns the nodes p is folded from and
+    combine(p, folded) folds p from the list of its folded children.
+    """
+    folded = []
+    stack = [(p, None)]
+    while stack:
+        p, p_children = stack.pop()
+        if p_children is None:
+            p_children = children(p)
+            stack.append((p, p_children))
+            stack.extend((child, None) for child in reversed(p_children))
+        else:
+            start = len(folded) - len(p_children)
+            result = combine(p, folded[start:])
+            del folded[start:]
+            folded.append(result)
+    return folded[0]
+
+
+class _PatternOptimizer(object):
+    """
+    Optimizes one compiled pattern. Every operator it builds is interned, so equal operators are the same object and
+    operands are compared by their node keys instead of with ==, which would recurse through deeply nested patterns.
+    """
+    def __init__(self, k):
+        self._k = k
+        self._operators = {('&', ()): ALWAYS, ('|', ()): NEVER}
+        self._unhashable_filters = []
+        self._negations = {}
+
+    def optimize(self, p):
+        return self._k._fold(p, lambda p: p, self._optimize_operator)
+
+    def _optimize_operator(self, p, operands):
+        if p[0] == '!':
+            return self._negate(operands[0])
+        elif p[0] == '^':
+            return self._optimize_xor(operands[0], operands[1])
+        return self._optimize_junction(p[0], operands)
+
+    def _key(self, p):
+        """
+        Returns a hashable key of an optimized compiled pattern that is equal for equal patterns.
+        """
+        if self._k._is_operator(p):
+            return id(p)
+        try:
+            hash(p)
+            return p
+        except TypeError:
+            # Filter values that can not be hashed are compared to every such filter seen so far instead
+            for unhashable_filter in self._unhashable_filters:
+                if unhashable_filter == p:
+                    return id(unhashable_filter)
+            self._unhashable_filters.append(p)
+            return id(p)
+
+    def _operator(self, p):
+        """
+        Returns the interned operator equal to p.
+        """
+        operands = p[1] if p[0] != '!' else (p[1],)
+        return self._operators.setdefault((p[0], tuple(self._key(operand) for operand in operands)), p)
+
+    def _negate(self, p):
+        """
+        Returns the optimized negation of the optimized compiled pattern (p). Negations are remembered both ways, so
+        nested ! operators do not negate the same operands again. A ! operator is only built by negating its operand,
+        so the negation of one is always remembered.
+        """
+        def children(p):
+            if not self._k._is_operator(p) or self._key(p) in self._negations:
+                return ()
+            return p[1][:1] if p[0] == '^' else p[1]
+
+        def combine(p, negated):
+            key = self._key(p)
+            if key in self._negations:
+                return self._negations[key]
+            elif not self._k._is_operator(p):
+                result = self._operator(('!', p))
+            elif p[0] == '^':
+                result = self._optimize_xor(negated[0], p[1][1])
+            else:
+                result = self._optimize_junction('|' if p[0] == '&' else '&', negated)
+            self._negations[key] = result
+            self._negations.setdefault(self._key(result), p)
+            return result
+        return _fold_up(p, children, combine)
+
+    def _optimize_xor(self, left, right):
+        """
+        Returns the optimized ^ of two optimized compiled patterns.
+        """
+        if left in (ALWAYS, NEVER):
+            return right if left == NEVER else self._negate(right)
+        elif right in (ALWAYS, NEVER):
+            return left if right == NEVER else self._negate(left)
+        left_key, right_key = self._key(left), self._key(right)
+        if left_key == right_key:
+            return NEVER
+        elif left[0] == '!' and self._key(left[1]) == right_key or right[0] == '!' and self._key(right[1]) == left_key:
+            return ALWAYS
+        return self._operator(('^', (left, right)))
+
+    def _optimize_junction(self, operator, operands):
+        """
+        Returns the optimized & or | of optimized compiled patterns.
+        """
+        k = self._k
+        absorbing = NEVER if operator == '&' else ALWAYS
+        flattened = []
+        for operand in operands:
+            # The constant that does not change the result is an empty operator of the same kind, so it flattens away
+            if operand[0] == operator and k._is_operator(operand):
+                flattened.extend(operand[1])
+            else:
+                flattened.append(operand)
+        if any(operand is absorbing for operand in flattened):
+            return absorbing
+
+        operands = self._unique(flattened)
+        if self._has_complement(operands):
+            return absorbing
+        operands = _merge_ranges(k, operator, operands)
+        if operands is None:
+            return absorbing
+        if operator == '|':
+            operands = _merge_equal_filters(k, operands)
+
+        if len(operands) == 1:
+            return operands[0]
+        return self._operator((operator, tuple(operands)))
+
+    def _has_complement(self, operands):
+        """
+        Returns whether an operand is the negation of another operand.
+        """
+        negated = [self._key(operand[1]) for operand in operands if operand[0] == '!']
+        operand_keys = set(self._key(operand) for operand in operands) if negated else ()
+        return any(key in operand_keys for key in negated)
+
+    def _unique(self, operands):
+        """
+        Removes the operands equal to an earlier operand.
+        """
+        seen = set()
+        unique_operands = []
+        for operand in operands:
+            key = self._key(operand)
+            if key not in seen:
+                seen.add(key)
+                unique_operands.append(operand)
+        return unique_operands
+
+
+def _is_hashable(key):
+    try:
+        hash(key)
+    except TypeError:
+        return False
+    return True
+
+
+def _range_filter(k, p):
+    """
+    Returns the hashable key, range group and side of a comparison filter that can be merged with others, or None.
+    """
+    if p[0] not in _BOUND_SIDES and p[0] != '==' or not k._is_value_filter(p) or not _is_hashable(p[1]):
+        return None
+    group = _range_group(p[2])
+    return None if group is None else (p[1], group, _BOUND_SIDES.get(p[0], 'equal'))
+
+
+def _is_tighter(p, other_p):
+    """
+    Returns whether the bound p is tighter than the bound other_p on the same side.
+    """
+    if p[2] == other_p[2]:
+        return p[0] in ('>', '<') and other_p[0] not in ('>', '<')
+    return p[2] > other_p[2] if p[0] in ('>', '>=') else p[2] < other_p[2]
+
+
+def _satisfies(filter_value, bound):
+    """
+    Returns whether a value equal to filter_value is within the bound.
+    """
+    if bound[0] in ('>', '<'):
+        return filter_value > bound[2] if bound[0] == '>' else filter_value < bound[2]
+    return filter_value >= bound[2] if bound[0] == '>=' else filter_value <= bound[2]
+
+
+def _overlaps(lower, upper):
+    """
+    Returns whether any value is within both the lower and upper bound.
+    """
+    return lower[2] < upper[2] or lower[2] == upper[2] and lower[0] == '>=' and upper[0] == '<='
+
+
+def _merge_ranges(k, operator, operands):
+    """
+    Keeps only the tightest lower and upper bound of the comparisons on each key and range group of an &, or the
+    loosest of an |, in place of the first of them. Returns None if the operands of an & can not all be True.
+    """
+    bounds = {}
+    merged = []
+    for operand in operands:
+        range_filter = _range_filter(k, operand)
+        if range_filter is None or range_filter[2] == 'equal':
+            merged.append(operand)
+        elif range_filter not in bounds:
+            bounds[range_filter] = len(merged)
+            merged.append(operand)
+        elif _is_tighter(operand, merged[bounds[range_filter]]) is (operator == '&'):
+            merged[bounds[range_filter]] = operand
+    return merged if operator == '|' or _is_satisfiable(k, merged, bounds) else None
+
+
+def _is_satisfiable(k, operands, bounds):
+    """
+    Returns whether the merged comparisons of an & can all be True, given the indexes of its bounds.
+    """
+    equal_values = {}
+    for operand in operands:
+        range_filter = _range_filter(k, operand)
+        if range_filter is None:
+            continue
+        key, group, side = range_filter
+        lower, upper = [
+            operands[bounds[(key, group, bound_side)]] if (key, group, bound_side) in bounds else None
+            for bound_side in ('lower', 'upper')
+        ]
+        if side == 'equal':
+            if equal_values.setdefault((key, group), operand[2]) != operand[2]:
+                return False
+            elif any(bound is not None and not _satisfies(operand[2], bound) for bound in (lower, upper)):
+                return False
+        elif side == 'lower' and upper is not None and not _overlaps(operand, upper):
+            return False
+    return True
+
+
+def _member_key(k, p):
+    """
+    Returns the key of an in filter, or of an == filter whose filter value can be looked up in a set, wrapped in a
+    tuple, or None if p is neither or its key can't be hashed.
+    """
+    if p[0] == '==' and k._is_value_filter(p):
+        if not isinstance(p[2], k._SET_FILTER_VALUE_TYPES) or p[2] != p[2]:
+            return None
+    elif p[0] != 'in' or not k._is_value_filter(p):
+        return None
+    return (p[1],) if _is_hashable(p[1]) else None
+
+
+def _merge_equal_filters(k, operands):
+    """
+    Merges the in filters and == filters on each key of an | into one in filter in place of the first of them.
+    """
+    member_filters = {}
+    for operand in operands:
+        key = _member_key(k, operand)
+        if key is not None:
+            member_filters.setdefault(key, []).append(operand)
+
+    merged = []
+    for operand in operands:
+        key = _member_key(k, operand)
+        if key is None:
+            merged.append(operand)
+        elif key in member_filters:
+            key_filters = member_filters.pop(key)
+            if len(key_filters) == 1:
+                merged.append(operand)
+                continue
+            filter_values = []
+            for key_filter in key_filters:
+                filter_values.extend(key_filter[2].filter_values if key_filter[0] == 'in' else [key_filter[2]])
+            merged.append(('in', operand[1], _FilterValueSet(filter_values)))
+    return merged
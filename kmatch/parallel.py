@@ -0,0 +1,101 @@
+"""
+Matches large batches of values against a K object in a pool of worker processes.
+"""
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+import os
+
+
+# The K object of a worker process, sent to it once when the process starts
+_worker_k = None
+
+
+def _initialize_worker(k):
+    global _worker_k
+    _worker_k = k
+
+
+def _match_chunk(chunk):
+    return _worker_k.match_many(chunk)
+
+
+def _filter_chunk(chunk):
+    return list(_worker_k.filter(chunk))
+
+
+def _chunks(values, chunksize):
+    """
+    Splits an iterable of values into lists of up to chunksize values without reading ahead of the current chunk.
+    """
+    iterator = iter(values)
+    chunk = list(islice(iterator, chunksize))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, chunksize))
+
+
+def _map_chunks(k, chunk_func, values, workers, chunksize, ordered):
+    """
+    Applies chunk_func to chunks of the values in a pool of worker processes and yields the items of its results.
+    At most two chunks per worker are in flight at once, so memory use is bounded however many values there are.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = 2 * workers
+    with ProcessPoolExecutor(max_workers=workers, initializer=_initialize_worker, initargs=(k,)) as executor:
+        if ordered:
+            pending = deque()
+            for chunk in _chunks(values, chunksize):
+                pending.append(executor.submit(chunk_func, chunk))
+                if len(pending) >= max_pending:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+        else:
+            pending = set()
+            for chunk in _chunks(values, chunksize):
+                pending.add(executor.submit(chunk_func, chunk))
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield from future.result()
+            for future in pending:
+                yield from future.result()
+
+
+def match_parallel(k, values, workers=None, chunksize=1000):
+    """
+    Matches each of the values to the pattern of a K object in a pool of worker processes.
+
+    :param k: The K object whose pattern is matched
+    :type k: :class:`K <kmatch.K>`
+    :param values: The values to be matched, which must be picklable
+    :type values: iterable of dict
+    :param workers: The number of worker processes, or None for one per CPU
+    :type workers: int
+    :param chunksize: The number of values sent to a worker process at a time
+    :type chunksize: int
+    :rtype: generator of bool
+    :returns: A generator of True for each value that matches the pattern and False otherwise, in the order of values
+    """
+    return _map_chunks(k, _match_chunk, values, workers, chunksize, True)
+
+
+def filter_parallel(k, values, workers=None, chunksize=1000, ordered=True):
+    """
+    Filters the values down to those that match the pattern of a K object in a pool of worker processes.
+
+    :param k: The K object whose pattern is matched
+    :type k: :class:`K <kmatch.K>`
+    :param values: The values to be filtered, which must be picklable
+    :type values: iterable of dict
+    :param workers: The number of worker processes, or None for one per CPU
+    :type workers: int
+    :param chunksize: The number of values sent to a worker process at a time
+    :type chunksize: int
+    :param ordered: Yield the matching values in the order of values rather than as soon as their chunk is matched
+    :type ordered: bool
+    :rtype: generator of dict
+    :returns: A generator of the values that match the pattern
+    """
+    return _map_chunks(k, _filter_chunk, values, workers, chunksize, ordered)
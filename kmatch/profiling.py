@@ -0,0 +1,81 @@
+from time import perf_counter
+
+
+class NodeProfile(object):
+    """
+    The statistics recorded for one operator or filter of a pattern by a K object constructed with profile=True.
+
+    The path of a node is the tuple of operand indexes leading to it from the root of the pattern, so the root is ()
+    and the second operand of the root is (1,). The time of a node includes the time of its operands.
+    """
+    __slots__ = ('path', 'pattern', 'evaluations', 'matches', 'suppressed_errors', 'errors', 'time')
+
+    def __init__(self, path, pattern):
+        self.path = path
+        self.pattern = pattern
+        # The number of times the node was evaluated
+        self.evaluations = 0
+        # The number of evaluations that returned True
+        self.matches = 0
+        # The number of evaluations where a suppressed exception was raised and False was returned instead
+        self.suppressed_errors = 0
+        # The number of evaluations that raised an exception
+        self.errors = 0
+        # The cumulative time in seconds spent evaluating the node
+        self.time = 0.0
+
+    @property
+    def true_rate(self):
+        """
+        The fraction of evaluations that returned True, or None if the node was never evaluated.
+        """
+        return self.matches / self.evaluations if self.evaluations else None
+
+    @property
+    def false_rate(self):
+        """
+        The fraction of evaluations that returned False, or None if the node was never evaluated.
+        """
+        return (self.evaluations - self.matches - self.errors) / self.evaluations if self.evaluations else None
+
+    def as_dict(self):
+        """
+        Gets the statistics of the node as a dictionary.
+
+        :rtype: dict
+        """
+        return {
+            'path': self.path,
+            'pattern': self.pattern,
+            'evaluations': self.evaluations,
+            'matches': self.matches,
+            'true_rate': self.true_rate,
+            'false_rate': self.false_rate,
+            'suppressed_errors': self.suppressed_errors,
+            'errors': self.errors,
+            'time': self.time,
+        }
+
+    def __repr__(self):
+        return 'NodeProfile(path={0!r}, evaluations={1}, matches={2}, suppressed_errors={3}, time={4:.6f})'.format(
+            self.path, self.evaluations, self.matches, self.suppressed_errors, self.time)
+
+
+def profile_matcher(matcher, node_profile):
+    """
+    Wraps the callable for a node so that each evaluation is recorded in its NodeProfile.
+    """
+    def profiled_matcher(value):
+        node_profile.evaluations += 1
+        start = perf_counter()
+        try:
+            result = matcher(value)
+        except Exception:
+            node_profile.errors += 1
+            raise
+        finally:
+            node_profile.time += perf_counter() - start
+        if result:
+            node_profile.matches += 1
+        return result
+    return profiled_matcher
@@ -0,0 +1,142 @@
+"""
+Lowers compiled patterns into flat branch programs, which are evaluated in a loop instead of by nested calls.
+
+A branch program is a list of instructions (test, on_true, on_false). Evaluation starts at the entry instruction,
+calls its test with the value being matched and continues at on_true or on_false until it reaches one of the
+negative targets MATCH or NO_MATCH. Operators leave no instructions of their own: & and | wire their operands'
+targets to each other so they stop at the first operand that decides the result, and ! swaps its operand's targets.
+^ pushes the result of its left operand on a stack of flags (instructions whose test is True or False) that is popped
+after its right operand (instructions whose test is None), so neither operand is lowered twice.
+"""
+# The targets that end the evaluation of a branch program
+MATCH = -1
+NO_MATCH = -2
+
+# Markers of the work items that continue lowering an operator once the operand lowered before them has its entry
+_JUNCTION = object()
+_XOR = object()
+
+
+def build_program(k, p):
+    """
+    Lowers the compiled pattern (p) of a K object into a branch program without recursing. Operands of & and | are
+    lowered last to first, so the entry of the operand after each one is known when it is lowered. The operands of |
+    are merged and the operands of both are grouped by parent path as in the matchers built by the K object.
+
+    :returns: The tuple of the instructions and the entry of the program
+    """
+    return _ProgramBuilder(k).build(p)
+
+
+class _ProgramBuilder(object):
+    """
+    Lowers a compiled pattern from a stack of work items. A work item is an operator or filter with the targets it
+    continues at, or the continuation of an operator, which takes the entry of the operand lowered before it from the
+    stack of entries.
+    """
+    def __init__(self, k):
+        self._k = k
+        self._instructions = []
+        self._stack = []
+        self._entries = []
+
+    def build(self, p):
+        self._stack.append((p, MATCH, NO_MATCH))
+        while self._stack:
+            item = self._stack.pop()
+            if item[0] is _JUNCTION:
+                self._continue_junction(*item[1:])
+            elif item[0] is _XOR:
+                self._continue_xor(*item[1:])
+            else:
+                self._lower(*item)
+        return self._instructions, self._entries[0]
+
+    def _emit(self, test, on_true, on_false):
+        self._instructions.append((test, on_true, on_false))
+        return len(self._instructions) - 1
+
+    def _lower(self, p, on_true, on_false):
+        if callable(p):
+            self._entries.append(self._emit(p, on_true, on_false))
+        elif not self._k._is_operator(p):
+            self._entries.append(self._emit(self._k._build_matcher(p), on_true, on_false))
+        elif p[0] == '!':
+            self._stack.append((p[1], on_false, on_true))
+        elif p[0] == '^':
+            # The right operand's result is compared with the flag its left operand pushed
+            self._stack.append((_XOR, p[1][0], on_true, on_false))
+            self._stack.append((p[1][1], self._emit(None, on_false, on_true), self._emit(None, on_true, on_false)))
+        else:
+            operands = _junction_operands(self._k, p)
+            if not operands:
+                self._entries.append(on_true if p[0] == '&' else on_false)
+            else:
+                self._stack.append((_JUNCTION, p[0], operands, len(operands) - 1, on_true, on_false))
+                self._stack.append((operands[-1], on_true, on_false))
+
+    def _continue_junction(self, junction_operator, operands, i, on_true, on_false):
+        """
+        Lowers the operand of an & or | before the operand i, which continues at the entry of operand i when it does
+        not decide the result.
+        """
+        entry = self._entries.pop()
+        if i == 0:
+            self._entries.append(entry)
+            return
+        self._stack.append((_JUNCTION, junction_operator, operands, i - 1, on_true, on_false))
+        if junction_operator == '&':
+            self._stack.append((operands[i - 1], entry, on_false))
+        else:
+            self._stack.append((operands[i - 1], on_true, entry))
+
+    def _continue_xor(self, left, on_true, on_false):
+        """
+        Lowers the left operand of a ^, which pushes its result and continues at the entry of the right operand.
+        """
+        right_entry = self._entries.pop()
+        push_true, push_false = self._emit(True, right_entry, right_entry), self._emit(False, right_entry, right_entry)
+        self._stack.append((left, push_true, push_false))
+
+
+def _junction_operands(k, p):
+    """
+    Returns the operands of an & or |, where each group of filters on nested keys with a shared path prefix is
+    replaced with the callable that matches the group.
+    """
+    operands_or_filters = p[1] if p[0] == '&' else k._merge_filters(p[1])
+    return [
+        operands_or_filters[group[0]] if len(group) == 1
+        else k._build_shared_prefix_matcher([operands_or_filters[i] for i in group], p[0] == '|')
+        for group in k._group_by_path_prefix(operands_or_filters, range(len(operands_or_filters)))
+    ]
+
+
+def program_matcher(instructions, entry):
+    """
+    Returns a callable that matches a value by evaluating a branch program. Programs without ^ are evaluated by a
+    loop that only calls tests.
+    """
+    if all(callable(test) for test, on_true, on_false in instructions):
+        def match_program(value):
+            i = entry
+            while i >= 0:
+                test, on_true, on_false = instructions[i]
+                i = on_true if test(value) else on_false
+            return i == MATCH
+        return match_program
+
+    def match_program_with_flags(value):
+        flags = []
+        i = entry
+        while i >= 0:
+            test, on_true, on_false = instructions[i]
+            if test is None:
+                i = on_true if flags.pop() else on_false
+            elif test is True or test is False:
+                flags.append(test)
+                i = on_true
+            else:
+                i = on_true if test(value) else on_false
+        return i == MATCH
+    return match_program_with_flags
@@ -0,0 +1,218 @@
+from operator import xor
+
+
+def _memoized(slot, evaluate):
+    """
+    Returns an evaluator that stores the result of evaluate in slot of the results of the value being routed, so it
+    is evaluated at most once per value.
+    """
+    def evaluate_once(value, results):
+        result = results[slot]
+        if result is None:
+            result = results[slot] = bool(evaluate(value, results))
+        return result
+    return evaluate_once
+
+
+def _matcher_evaluator(matcher):
+    """
+    Returns an evaluator that matches the value with a callable built by a K object, ignoring the shared results.
+    """
+    def evaluate(value, results):
+        return matcher(value)
+    return evaluate
+
+
+def _operator_evaluator(operator, operands):
+    """
+    Returns the evaluator of an operator from the evaluators of its operands.
+    """
+    if operator == '!':
+        operand = operands[0]
+        return lambda value, results: not operand(value, results)
+    elif operator == '^':
+        left, right = operands
+        return lambda value, results: xor(bool(left(value, results)), bool(right(value, results)))
+    elif operator == '&':
+        def evaluate_all(value, results):
+            for operand in operands:
+                if not operand(value, results):
+                    return False
+            return True
+        return evaluate_all
+    else:
+        def evaluate_any(value, results):
+            for operand in operands:
+                if operand(value, results):
+                    return True
+            return False
+        return evaluate_any
+
+
+class _RouteGraph(object):
+    """
+    The operators and filters of the patterns of a router as a graph where equal operators and filters are one node.
+    A node is the K object it was first found in, its compiled pattern, or None for a pattern matched as a whole, and
+    the ids of its operand nodes.
+    """
+    def __init__(self):
+        self._node_ids = {}
+        self._nodes = []
+        self._references = []
+        self._evaluators = {}
+        self._has_shared_operands = {}
+        self.num_slots = 0
+
+    def add(self, k):
+        """
+        Adds the pattern of a K object to the graph and returns the id of its node. Patterns that are profiled,
+        reordered or deeply nested are matched as a whole with match.
+        """
+        if k._profiling or k._reorder_filters or k._is_deep():
+            node_id = self._add_node(None, k, None, ())
+        else:
+            node_id = k._fold(
+                k._compiled_pattern, lambda p: self._add_filter(k, p),
+                lambda p, operand_ids: self._add_node((p[0], tuple(operand_ids)), k, p, operand_ids))
+        self._references[node_id] += 1
+        return node_id
+
+    def _add_filter(self, k, p):
+        # Filters are only equal with the same type of filter value and options that change how they are matched
+        key = (p, type(p[2]) if len(p) == 3 else None, k._suppress_key_errors, k._suppress_exceptions, k._nested_keys)
+        try:
+            hash(key)
+        except TypeError:
+            key = None
+        return self._add_node(key, k, p, ())
+
+    def _add_node(self, key, k, p, operand_ids):
+        if key in self._node_ids:
+            return self._node_ids[key]
+        node_id = len(self._nodes)
+        self._nodes.append((k, p, operand_ids))
+        self._references.append(0)
+        for operand_id in operand_ids:
+            self._references[operand_id] += 1
+        if key is not None:
+            self._node_ids[key] = node_id
+        return node_id
+
+    def _is_shared(self, node_id):
+        return self._references[node_id] > 1
+
+    def _has_shared_operand(self, node_id):
+        """
+        Returns True if any node below the node is shared.
+        """
+        if node_id not in self._has_shared_operands:
+            self._has_shared_operands[node_id] = any(
+                self._is_shared(operand_id) or self._has_shared_operand(operand_id)
+                for operand_id in self._nodes[node_id][2])
+        return self._has_shared_operands[node_id]
+
+    def evaluator(self, node_id):
+        """
+        Returns the callable that evaluates a node for a value and the list of results of the shared nodes. Nodes
+        without shared nodes below them are evaluated by the callable their K object builds, and shared nodes store
+        their result in a slot of the results.
+        """
+        if node_id in self._evaluators:
+            return self._evaluators[node_id]
+        k, p, operand_ids = self._nodes[node_id]
+        if p is None:
+            evaluate = _matcher_evaluator(k.match)
+        elif not self._has_shared_operand(node_id):
+            evaluate = _matcher_evaluator(k._build_matcher(p))
+        else:
+            evaluate = _operator_evaluator(p[0], [self.evaluator(operand_id) for operand_id in operand_ids])
+        if self._is_shared(node_id):
+            evaluate = _memoized(self.num_slots, evaluate)
+            self.num_slots += 1
+        self._evaluators[node_id] = evaluate
+        return evaluate
+
+
+class KRouter(object):
+    """
+    Routes values to the targets of an ordered list of K objects, either to the target of the first K object that
+    matches or to the targets of all of them.
+
+    The patterns are combined into one graph in which equal filters and operators, such as an ['==', 'env', 'prod']
+    filter in many of the patterns, are one node. Each node used by more than one pattern or operator is evaluated at
+    most once per value and its result reused, while the parts of a pattern that share nothing are matched by the
+    callables of its K object. Filters are only combined when their K objects suppress the same errors and treat keys
+    the same way, and patterns that are profiled, reordered or deeply nested are matched on their own.
+
+    Routing a value returns the same targets as matching it against each K object in order, and raises the same
+    exceptions, since filters are evaluated in the order of their patterns.
+    """
+    def __init__(self, routes=(), default=None):
+        """
+        Builds the router from pairs of K objects and targets.
+
+        :param routes: The pairs of K objects and their targets, in the order they are matched
+        :type routes: iterable of tuple
+        :param default: The target of values that no K object matches
+        """
+        self._routes = []
+        self._default = default
+        self._evaluators = None
+        self._num_slots = 0
+        for k, target in routes:
+            self.add(k, target)
+
+    def __len__(self):
+        return len(self._routes)
+
+    def add(self, k, target):
+        """
+        Adds a K object and its target after the routes already added.
+
+        :param k: The K object that values are matched against
+        :type k: :class:`K <kmatch.K>`
+        :param target: The target of values that match the K object
+        """
+        self._routes.append((k, target))
+        self._evaluators = None
+
+    def _build(self):
+        """
+        Builds the graph of the patterns and the evaluators of the routes.
+        """
+        graph = _RouteGraph()
+        node_ids = [graph.add(k) for k, target in self._routes]
+        self._evaluators = [
+            (graph.evaluator(node_id), target) for node_id, (k, target) in zip(node_ids, self._routes)
+        ]
+        self._num_slots = graph.num_slots
+
+    def route(self, value):
+        """
+        Finds the target of the first K object that matches the value.
+
+        :param value: The value to be routed
+        :type value: dict
+        :returns: The target of the first K object that matches the value, or the default if none match
+        """
+        if self._evaluators is None:
+            self._build()
+        results = [None] * self._num_slots
+        for evaluate, target in self._evaluators:
+            if evaluate(value, results):
+                return target
+        return self._default
+
+    def route_all(self, value):
+        """
+        Finds the targets of every K object that matches the value.
+
+        :param value: The value to be routed
+        :type value: dict
+        :rtype: list
+        :returns: The targets of the K objects that match the value, in the order they were added
+        """
+        if self._evaluators is None:
+            self._build()
+        results = [None] * self._num_slots
+        return [target for evaluate, target in self._evaluators if evaluate(value, results)]
@@ -0,0 +1,151 @@
+"""
+Saves validated and compiled K objects, or a KIndex of them, in a format that loads without validating or compiling
+their patterns again. Regexes are compiled the first time they are matched, and the matcher of each K object is built
+on its first match, so loading a large rule set only costs unpickling it and rebuilding the K objects.
+"""
+import gc
+import pickle
+
+from .index import KIndex
+from .kmatch import K, _FilterValueSet, _LazyRegex, _ListKey
+
+
+# Identifies serialized rule sets and the version of their format
+_FORMAT = 'kmatch'
+_VERSION = 1
+_PROTOCOL = 4
+
+
+def dumps(rules):
+    """
+    Serializes K objects into bytes that load without validating or compiling their patterns. Compiled patterns are
+    saved as flat tuples of their filters and operators in postfix order, with filters as tuples of plain values and
+    regexes as their sources, so the format does not depend on the internals of kmatch or re.
+
+    :param rules: A K object, an iterable of K objects or a KIndex
+    :type rules: :class:`K <kmatch.K>`, iterable or :class:`KIndex <kmatch.KIndex>`
+    :rtype: bytes
+    """
+    if isinstance(rules, K):
+        kind, ks = 'k', [rules]
+    elif isinstance(rules, KIndex):
+        kind, ks = 'index', rules._patterns
+    else:
+        kind, ks = 'list', list(rules)
+
+    # K objects constructed from each other share compiled patterns, which are saved once with their field key usage
+    saved_patterns = {}
+    # Equal field key usages are saved as the same object, which pickle writes once
+    field_key_usages = {}
+    entries = []
+    for k in ks:
+        if id(k._compiled_pattern) not in saved_patterns:
+            field_key_usage = tuple(
+                (key, tuple(sorted(filter_names))) for key, filter_names in k._field_key_usage.items())
+            saved_patterns[id(k._compiled_pattern)] = (
+                tuple(_dump_filter(p) for p in k._flatten(k._compiled_pattern)),
+                field_key_usages.setdefault(field_key_usage, field_key_usage))
+        options = dict((name, value) for name, value in k._options().items() if value)
+        entries.append((options, saved_patterns[id(k._compiled_pattern)]))
+    return pickle.dumps((_FORMAT, _VERSION, kind, entries), protocol=_PROTOCOL)
+
+
+def dump(rules, file):
+    """
+    Serializes K objects into a binary file. See dumps.
+
+    :param rules: A K object, an iterable of K objects or a KIndex
+    :type rules: :class:`K <kmatch.K>`, iterable or :class:`KIndex <kmatch.KIndex>`
+    :param file: The file to write to
+    :type file: file
+    """
+    file.write(dumps(rules))
+
+
+def loads(data):
+    """
+    Loads K objects serialized by dumps, as they were serialized: a K object, a list of K objects or a KIndex.
+    Patterns are trusted to have been validated when they were serialized. Only load data from trusted sources, since
+    it is unpickled.
+
+    :param data: The serialized K objects
+    :type data: bytes
+    :returns: A K object, a list of K objects or a KIndex
+    :raises: :class:`ValueError <exceptions.ValueError>` if the data is not serialized K objects of a supported
+        version
+    """
+    return _load(pickle.loads(data))
+
+
+def load(file):
+    """
+    Loads K objects serialized by dumps from a binary file, which can also be a memory map of the file. See loads.
+
+    :param file: The file to read from
+    :type file: file
+    :returns: A K object, a list of K objects or a KIndex
+    :raises: :class:`ValueError <exceptions.ValueError>` if the file does not hold serialized K objects of a
+        supported version
+    """
+    return _load(pickle.load(file))
+
+
+def _load(data):
+    if not isinstance(data, tuple) or len(data) != 4 or data[0] != _FORMAT:
+        raise ValueError('Not serialized K objects')
+    elif data[1] != _VERSION:
+        raise ValueError('Unsupported version of serialized K objects - {0}'.format(data[1]))
+
+    # Constructing many small objects triggers cyclic garbage collections that find no garbage, and which take longer
+    # than the construction itself, so collection is paused while the K objects are built
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        ks = _load_ks(data[3])
+        loaded = ks[0] if data[2] == 'k' else KIndex(ks) if data[2] == 'index' else ks
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return loaded
+
+
+def _load_ks(entries):
+    # The compiled pattern, field key usage and field keys of each saved pattern, keyed on its id
+    loaded_patterns = {}
+    regexes = {}
+
+    def load_filter(p):
+        if isinstance(p[1], list):
+            p = (p[0], _ListKey(p[1])) + p[2:]
+        if p[0] == '=~':
+            if p[2] not in regexes:
+                regexes[p[2]] = _LazyRegex(p[2])
+            return (p[0], p[1], regexes[p[2]])
+        elif p[0] in ('in', '!in'):
+            return (p[0], p[1], _FilterValueSet(p[2]))
+        return p
+
+    ks = []
+    for options, saved_pattern in entries:
+        k = K.__new__(K)
+        k._set_options(**options)
+        # Patterns that were shared when serialized are unpickled as the same object, and are shared again
+        if id(saved_pattern) not in loaded_patterns:
+            flattened, field_key_usage = saved_pattern
+            field_key_usage = dict((key, frozenset(filter_names)) for key, filter_names in field_key_usage)
+            loaded_patterns[id(saved_pattern)] = (
+                k._unflatten([load_filter(p) for p in flattened]), field_key_usage, frozenset(field_key_usage))
+        k._compiled_pattern, field_key_usage, field_keys = loaded_patterns[id(saved_pattern)]
+        k._initialize(field_key_usage, field_keys, lazy_matcher=True)
+        ks.append(k)
+    return ks
+
+
+def _dump_filter(p):
+    if isinstance(p[1], _ListKey):
+        p = (p[0], list(p[1])) + p[2:]
+    if p[0] == '=~':
+        return (p[0], p[1], p[2].pattern)
+    elif p[0] in ('in', '!in'):
+        return (p[0], p[1], p[2].filter_values)
+    return p
@@ -0,0 +1,197 @@
+"""
+Translates kmatch patterns into parameterized SQL WHERE clauses, so rows can be filtered by the database before they
+are fetched. Parts of a pattern that can not be translated are returned as a residual K object to match the fetched
+rows with.
+"""
+from collections import namedtuple
+from math import isfinite
+import sys
+
+from .kmatch import _compile_regex
+
+
+SqlWhere = namedtuple('SqlWhere', ['where', 'params', 'residual'])
+
+_PLACEHOLDERS = {'qmark': '?', 'format': '%s'}
+_COMPARISONS = {'==': '=', '!=': '<>', '<': '<', '>': '>', '<=': '<=', '>=': '>='}
+# Filter values of these types are passed as parameters. Floats must also be finite.
+_PARAM_TYPES = (str, bytes, int, float, bool, type(None))
+
+_TRUE = '1 = 1'
+_FALSE = '1 = 0'
+
+
+class SqlTranslator(object):
+    """
+    Translates the compiled pattern of a K object into SQL. Every translated expression is True or False, never NULL,
+    so NOT and <> combine them as ! and ^ combine the results of filters. A row is taken to be a dictionary of every
+    column, with NULL as None.
+    """
+    def __init__(self, k, columns=None, regexp=False, paramstyle='qmark'):
+        if paramstyle not in _PLACEHOLDERS:
+            raise ValueError('Unsupported paramstyle - {0}'.format(paramstyle))
+        self._k = k
+        self._columns = None if columns is None else frozenset(columns)
+        self._regexp = regexp
+        self._placeholder = _PLACEHOLDERS[paramstyle]
+        self._suppresses_key_errors = k._suppress_key_errors or k._suppress_exceptions
+
+    def translate(self):
+        """
+        Translates the pattern into a WHERE clause and a residual K object. The operands of an & at the root of the
+        pattern that can not be translated are left to the residual, while any other pattern is translated whole or
+        not at all.
+
+        :rtype: SqlWhere
+        """
+        p = self._k._compiled_pattern
+        operands = self._and_operands(p)
+        translated, params, residual = [], [], []
+        for operator_or_filter in operands:
+            operand_params = []
+            sql = self._translate(operator_or_filter, operand_params)
+            if sql is None:
+                residual.append(operator_or_filter)
+            else:
+                translated.append(sql)
+                params.extend(operand_params)
+
+        where = ' AND '.join(translated) if translated else _TRUE
+        residual_k = None
+        if residual:
+            residual_k = type(self._k)(
+                self._k._decompile(residual[0] if len(residual) == 1 else ('&', tuple(residual))),
+                **dict(self._k._options(), profile=False, optimize=False))
+        return SqlWhere(where, params, residual_k)
+
+    def _and_operands(self, p):
+        """
+        Returns the operands of the & operators at the root of the compiled pattern (p), flattening nested & operators.
+        """
+        operands, stack = [], [p]
+        while stack:
+            p = stack.pop()
+            if self._k._is_operator(p) and p[0] == '&':
+                stack.extend(reversed(p[1]))
+            else:
+                operands.append(p)
+        return operands
+
+    def _translate(self, p, params):
+        """
+        Returns the SQL of the compiled pattern (p), adding its parameters to params, or None if it can not be
+        translated.
+        """
+        return self._k._fold(p, lambda p: self._translate_filter(p, params), self._translate_operator)
+
+    def _translate_operator(self, p, operands):
+        if None in operands:
+            return None
+        elif p[0] == '!':
+            return 'NOT ({0})'.format(operands[0])
+        elif p[0] == '^':
+            return '(({0}) <> ({1}))'.format(*operands)
+        elif not operands:
+            return _TRUE if p[0] == '&' else _FALSE
+        return '({0})'.format(' {0} '.format('AND' if p[0] == '&' else 'OR').join(operands))
+
+    def _translate_filter(self, p, params):
+        """
+        Returns the SQL of a filter, or None if it can not be translated.
+        """
+        if not isinstance(p[1], str) or self._k._key_path(p[1]) is not None:
+            return None
+        elif self._columns is not None and p[1] not in self._columns:
+            # Rows never have the key, so the filter raises a KeyError or does not match
+            if p[0] == '!?':
+                return _TRUE
+            return _FALSE if p[0] == '?' or self._suppresses_key_errors else None
+        elif p[0] in ('?', '!?'):
+            return _TRUE if p[0] == '?' else _FALSE
+
+        column = '"{0}"'.format(p[1].replace('"', '""'))
+        if self._placeholder == '%s':
+            # The format paramstyle reads any % in the query as the start of a placeholder
+            column = column.replace('%', '%%')
+        if p[0] in _COMPARISONS:
+            return self._translate_comparison(p[0], column, p[2], params)
+        elif p[0] in ('in', '!in'):
+            sql = self._translate_membership(column, p[2].filter_values, params)
+            return sql if sql is None or p[0] == 'in' else 'NOT ({0})'.format(sql)
+        elif self._regexp and isinstance(p[2].pattern, str):
+            params.append(p[2].pattern)
+            return '({0} IS NOT NULL AND {0} REGEXP {1})'.format(column, self._placeholder)
+        return None
+
+    def _is_param(self, filter_value):
+        return type(filter_value) in _PARAM_TYPES and (type(filter_value) is not float or isfinite(filter_value))
+
+    def _translate_comparison(self, filter_name, column, filter_value, params):
+        """
+        Returns the SQL of a comparison. None is only equal to NULL, while any other value is only equal to values
+        that are not NULL.
+        """
+        if not self._is_param(filter_value):
+            return None
+        elif filter_value is None:
+            if filter_name not in ('==', '!='):
+                return None
+            return '{0} IS {1}NULL'.format(column, '' if filter_name == '==' else 'NOT ')
+        params.append(filter_value)
+        if filter_name == '!=':
+            return '({0} IS NULL OR {0} <> {1})'.format(column, self._placeholder)
+        return '({0} IS NOT NULL AND {0} {1} {2})'.format(column, _COMPARISONS[filter_name], self._placeholder)
+
+    def _translate_membership(self, column, filter_values, params):
+        """
+        Returns the SQL of an in filter, or None if any of its filter values can not be a parameter.
+        """
+        if not all(self._is_param(filter_value) for filter_value in filter_values):
+            return None
+        values = [filter_value for filter_value in filter_values if filter_value is not None]
+        if not values:
+            return '{0} IS NULL'.format(column) if None in filter_values else _FALSE
+        params.extend(values)
+        return '({0} IS {1}NULL {2} {0} IN ({3}))'.format(
+            column, '' if None in filter_values else 'NOT ', 'OR' if None in filter_values else 'AND',
+            ', '.join([self._placeholder] * len(values)))
+
+
+def to_sql(k, columns=None, regexp=False, paramstyle='qmark'):
+    """
+    Translates the pattern of a K object into a parameterized SQL WHERE clause. The clause selects the rows of a
+    table that match the pattern, for rows where matching does not raise an exception, as long as the columns compare
+    as their Python values do. The rows it selects should then be matched with the residual K object, when there is
+    one.
+
+    :param k: The K object whose pattern is translated
+    :type k: :class:`K <kmatch.K>`
+    :param columns: The columns of the rows being matched, or None to take every key of the pattern to be a column
+    :type columns: iterable of str
+    :param regexp: Translate regex filters into the REGEXP operator, which must match as re.match does, such as the
+        REGEXP function installed by register_regexp
+    :type regexp: bool
+    :param paramstyle: The DB-API paramstyle of the placeholders, either 'qmark' or 'format', where any % in a column
+        name is doubled
+    :type paramstyle: str
+    :rtype: SqlWhere
+    :returns: A named tuple of the WHERE clause, the list of its parameters and the K object that the selected rows
+        must also match, or None when the whole pattern is translated
+    :raises: :class:`ValueError <exceptions.ValueError>` on an unsupported paramstyle
+    """
+    return SqlTranslator(k, columns=columns, regexp=regexp, paramstyle=paramstyle).translate()
+
+
+def register_regexp(connection):
+    """
+    Installs a REGEXP function in a sqlite3 connection that matches strings as regex filters do. Other values do not
+    match.
+
+    :param connection: The connection to install the function in
+    :type connection: sqlite3.Connection
+    """
+    # SQLite can only be told the function is deterministic from Python 3.8
+    options = {'deterministic': True} if sys.version_info >= (3, 8) else {}
+    connection.create_function(
+        'REGEXP', 2, lambda regex, value: isinstance(value, str) and _compile_regex(regex).match(value) is not None,
+        **options)
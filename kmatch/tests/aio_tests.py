@@ -0,0 +1,94 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+from mock import patch
+
+from kmatch import K
+
+
+VALUES = [{'n': n} for n in range(10)]
+
+
+async def async_values(values, events=None):
+    try:
+        for value in values:
+            await asyncio.sleep(0)
+            yield value
+    finally:
+        if events is not None:
+            events.append('closed')
+
+
+async def collect(async_iterable):
+    return [value async for value in async_iterable]
+
+
+class AsyncTest(TestCase):
+    """
+    Tests the afilter and amatch_many functions in K.
+    """
+    k = K(['>', 'n', 6])
+
+    def test_afilter(self):
+        self.assertEqual(asyncio.run(collect(self.k.afilter(async_values(VALUES), chunksize=3))), VALUES[7:])
+        self.assertEqual(asyncio.run(collect(self.k.afilter(async_values(VALUES), chunksize=5))), VALUES[7:])
+
+    def test_afilter_iterable(self):
+        self.assertEqual(asyncio.run(collect(self.k.afilter(iter(VALUES), chunksize=4))), VALUES[7:])
+
+    def test_amatch_many(self):
+        self.assertEqual(asyncio.run(self.k.amatch_many(async_values(VALUES), chunksize=4)), [False] * 7 + [True] * 3)
+        self.assertEqual(asyncio.run(self.k.amatch_many([])), [])
+
+    def test_matches_chunks(self):
+        with patch.object(K, 'match_many', autospec=True, side_effect=K.match_many) as mock_match_many:
+            asyncio.run(self.k.amatch_many(async_values(VALUES), chunksize=4))
+        self.assertEqual([len(call[0][1]) for call in mock_match_many.call_args_list], [4, 4, 2])
+
+    def test_yields_control_between_chunks(self):
+        events = []
+
+        async def other_task():
+            for _ in range(3):
+                events.append('other')
+                await asyncio.sleep(0)
+
+        async def main():
+            task = asyncio.ensure_future(other_task())
+            async for value in self.k.afilter(VALUES, chunksize=4):
+                events.append(value['n'])
+            await task
+
+        def match_many(k, chunk):
+            events.append('chunk')
+            return [k.match(value) for value in chunk]
+
+        with patch.object(K, 'match_many', autospec=True, side_effect=match_many):
+            asyncio.run(main())
+        self.assertEqual(events, ['chunk', 'other', 'chunk', 'other', 7, 'chunk', 'other', 8, 9])
+
+    def test_backpressure(self):
+        events = []
+
+        async def main():
+            matches = self.k.afilter(async_values(VALUES, events), chunksize=8)
+            first_match = await matches.__anext__()
+            await matches.aclose()
+            return first_match
+
+        self.assertEqual(asyncio.run(main()), VALUES[7])
+        self.assertEqual(events, ['closed'])
+
+    def test_executor(self):
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            self.assertEqual(
+                asyncio.run(collect(self.k.afilter(async_values(VALUES), chunksize=3, executor=executor))), VALUES[7:])
+            self.assertEqual(
+                asyncio.run(self.k.amatch_many(VALUES, chunksize=3, executor=executor)), [False] * 7 + [True] * 3)
+
+    def test_key_error(self):
+        with self.assertRaises(KeyError):
+            asyncio.run(self.k.amatch_many(async_values([{}])))
+        with self.assertRaises(KeyError):
+            asyncio.run(collect(self.k.afilter([{}])))
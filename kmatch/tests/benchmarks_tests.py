@@ -0,0 +1,87 @@
+from collections import OrderedDict
+from io import StringIO
+import json
+import os
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from mock import patch
+
+from kmatch.benchmarks import compare_results, run_benchmarks
+from kmatch.benchmarks.runner import main
+
+
+FAKE_BENCHMARKS = OrderedDict([
+    ('fake', lambda scale: {'time': 2.0 * scale, 'speedup': 10.0 / scale}),
+])
+
+
+class RunBenchmarksTest(TestCase):
+    """
+    Tests running the benchmarks.
+    """
+    def test_run_benchmarks(self):
+        results = run_benchmarks(
+            ['trees', 'regex', 'field_keys', 'deep_patterns', 'codegen', 'startup', 'routing', 'incremental'],
+            scale=0.001)
+        self.assertIn('trees.deep', results)
+        self.assertIn('field_keys.large', results)
+        self.assertIn('field_keys.large_cached', results)
+        self.assertIn('deep_patterns.speedup', results)
+        self.assertIn('codegen.speedup', results)
+        self.assertIn('startup.speedup', results)
+        self.assertIn('routing.first_speedup', results)
+        self.assertIn('incremental.speedup', results)
+        self.assertIn('regex.prefix', results)
+        self.assertTrue(all(result > 0 for result in results.values()))
+
+
+class CompareResultsTest(TestCase):
+    """
+    Tests comparing benchmark results to a baseline.
+    """
+    def test_compare_results(self):
+        comparisons = compare_results(
+            {'a.time': 1.2, 'b.time': 1.05, 'c.speedup': 8.0, 'd.new': 1.0},
+            {'a.time': 1.0, 'b.time': 1.0, 'c.speedup': 10.0})
+        self.assertEqual([comparison.name for comparison in comparisons], ['a.time', 'b.time', 'c.speedup'])
+        self.assertEqual([comparison.regressed for comparison in comparisons], [True, False, True])
+        self.assertAlmostEqual(comparisons[2].change, 0.2)
+
+
+@patch.dict('kmatch.benchmarks.runner.BENCHMARKS', FAKE_BENCHMARKS, clear=True)
+class MainTest(TestCase):
+    """
+    Tests the benchmark command line interface.
+    """
+    def setUp(self):
+        self.baseline_file_name = os.path.join(mkdtemp(), 'baseline.json')
+
+    def tearDown(self):
+        if os.path.exists(self.baseline_file_name):
+            os.remove(self.baseline_file_name)
+        os.rmdir(os.path.dirname(self.baseline_file_name))
+
+    def test_text_output(self):
+        stdout = StringIO()
+        self.assertEqual(main([], stdout=stdout), 0)
+        self.assertEqual(stdout.getvalue(), 'fake.speedup: 10\nfake.time: 2\n')
+
+    def test_save_and_compare(self):
+        main(['--save', self.baseline_file_name], stdout=StringIO())
+        stdout = StringIO()
+        self.assertEqual(main(['fake', '--scale', '2', '--baseline', self.baseline_file_name], stdout=stdout), 1)
+        self.assertEqual(
+            stdout.getvalue(), 'fake.speedup: 10 -> 5 (+50.0%) REGRESSED\nfake.time: 2 -> 4 (+100.0%) REGRESSED\n')
+
+    def test_json_output(self):
+        main(['--save', self.baseline_file_name], stdout=StringIO())
+        stdout = StringIO()
+        self.assertEqual(main(['--json', '--baseline', self.baseline_file_name], stdout=stdout), 0)
+        run = json.loads(stdout.getvalue())
+        self.assertEqual(run['results'], {'fake.speedup': 10.0, 'fake.time': 2.0})
+        self.assertEqual([comparison['regressed'] for comparison in run['comparisons']], [False, False])
+
+    def test_unknown_benchmark(self):
+        with patch('sys.stderr', StringIO()), self.assertRaises(SystemExit):
+            main(['unknown'])
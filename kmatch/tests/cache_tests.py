@@ -0,0 +1,83 @@
+from unittest import TestCase
+
+from kmatch import K, KCache
+from kmatch.cache import default_cache
+
+
+class KCacheTest(TestCase):
+    """
+    Tests the KCache class.
+    """
+    def test_hit(self):
+        cache = KCache()
+        k = cache.get(['&', [['==', 'f', 1], ['=~', 'g', '^a']]])
+        self.assertIs(cache.get(['&', [['==', 'f', 1], ['=~', 'g', '^a']]]), k)
+        self.assertEqual(cache.info(), (1, 1, 1024, 1))
+
+    def test_options_are_part_of_the_key(self):
+        cache = KCache()
+        k = cache.get(['==', 'f', 1])
+        suppressed_k = cache.get(['==', 'f', 1], suppress_key_errors=True)
+        self.assertIsNot(suppressed_k, k)
+        self.assertFalse(suppressed_k.match({}))
+        self.assertIs(cache.get(['==', 'f', 1], suppress_key_errors=True), suppressed_k)
+
+    def test_filter_value_types_are_part_of_the_key(self):
+        cache = KCache()
+        list_k = cache.get(['==', 'f', [1]])
+        tuple_k = cache.get(['==', 'f', (1,)])
+        self.assertIsNot(list_k, tuple_k)
+        self.assertTrue(tuple_k.match({'f': (1,)}))
+        self.assertIsNot(cache.get(['==', 'f', 1]), cache.get(['==', 'f', True]))
+        self.assertIs(cache.get(['==', 'f', {'a': {1, 2}}]), cache.get(['==', 'f', {'a': {2, 1}}]))
+
+    def test_unhashable_filter_values_are_not_cached(self):
+        class Unhashable(object):
+            __hash__ = None
+
+        cache = KCache()
+        filter_value = Unhashable()
+        k = cache.get(['==', 'f', filter_value])
+        self.assertIsNot(cache.get(['==', 'f', filter_value]), k)
+        self.assertEqual(cache.info(), (0, 2, 1024, 0))
+
+    def test_invalid_pattern(self):
+        cache = KCache()
+        with self.assertRaises(ValueError):
+            cache.get(['invalid'])
+        self.assertEqual(cache.info().currsize, 0)
+
+    def test_lru_eviction(self):
+        cache = KCache(maxsize=2)
+        k1 = cache.get(['?', 'a'])
+        cache.get(['?', 'b'])
+        self.assertIs(cache.get(['?', 'a']), k1)
+        cache.get(['?', 'c'])
+        self.assertEqual(cache.info(), (1, 3, 2, 2))
+        self.assertIs(cache.get(['?', 'a']), k1)
+        cache.get(['?', 'b'])
+        self.assertEqual(cache.info(), (2, 4, 2, 2))
+
+    def test_deep_pattern(self):
+        def deep_pattern():
+            pattern = ['==', 'f', [1]]
+            for _ in range(5000):
+                pattern = ['!', ['&', [['?', 'g'], pattern]]]
+            return pattern
+
+        cache = KCache()
+        k = cache.get(deep_pattern())
+        self.assertIs(cache.get(deep_pattern()), k)
+        self.assertTrue(k.match({'f': [1]}))
+
+    def test_clear(self):
+        cache = KCache()
+        cache.get(['?', 'a'])
+        cache.clear()
+        self.assertEqual(cache.info(), (0, 0, 1024, 0))
+
+    def test_k_cached(self):
+        default_cache.clear()
+        k = K.cached(['>', 'f', 1], suppress_exceptions=True)
+        self.assertIs(K.cached(['>', 'f', 1], suppress_exceptions=True), k)
+        self.assertEqual(default_cache.info().hits, 1)
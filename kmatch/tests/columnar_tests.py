@@ -0,0 +1,169 @@
+from random import Random
+from unittest import TestCase, skipIf
+
+from kmatch import K
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+def rows_from_columns(columns, num_rows):
+    """
+    Builds the dictionary K.match sees for each row, leaving out masked values.
+    """
+    rows = []
+    for i in range(num_rows):
+        row = {}
+        for key, column in columns.items():
+            if not np.ma.getmaskarray(column)[i]:
+                row[key] = column[i]
+        rows.append(row)
+    return rows
+
+
+def match_or_error(match, value):
+    try:
+        return match(value)
+    except (KeyError, TypeError) as e:
+        return type(e)
+
+
+@skipIf(np is None, 'NumPy is not installed')
+class MatchColumnsTest(TestCase):
+    """
+    Tests the match_columns function in K.
+    """
+    def assertMatchesRows(self, k, columns):
+        num_rows = len(next(iter(columns.values())))
+        rows = rows_from_columns(dict((key, np.ma.asanyarray(column)) for key, column in columns.items()), num_rows)
+        expected = [match_or_error(k.match, row) for row in rows]
+        if KeyError in expected or TypeError in expected:
+            with self.assertRaises((KeyError, TypeError)):
+                k.match_columns(columns)
+        else:
+            self.assertEqual(k.match_columns(columns).tolist(), [bool(result) for result in expected])
+
+    def test_comparisons(self):
+        columns = {'f': np.array([1, 5, 10])}
+        self.assertEqual(K(['==', 'f', 5]).match_columns(columns).tolist(), [False, True, False])
+        self.assertEqual(K(['!=', 'f', 5]).match_columns(columns).tolist(), [True, False, True])
+        self.assertEqual(K(['<', 'f', 5]).match_columns(columns).tolist(), [True, False, False])
+        self.assertEqual(K(['>', 'f', 5]).match_columns(columns).tolist(), [False, False, True])
+        self.assertEqual(K(['<=', 'f', 5]).match_columns(columns).tolist(), [True, True, False])
+        self.assertEqual(K(['>=', 'f', 5]).match_columns(columns).tolist(), [False, True, True])
+
+    def test_lists_of_values(self):
+        self.assertEqual(K(['==', 'f', 'a']).match_columns({'f': ['a', 1, None]}).tolist(), [True, False, False])
+
+    def test_list_filter_value(self):
+        self.assertEqual(K(['==', 'f', [1, 2]]).match_columns({'f': [[1, 2], [1]]}).tolist(), [True, False])
+
+    def test_filter_value_without_vectorized_comparison(self):
+        class Opaque(object):
+            # Opts out of NumPy's ufuncs, so comparing it to an array gives a single result
+            __array_ufunc__ = None
+
+            def __eq__(self, other):
+                return not isinstance(other, np.ndarray) and other == 1
+
+        self.assertEqual(K(['==', 'f', Opaque()]).match_columns({'f': np.array([1, 2])}).tolist(), [True, False])
+
+    def test_membership(self):
+        columns = {'f': np.array([1, 5, 10]), 'g': np.array(['a', 'b', 'c']), 'h': [1, 'a', [1]]}
+        self.assertEqual(K(['in', 'f', [5, 10.0]]).match_columns(columns).tolist(), [False, True, True])
+        self.assertEqual(K(['!in', 'f', [5, 10]]).match_columns(columns).tolist(), [True, False, False])
+        self.assertEqual(K(['in', 'g', ['a', 'c']]).match_columns(columns).tolist(), [True, False, True])
+        self.assertEqual(K(['in', 'g', ['a', 1]]).match_columns(columns).tolist(), [True, False, False])
+        self.assertEqual(K(['in', 'h', ['a', [1]]]).match_columns(columns).tolist(), [False, True, True])
+        self.assertEqual(K(['in', 'f', ['a']]).match_columns(columns).tolist(), [False, False, False])
+
+    def test_regex(self):
+        k = K(['=~', 'f', '^hi'])
+        self.assertEqual(k.match_columns({'f': np.array(['hi there', 'oh hi'])}).tolist(), [True, False])
+        self.assertEqual(k.match_columns({'f': ['hi', None]}).tolist(), [True, False])
+
+    def test_operators(self):
+        columns = {'f': np.array([1, 5, 10]), 'g': np.array(['a', 'b', 'c'])}
+        self.assertEqual(
+            K(['&', [['>', 'f', 1], ['!=', 'g', 'c']]]).match_columns(columns).tolist(), [False, True, False])
+        self.assertEqual(
+            K(['|', [['>', 'f', 5], ['==', 'g', 'a']]]).match_columns(columns).tolist(), [True, False, True])
+        self.assertEqual(K(['!', ['>', 'f', 1]]).match_columns(columns).tolist(), [True, False, False])
+        self.assertEqual(
+            K(['^', [['>', 'f', 1], ['==', 'g', 'c']]]).match_columns(columns).tolist(), [False, True, False])
+
+    def test_key_filters(self):
+        columns = {'f': np.ma.array([1, 2], mask=[False, True])}
+        self.assertEqual(K(['?', 'f']).match_columns(columns).tolist(), [True, False])
+        self.assertEqual(K(['!?', 'f']).match_columns(columns).tolist(), [False, True])
+        self.assertEqual(K(['?', 'g']).match_columns(columns).tolist(), [False, False])
+        self.assertEqual(K(['!?', 'g']).match_columns(columns).tolist(), [True, True])
+
+    def test_missing_column(self):
+        columns = {'f': np.array([1, 2])}
+        with self.assertRaises(KeyError):
+            K(['==', 'g', 1]).match_columns(columns)
+        self.assertEqual(K(['==', 'g', 1], suppress_key_errors=True).match_columns(columns).tolist(), [False, False])
+
+    def test_masked_values(self):
+        columns = {'f': np.ma.array([1, 2, 3], mask=[False, True, False])}
+        with self.assertRaises(KeyError):
+            K(['>=', 'f', 1]).match_columns(columns)
+        self.assertEqual(
+            K(['>=', 'f', 1], suppress_key_errors=True).match_columns(columns).tolist(), [True, False, True])
+
+    def test_short_circuit_skips_missing(self):
+        columns = {'f': np.array([1, 2])}
+        self.assertEqual(K(['&', [['==', 'f', 3], ['==', 'g', 1]]]).match_columns(columns).tolist(), [False, False])
+        self.assertEqual(K(['|', [['<', 'f', 3], ['==', 'g', 1]]]).match_columns(columns).tolist(), [True, True])
+
+    def test_type_errors(self):
+        columns = {'f': [1, None, 'a']}
+        with self.assertRaises(TypeError):
+            K(['>=', 'f', 1]).match_columns(columns)
+        self.assertEqual(
+            K(['>=', 'f', 1], suppress_exceptions=True).match_columns(columns).tolist(), [True, False, False])
+        self.assertEqual(
+            K(['<', 'f', 1], suppress_exceptions=True).match_columns({'f': np.array(['a'])}).tolist(), [False])
+
+    def test_structured_array(self):
+        data = np.array([(1, 2.0), (3, 4.0)], dtype=[('a', int), ('b', float)])
+        self.assertEqual(K(['&', [['>', 'a', 1], ['<', 'b', 5]]]).match_columns(data).tolist(), [False, True])
+
+    def test_empty(self):
+        self.assertEqual(K(['?', 'f']).match_columns({}).tolist(), [])
+        self.assertEqual(K(['==', 'f', 1]).match_columns({'f': []}).tolist(), [])
+
+    def test_mismatched_lengths(self):
+        with self.assertRaises(ValueError):
+            K(['?', 'f']).match_columns({'f': [1], 'g': [1, 2]})
+
+    def test_deep_pattern(self):
+        pattern = ['>', 'f', 1]
+        for _ in range(5000):
+            pattern = ['!', ['&', [['?', 'f'], pattern]]]
+        self.assertMatchesRows(K(pattern), {'f': np.array([1, 5, 10])})
+
+    def test_agrees_with_match(self):
+        random = Random(0)
+        patterns = [
+            ['&', [['?', 'a'], ['>', 'a', 3], ['|', [['==', 'b', 'x'], ['<=', 'c', 0.5]]]]],
+            ['|', [['!', ['>=', 'a', 5]], ['^', [['!?', 'b'], ['=~', 'b', '^y']]]]],
+            ['|', [['==', 'b', None], ['!=', 'c', 0.25], ['<', 'a', 2]]],
+            ['|', [['in', 'a', [1, 2, 3]], ['!in', 'b', ['x']], ['in', 'c', [0.25, 'w']]]],
+        ]
+        for _ in range(20):
+            num_rows = 50
+            columns = {
+                'a': np.ma.array([random.randint(0, 9) for _ in range(num_rows)],
+                                 mask=[random.random() < 0.2 for _ in range(num_rows)]),
+                'b': np.ma.array([random.choice(['x', 'y', 'z']) for _ in range(num_rows)],
+                                 mask=[random.random() < 0.2 for _ in range(num_rows)]),
+                'c': [random.choice([0.25, 0.75, None, 'w']) for _ in range(num_rows)],
+            }
+            for pattern in patterns:
+                self.assertMatchesRows(K(pattern, suppress_key_errors=True), columns)
+                self.assertMatchesRows(K(pattern, suppress_exceptions=True), columns)
+                self.assertMatchesRows(K(pattern), columns)
@@ -0,0 +1,107 @@
+from random import Random
+import tracemalloc
+from unittest import TestCase
+
+from kmatch import K
+from kmatch.explain import Explanation, FilterTrace
+from kmatch.tests.kmatch_tests import match_or_error, random_options, random_pattern, random_value
+from kmatch.tests.router_tests import LookupCountingDict
+
+
+class ExplainTest(TestCase):
+    """
+    Tests the explain function in K.
+    """
+    def test_filter(self):
+        explanation = K(['==', 'f', 1]).explain({'f': 1})
+        self.assertEqual(explanation, Explanation(True, [FilterTrace((), ['==', 'f', 1], True, None)]))
+        self.assertEqual(str(explanation), "['==', 'f', 1] at () is True")
+
+    def test_and_stops_at_deciding_operand(self):
+        k = K(['&', [['==', 'a', 1], ['>', 'b', 1], ['?', 'c']]])
+        value = LookupCountingDict({'a': 1, 'b': 0})
+        explanation = k.explain(value)
+        self.assertFalse(explanation.result)
+        self.assertEqual([filter_trace.path for filter_trace in explanation.filters], [(1,)])
+        self.assertNotIn('c', value.lookups)
+        explanation = k.explain({'a': 1, 'b': 2, 'c': 3})
+        self.assertTrue(explanation.result)
+        self.assertEqual([filter_trace.path for filter_trace in explanation.filters], [(0,), (1,), (2,)])
+
+    def test_or(self):
+        k = K(['|', [['==', 'a', 1], ['&', [['?', 'b'], ['!?', 'c']]]]])
+        explanation = k.explain({'a': 2, 'b': 1})
+        self.assertTrue(explanation.result)
+        self.assertEqual([filter_trace.path for filter_trace in explanation.filters], [(1, 0), (1, 1)])
+        explanation = k.explain({'a': 2, 'c': 1})
+        self.assertFalse(explanation.result)
+        self.assertEqual([filter_trace.pattern for filter_trace in explanation.filters], [['==', 'a', 1], ['?', 'b']])
+
+    def test_not_and_xor(self):
+        k = K(['^', [['!', ['==', 'a', 1]], ['?', 'b']]])
+        explanation = k.explain({'a': 1, 'b': 1})
+        self.assertTrue(explanation.result)
+        self.assertEqual(explanation.filters, [
+            FilterTrace((0, 0), ['==', 'a', 1], True, None), FilterTrace((1,), ['?', 'b'], True, None)])
+        self.assertFalse(k.explain({'a': 2, 'b': 1}).result)
+
+    def test_empty_operators(self):
+        self.assertEqual(K(['&', []]).explain({}), Explanation(True, []))
+        self.assertEqual(K(['|', []]).explain({}), Explanation(False, []))
+
+    def test_suppressed_errors(self):
+        k = K(['|', [['>', 'a', 1], ['=~', 'b.c', '^x']]], suppress_exceptions=True, nested_keys=True)
+        explanation = k.explain({'a': 'x', 'b': {'c': 'xy'}})
+        self.assertTrue(explanation.result)
+        explanation = k.explain({'a': 'x'})
+        self.assertFalse(explanation.result)
+        self.assertIsInstance(explanation.filters[0].error, TypeError)
+        self.assertIsInstance(explanation.filters[1].error, KeyError)
+        self.assertIn('(suppressed KeyError', str(explanation))
+
+    def test_unsuppressed_errors(self):
+        with self.assertRaises(KeyError):
+            K(['==', 'f', 1]).explain({})
+
+    def test_deep_pattern(self):
+        p = ['==', 'f', 1]
+        for _ in range(5000):
+            p = ['!', p]
+        explanation = K(p).explain({'f': 1})
+        self.assertTrue(explanation.result)
+        self.assertEqual(explanation.filters[0].path, (0,) * 5000)
+
+    def test_deep_pattern_memory(self):
+        p = ['==', 'f', 1]
+        for _ in range(5000):
+            p = ['!', p]
+        k = K(p)
+        tracemalloc.start()
+        try:
+            k.explain({'f': 1})
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        # Only the path of the traced filter is built, instead of a path for every operator on the stack
+        self.assertLess(peak, 10 * 1000 * 1000)
+
+    def test_agrees_with_match(self):
+        random = Random(0)
+        for _ in range(300):
+            kwargs = random_options(random)
+            try:
+                k = K(random_pattern(random), **kwargs)
+            except ValueError:
+                # Regex filters on filter values that aren't strings
+                continue
+            for _ in range(10):
+                value = random_value(random)
+                result = match_or_error(k, value)
+                try:
+                    explanation = k.explain(value)
+                except (KeyError, TypeError) as error:
+                    self.assertEqual(type(error), result)
+                else:
+                    self.assertEqual(explanation.result, result)
+                    self.assertTrue(all(K(filter_trace.pattern, **kwargs).match(value) is filter_trace.result
+                                        for filter_trace in explanation.filters))
@@ -0,0 +1,126 @@
+from random import Random
+from unittest import TestCase
+
+from kmatch import K, KRecordMatcher
+from kmatch.tests.kmatch_tests import match_or_error, random_options, random_pattern, random_value
+from kmatch.tests.router_tests import LookupCountingDict
+
+
+def update_or_error(matcher, changed_keys):
+    """
+    Returns the K objects that match after an update, or the type of the exception raised.
+    """
+    try:
+        return matcher.update(changed_keys)
+    except (KeyError, TypeError) as error:
+        return type(error)
+
+
+class KRecordMatcherTest(TestCase):
+    """
+    Tests the KRecordMatcher class.
+    """
+    def test_update(self):
+        k1, k2 = K(['>', 'a', 1]), K(['&', [['?', 'b'], ['<', 'a', 5]]])
+        record = {'a': 3}
+        matcher = KRecordMatcher([k1, k2], record)
+        self.assertEqual(len(matcher), 2)
+        self.assertIs(matcher.record, record)
+        self.assertEqual(matcher.matches(), [k1])
+        record['b'] = 1
+        self.assertEqual(matcher.update(['b']), [k1, k2])
+        record['a'] = 0
+        self.assertEqual(matcher.update({'a'}), [k2])
+        del record['b']
+        self.assertEqual(matcher.update(['b', 'unused']), [])
+
+    def test_only_changed_keys_are_evaluated(self):
+        k = K(['&', [['==', 'a', 1], ['|', [['==', 'b', 1], ['==', 'c', 1]]], ['!', ['==', 'd', 1]]]])
+        record = LookupCountingDict({'a': 1, 'b': 2, 'c': 1, 'd': 2})
+        matcher = KRecordMatcher([k], record)
+        self.assertEqual(matcher.matches(), [k])
+        record.lookups.clear()
+        record['d'] = 1
+        self.assertEqual(matcher.update(['d']), [])
+        self.assertEqual(dict(record.lookups), {'d': 1})
+        record.lookups.clear()
+        record['b'] = 1
+        self.assertEqual(matcher.update(['b']), [])
+        self.assertEqual(dict(record.lookups), {'b': 1})
+
+    def test_skipped_operands_are_evaluated_when_needed(self):
+        k = K(['&', [['==', 'a', 1], ['==', 'b', 1]]])
+        record = LookupCountingDict({'a': 0, 'b': 1})
+        matcher = KRecordMatcher([k], record)
+        self.assertNotIn('b', record.lookups)
+        record['a'] = 1
+        self.assertEqual(matcher.update(['a']), [k])
+        self.assertEqual(record.lookups['b'], 1)
+
+    def test_update_everything(self):
+        k = K(['==', 'a', 1])
+        record = {'a': 0}
+        matcher = KRecordMatcher([k], record)
+        record['a'] = 1
+        self.assertEqual(matcher.update([]), [])
+        self.assertEqual(matcher.update(), [k])
+
+    def test_nested_keys(self):
+        k = K(['==', 'user.name', 'x'], nested_keys=True, suppress_key_errors=True)
+        record = {'user': {'name': 'y'}}
+        matcher = KRecordMatcher([k], record)
+        record['user']['name'] = 'x'
+        self.assertEqual(matcher.update(['user']), [k])
+
+    def test_errors(self):
+        k = K(['|', [['==', 'a', 1], ['==', 'b', 1]]])
+        record = {'a': 0, 'b': 0}
+        matcher = KRecordMatcher([k], record)
+        del record['b']
+        with self.assertRaises(KeyError):
+            matcher.update(['b'])
+        record['b'] = 1
+        self.assertEqual(matcher.update(['b']), [k])
+        with self.assertRaises(KeyError):
+            KRecordMatcher([k], {})
+
+    def test_deep_pattern(self):
+        p = ['==', 'a', 1]
+        for _ in range(5000):
+            p = ['!', p]
+        record = {'a': 1}
+        matcher = KRecordMatcher([K(p)], record)
+        self.assertEqual(len(matcher.matches()), 1)
+        record['a'] = 2
+        self.assertEqual(matcher.update(['a']), [])
+
+    def test_agrees_with_match(self):
+        random = Random(0)
+        for _ in range(200):
+            kwargs = random_options(random)
+            try:
+                k = K(random_pattern(random), **kwargs)
+            except ValueError:
+                # Regex filters on filter values that aren't strings
+                continue
+            record = {}
+            matcher = None
+            for _ in range(10):
+                changed_value = random_value(random)
+                changed_keys = [key for key in 'abc' if random.random() < 0.5]
+                for key in changed_keys:
+                    if key in changed_value:
+                        record[key] = changed_value[key]
+                    else:
+                        record.pop(key, None)
+                result = match_or_error(k, record)
+                if matcher is None:
+                    try:
+                        matcher = KRecordMatcher([k], record)
+                    except (KeyError, TypeError) as error:
+                        self.assertEqual(type(error), result)
+                        continue
+                    matches = matcher.matches()
+                else:
+                    matches = update_or_error(matcher, changed_keys)
+                self.assertEqual(matches, result if result not in (True, False) else [k] * result)
@@ -0,0 +1,119 @@
+from random import Random
+from unittest import TestCase
+
+from kmatch import K, KIndex
+
+
+class KIndexTest(TestCase):
+    """
+    Tests the KIndex class.
+    """
+    def test_empty(self):
+        index = KIndex()
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.match({'f': 1}), [])
+
+    def test_equal_filters(self):
+        k1, k2, k3 = K(['==', 'f', 1]), K(['==', 'f', 2]), K(['==', 'g', 1])
+        index = KIndex([k1, k2, k3])
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.match({'f': 1, 'g': 2}), [k1])
+        self.assertEqual(index.match({'f': 2, 'g': 1}), [k2, k3])
+        self.assertEqual(index.match({}), [])
+
+    def test_equal_filter_unhashable_values(self):
+        k1, k2 = K(['==', 'f', [1]]), K(['==', 'f', 1])
+        index = KIndex([k1, k2])
+        self.assertEqual(index.match({'f': [1]}), [k1])
+        self.assertEqual(index.match({'f': 1}), [k2])
+
+    def test_membership_filters(self):
+        k_in, k_empty, k_not_in = K(['in', 'f', [1, 'a']]), K(['in', 'f', []]), K(['!in', 'f', [1]])
+        k_unhashable = K(['in', 'f', [[1], 2]])
+        k_and = K(['&', [['?', 'g'], ['in', 'f', []]]])
+        index = KIndex([k_in, k_empty, k_not_in, k_unhashable, k_and])
+        self.assertEqual(index.match({'f': 1}), [k_in])
+        self.assertEqual(index.match({'f': 'a', 'g': 1}), [k_in, k_not_in])
+        self.assertEqual(index.match({'f': [1]}), [k_not_in, k_unhashable])
+
+    def test_range_filters(self):
+        k_gt, k_gte, k_lt, k_lte = K(['>', 'f', 5]), K(['>=', 'f', 5]), K(['<', 'f', 5]), K(['<=', 'f', 5])
+        k_str = K(['>', 'f', 'm'])
+        index = KIndex([k_gt, k_gte, k_lt, k_lte, k_str])
+        self.assertEqual(index.match({'f': 5}), [k_gte, k_lte])
+        self.assertEqual(index.match({'f': 6.5}), [k_gt, k_gte])
+        self.assertEqual(index.match({'f': 4}), [k_lt, k_lte])
+        # The number filters would raise a TypeError for a string, and are skipped instead
+        self.assertEqual(index.match({'f': 'z'}), [k_str])
+
+    def test_range_filters_unordered_values(self):
+        k1, k2 = K(['>', 'f', float('nan')], suppress_exceptions=True), K(['<', 'f', 5], suppress_exceptions=True)
+        index = KIndex([k1, k2])
+        self.assertEqual(index.match({'f': None}), [])
+        self.assertEqual(index.match({'f': 1}), [k2])
+
+    def test_range_filters_added_after_match(self):
+        index = KIndex([K(['>', 'f', 5])])
+        self.assertEqual(len(index.match({'f': 6})), 1)
+        index.add(K(['>', 'f', 0]))
+        self.assertEqual(len(index.match({'f': 6})), 2)
+
+    def test_key_filters(self):
+        k_present, k_absent, k_regex = K(['?', 'f']), K(['!?', 'f']), K(['=~', 'f', '^a'])
+        index = KIndex([k_present, k_absent, k_regex])
+        self.assertEqual(index.match({'f': 'abc'}), [k_present, k_regex])
+        self.assertEqual(index.match({'g': 'abc'}), [k_absent])
+
+    def test_operators(self):
+        k_and = K(['&', [['!', ['==', 'g', 1]], ['>', 'f', 1], ['==', 'h', 'x']]], suppress_key_errors=True)
+        k_or = K(['|', [['==', 'f', 1], ['?', 'g']]], suppress_key_errors=True)
+        k_or_unindexed = K(['|', [['==', 'f', 1], ['!?', 'g']]], suppress_key_errors=True)
+        k_and_unindexed = K(['&', [['!?', 'g'], ['^', [['?', 'f'], ['?', 'h']]]]])
+        index = KIndex([k_and, k_or, k_or_unindexed, k_and_unindexed])
+        self.assertEqual(index.match({'f': 2, 'h': 'x'}), [k_and, k_or_unindexed])
+        self.assertEqual(index.match({'f': 1}), [k_or, k_or_unindexed, k_and_unindexed])
+        self.assertEqual(index.match({'g': 1}), [k_or])
+
+    def test_nested_keys_are_not_indexed(self):
+        k_nested = K(['==', 'a.b', 1], nested_keys=True, suppress_key_errors=True)
+        k_and = K(['&', [['==', 'a.b', 1], ['==', 'c', 1]]], nested_keys=True, suppress_key_errors=True)
+        index = KIndex([k_nested, k_and])
+        self.assertEqual(index.match({'a': {'b': 1}, 'c': 1}), [k_nested, k_and])
+        self.assertEqual(index.match({'a': {'b': 1}}), [k_nested])
+
+    def test_deep_pattern(self):
+        pattern = ['==', 'f', 1]
+        for _ in range(5000):
+            pattern = ['&', [['?', 'g'], ['|', [['==', 'h', 1], pattern]]]]
+        k = K(pattern)
+        index = KIndex([k])
+        self.assertEqual(index.match({'g': 1, 'h': 1}), [k])
+        self.assertEqual(index.match({'f': 1}), [])
+
+    def test_agrees_with_match(self):
+        random = Random(0)
+        keys = ['a', 'b', 'c', 'd']
+        filter_values = [0, 1, 2, 3, 'x', 'y', None]
+
+        def random_pattern(depth):
+            choice = random.randint(0, 10 if depth < 3 else 5)
+            if choice == 10:
+                return [random.choice(['in', '!in']), random.choice(keys), random.sample(filter_values, 2)]
+            elif choice < 4:
+                return [random.choice(['==', '!=', '<', '<=', '>', '>=']), random.choice(keys),
+                        random.choice(filter_values)]
+            elif choice == 4:
+                return ['?', random.choice(keys)]
+            elif choice == 5:
+                return ['!?', random.choice(keys)]
+            elif choice == 6:
+                return ['!', random_pattern(depth + 1)]
+            elif choice == 7:
+                return ['^', [random_pattern(depth + 1), random_pattern(depth + 1)]]
+            return [random.choice('&|'), [random_pattern(depth + 1) for _ in range(random.randint(1, 4))]]
+
+        patterns = [K(random_pattern(0), suppress_exceptions=True) for _ in range(300)]
+        index = KIndex(patterns)
+        for _ in range(300):
+            value = dict((key, random.choice(filter_values)) for key in keys if random.random() < 0.7)
+            self.assertEqual(index.match(value), [k for k in patterns if k.match(value)])
@@ -0,0 +1,157 @@
+from io import BytesIO
+import json
+import os
+from random import Random
+from tempfile import NamedTemporaryFile
+from unittest import TestCase
+
+from mock import patch
+
+from kmatch import K
+from kmatch.jsonl import filter_jsonl, filter_jsonl_file, main
+
+
+LINES = [
+    b'{"status": "error", "n": 3}\n',
+    b'{"status": "ok", "n": 5}\n',
+    b'\n',
+    b'{"n": 9, "path": "/a/b"}\n',
+    b'{"status": "caf\\u00e9", "n": 1}\n',
+]
+
+
+class FilterJsonlTest(TestCase):
+    """
+    Tests the filter_jsonl and filter_jsonl_file functions.
+    """
+    def test_filter(self):
+        k = K(['>', 'n', 4], suppress_key_errors=True)
+        self.assertEqual(list(filter_jsonl(k, LINES)), [LINES[1], LINES[3]])
+
+    def test_lines_are_unchanged(self):
+        line = b'{"n":   5,"z": 1.50}'
+        self.assertEqual(list(filter_jsonl(K(['==', 'n', 5]), [line])), [line])
+
+    def test_prefilter_skips_decoding(self):
+        k = K(['&', [['==', 'status', 'error'], ['?', 'n']]], suppress_key_errors=True)
+        with patch('kmatch.jsonl.json.loads', wraps=json.loads) as mock_loads:
+            self.assertEqual(list(filter_jsonl(k, LINES)), [LINES[0]])
+        self.assertEqual(mock_loads.call_count, 1)
+
+    def test_prefilter_or(self):
+        k = K(['|', [['==', 'status', 'ok'], ['&', [['>', 'n', 8], ['==', 'path', '/a/b']]]]], suppress_exceptions=True)
+        with patch('kmatch.jsonl.json.loads', wraps=json.loads) as mock_loads:
+            self.assertEqual(list(filter_jsonl(k, LINES)), [LINES[1], LINES[3]])
+        # The path's filter value contains a slash, so only its key is required
+        self.assertEqual(mock_loads.call_count, 2)
+
+    def test_prefilter_membership(self):
+        k = K(['in', 'status', ['ok', 'error']], suppress_key_errors=True)
+        with patch('kmatch.jsonl.json.loads', wraps=json.loads) as mock_loads:
+            self.assertEqual(list(filter_jsonl(k, LINES)), [LINES[0], LINES[1]])
+        self.assertEqual(mock_loads.call_count, 2)
+        k = K(['in', 'status', ['ok', 1]], suppress_key_errors=True)
+        self.assertEqual(list(filter_jsonl(k, LINES)), [LINES[1]])
+
+    def test_prefilter_escaped_strings(self):
+        k = K(['==', 'status', 'café'], suppress_key_errors=True)
+        self.assertEqual(list(filter_jsonl(k, LINES)), [LINES[4]])
+
+    def test_prefilter_needs_suppressed_key_errors(self):
+        with self.assertRaises(KeyError):
+            list(filter_jsonl(K(['==', 'status', 'ok']), LINES))
+
+    def test_prefilter_unindexed_operators(self):
+        k = K(['|', [['!', ['==', 'status', 'ok']], ['!?', 'n']]], suppress_key_errors=True)
+        self.assertEqual(list(filter_jsonl(k, LINES)), [LINES[0], LINES[3], LINES[4]])
+        k = K(['|', [['!?', 'status'], ['==', 'status', 'ok']]], suppress_key_errors=True)
+        self.assertEqual(list(filter_jsonl(k, LINES)), [LINES[1], LINES[3]])
+
+    def test_prefilter_nested_keys(self):
+        k = K(['==', 'a.b', 'x'], suppress_key_errors=True, nested_keys=True)
+        self.assertEqual(list(filter_jsonl(k, [b'{"a": {"b": "x"}}', b'{"a.b": "x"}'])), [b'{"a": {"b": "x"}}'])
+
+    def test_deep_pattern(self):
+        pattern = ['==', 'status', 'ok']
+        for _ in range(5000):
+            pattern = ['&', [['?', 'n'], ['|', [['==', 'status', 'ok'], pattern]]]]
+        k = K(pattern, suppress_key_errors=True)
+        self.assertEqual(list(filter_jsonl(k, LINES)), list(filter_jsonl(k, LINES, prefilter=False)))
+
+    def test_agrees_without_prefilter(self):
+        random = Random(0)
+        lines = [
+            json.dumps(dict((key, random.choice(['x', 'y', 1, None])) for key in 'abc' if random.random() < 0.6))
+            .encode('utf-8')
+            for _ in range(200)
+        ]
+        for pattern in [
+            ['&', [['==', 'a', 'x'], ['|', [['==', 'b', 'y'], ['>', 'c', 0]]]]],
+            ['|', [['==', 'a', 'x'], ['?', 'b']]],
+            ['^', [['==', 'a', 'x'], ['==', 'b', 'x']]],
+        ]:
+            k = K(pattern, suppress_exceptions=True)
+            self.assertEqual(list(filter_jsonl(k, lines)), list(filter_jsonl(k, lines, prefilter=False)))
+
+    def test_filter_file(self):
+        outfile = BytesIO()
+        num_matches = filter_jsonl_file(K(['<', 'n', 6], suppress_key_errors=True), BytesIO(b''.join(LINES)), outfile,
+                                        chunk_size=16)
+        self.assertEqual(num_matches, 3)
+        self.assertEqual(outfile.getvalue(), LINES[0] + LINES[1] + LINES[4])
+
+    def test_filter_file_without_final_newline(self):
+        outfile = BytesIO()
+        filter_jsonl_file(K(['?', 'n']), BytesIO(b'{"n": 1}\n{"n": 2}'), outfile)
+        self.assertEqual(outfile.getvalue(), b'{"n": 1}\n{"n": 2}\n')
+
+
+class MainTest(TestCase):
+    """
+    Tests the command line interface.
+    """
+    def test_stdin(self):
+        stdout = BytesIO()
+        main(['["==", "status", "ok"]', '-k'], stdin=BytesIO(b''.join(LINES)), stdout=stdout)
+        self.assertEqual(stdout.getvalue(), LINES[1])
+
+    def test_files(self):
+        with NamedTemporaryFile(delete=False) as jsonl_file:
+            jsonl_file.write(b''.join(LINES))
+        try:
+            stdout = BytesIO()
+            main(['[">", "n", 4]', jsonl_file.name, '-', '-e', '--no-prefilter'], stdin=BytesIO(LINES[1]),
+                 stdout=stdout)
+            self.assertEqual(stdout.getvalue(), LINES[1] + LINES[3] + LINES[1])
+        finally:
+            os.remove(jsonl_file.name)
+
+    def test_files_without_final_newline(self):
+        file_names = []
+        try:
+            for contents in [b'{"a": 1}', b'{"a": 2}\n', b'{"a": 0}\n{"a": 3}']:
+                with NamedTemporaryFile(delete=False) as jsonl_file:
+                    jsonl_file.write(contents)
+                file_names.append(jsonl_file.name)
+            stdout = BytesIO()
+            main(['[">", "a", 0]'] + file_names, stdout=stdout)
+            self.assertEqual(stdout.getvalue(), b'{"a": 1}\n{"a": 2}\n{"a": 3}\n')
+        finally:
+            for file_name in file_names:
+                os.remove(file_name)
+
+    def test_nested_keys(self):
+        stdout = BytesIO()
+        main(['["==", "a.b", 1]', '--nested-keys', '-e'], stdin=BytesIO(b'{"a": {"b": 1}}\n{"a": 1}\n'), stdout=stdout)
+        self.assertEqual(stdout.getvalue(), b'{"a": {"b": 1}}\n')
+
+    def test_module(self):
+        from kmatch import __main__
+        self.assertIs(__main__.main, main)
+
+    def test_default_streams(self):
+        with patch('kmatch.jsonl.sys') as mock_sys:
+            mock_sys.stdin.buffer = BytesIO(LINES[0])
+            mock_sys.stdout.buffer = BytesIO()
+            main(['["?", "status"]'])
+        self.assertEqual(mock_sys.stdout.buffer.getvalue(), LINES[0])
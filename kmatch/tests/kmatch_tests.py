@@ -1,8 +1,57 @@
+import pickle
+import re
 from sys import version
+from threading import Thread
 from unittest import TestCase
 from mock import patch
+from random import Random
 
 from kmatch import K
+from kmatch.kmatch import _compile_regex
+
+
+def random_pattern(random, depth=0):
+    """
+    Returns a random pattern with every operator and most filters, on the keys a and b and the nested keys c.d and c.e.
+    """
+    keys = ['a', 'b', 'c.d', 'c.e']
+    choice = random.randint(0, 9 if depth < 4 else 5)
+    if choice < 4:
+        return [random.choice(['==', '!=', '<', '=~', 'in']), random.choice(keys),
+                random.choice([0, 1, 1.5, 'x', None]) if choice else [0, 'x']]
+    elif choice == 4:
+        return ['?', random.choice(keys)]
+    elif choice == 5:
+        return ['!?', random.choice(keys)]
+    elif choice == 6:
+        return ['!', random_pattern(random, depth + 1)]
+    elif choice == 7:
+        return ['^', [random_pattern(random, depth + 1), random_pattern(random, depth + 1)]]
+    operands = [random_pattern(random, depth + 1) for _ in range(random.randint(0, 4))]
+    return [random.choice('&|'), operands]
+
+
+def random_options(random):
+    return dict(suppress_key_errors=random.random() < 0.5, suppress_exceptions=random.random() < 0.5,
+                nested_keys=random.random() < 0.5)
+
+
+def random_value(random):
+    filter_values = [0, 1, 'x', None]
+    value = dict((key, random.choice(filter_values)) for key in 'abc' if random.random() < 0.7)
+    if random.random() < 0.5:
+        value['c'] = dict((key, random.choice(filter_values)) for key in 'de' if random.random() < 0.7)
+    return value
+
+
+def match_or_error(k, value):
+    """
+    Returns the result of matching the value, or the type of the exception raised.
+    """
+    try:
+        return bool(k.match(value))
+    except (KeyError, TypeError) as error:
+        return type(error)
 
 
 class KPatternTest(TestCase):
@@ -13,6 +62,25 @@ class KPatternTest(TestCase):
         k = K(['=~', 'hi', 'hi'])
         self.assertEquals(k.pattern, ['=~', 'hi', 'hi'])
 
+    def test_nested_pattern(self):
+        pattern = ['&', [['!', ['==', 'f', [1, 2]]], ['^', [['?', 'g'], ['<', 'h', 1.5]]]]]
+        self.assertEqual(K(pattern).pattern, pattern)
+
+    def test_pattern_is_a_copy(self):
+        pattern = ['|', [['==', 'f', [1]], ['?', 'g']]]
+        k = K(pattern)
+        pattern[1][0][2].append(2)
+        k.pattern[1][0][2].append(3)
+        self.assertEqual(k.pattern, ['|', [['==', 'f', [1]], ['?', 'g']]])
+        self.assertTrue(k.match({'f': [1]}))
+
+    def test_shared_pattern(self):
+        k = K(['==', 'f', 1])
+        shared_k = K(k, suppress_key_errors=True)
+        self.assertIs(shared_k._compiled_pattern, k._compiled_pattern)
+        self.assertEqual(shared_k.pattern, ['==', 'f', 1])
+        self.assertFalse(shared_k.match({}))
+
 
 class KMatchTest(TestCase):
     """
@@ -263,6 +331,11 @@ class KMatchTest(TestCase):
         ]).match({'email': 'opensource@ambition.com',
                   'e-mail': 'opensource@ambition.com'}))
 
+    def test_xor_regex(self):
+        k = K(['^', [['?', 'f'], ['=~', 'f', '^hi']]])
+        self.assertTrue(k.match({'f': 'bye'}))
+        self.assertFalse(k.match({'f': 'hi'}))
+
     def test_get_field_keys(self):
         """
         Verifies that all field keys are returned
@@ -294,6 +367,41 @@ class KMatchTest(TestCase):
         ]]
         with self.assertRaises(ValueError):
             K(pattern).get_field_keys()
+        with self.assertRaises(ValueError):
+            K(['?', 'foo']).get_field_keys(pattern)
+        with self.assertRaises(ValueError):
+            K(['?', 'foo']).get_field_keys(['^', [['?', 'a']]])
+
+    def test_field_keys(self):
+        k = K(['|', [['?', 'a'], ['!', ['==', 'b', 1]], ['^', [['=~', 'a', 'x'], ['in', ['c', 'd'], [1]]]]]])
+        self.assertEqual(k.field_keys, frozenset(['a', 'b', ('c', 'd')]))
+        self.assertIs(k.field_keys, k.field_keys)
+        self.assertIs(K(k).field_keys, k.field_keys)
+
+    def test_get_field_keys_is_a_copy(self):
+        k = K(['?', 'a'])
+        k.get_field_keys().add('b')
+        self.assertEqual(k.get_field_keys(), set(['a']))
+
+    def test_get_field_keys_details(self):
+        k = K(['&', [['?', 'a'], ['!', ['==', 'a', 1]], ['|', [['>', 'b', 1], ['<', 'b', 5], ['>', 'b', 2]]]]])
+        self.assertEqual(k.get_field_keys(details=True), {'a': set(['?', '==']), 'b': set(['>', '<'])})
+        self.assertEqual(k.get_field_keys(['!?', ['c', 'd']], details=True), {('c', 'd'): set(['!?'])})
+
+    def test_get_field_keys_deep_pattern(self):
+        pattern = ['?', 'a0']
+        for i in range(1, 100):
+            pattern = ['!', ['&', [['==', 'a{0}'.format(i), i], pattern]]]
+        k = K(pattern)
+        self.assertEqual(len(k.field_keys), 100)
+        self.assertEqual(k.get_field_keys(), k.get_field_keys(pattern))
+
+    def test_pickle(self):
+        k = K(['&', [['=~', 'f', '^a'], ['!', ['==', 'g', 1]]]], suppress_key_errors=True, reorder_filters=True)
+        unpickled_k = pickle.loads(pickle.dumps(k))
+        self.assertEqual(unpickled_k.pattern, k.pattern)
+        self.assertTrue(unpickled_k.match({'f': 'abc'}))
+        self.assertFalse(unpickled_k.match({'f': 'abc', 'g': 1}))
 
     def test_properties(self):
         k = K(['<=', 'f', 0])
@@ -301,11 +409,649 @@ class KMatchTest(TestCase):
         k.suppress_exceptions = True
         self.assertTrue(k.suppress_exceptions)
 
+    def test_suppress_exceptions_setter_changes_match(self):
+        k = K(['>=', 'k', 3])
+        with self.assertRaises(TypeError):
+            k.match({'k': None})
+        k.suppress_exceptions = True
+        self.assertFalse(k.match({'k': None}))
+        k.suppress_exceptions = False
+        with self.assertRaises(TypeError):
+            k.match({'k': None})
+
+    def test_match_does_not_reinterpret_pattern(self):
+        k = K(['&', [['?', 'f'], ['!', ['>', 'f', 5]], ['^', [['==', 'f', 1], ['!?', 'g']]]]])
+        with patch.object(K, '_is_operator') as mock_is_operator:
+            with patch.object(K, '_is_value_filter') as mock_is_value_filter:
+                self.assertTrue(k.match({'f': 1, 'g': 2}))
+                self.assertFalse(k.match({'f': 1}))
+        self.assertFalse(mock_is_operator.called)
+        self.assertFalse(mock_is_value_filter.called)
+
+
+class KMatchManyTest(TestCase):
+    """
+    Tests the match_many and filter functions in K.
+    """
+    def test_match_many(self):
+        k = K(['|', [['=~', 'f', '^hi'], ['>', 'g', 1]]], suppress_key_errors=True)
+        self.assertEqual(k.match_many([{'f': 'hi'}, {'f': 'no'}, {'g': 2}, {}]), [True, False, True, False])
+
+    def test_match_many_empty(self):
+        self.assertEqual(K(['?', 'f']).match_many([]), [])
+
+    def test_match_many_key_error(self):
+        with self.assertRaises(KeyError):
+            K(['==', 'f', 1]).match_many([{'f': 1}, {}])
+
+    def test_filter(self):
+        k = K(['>', 'f', 1])
+        self.assertEqual(list(k.filter([{'f': 2}, {'f': 0}, {'f': 3}])), [{'f': 2}, {'f': 3}])
+
+    def test_filter_is_lazy(self):
+        def values():
+            yield {'f': 2}
+            raise AssertionError('filter consumed more values than needed')
+
+        self.assertEqual(next(K(['>', 'f', 1]).filter(values())), {'f': 2})
+
+
+class CountingDict(dict):
+    """
+    A dictionary that counts how many times its items are looked up.
+    """
+    lookups = 0
+
+    def __getitem__(self, key):
+        CountingDict.lookups += 1
+        return super(CountingDict, self).__getitem__(key)
+
+
+class KNestedKeysTest(TestCase):
+    """
+    Tests the nested_keys option of K.
+    """
+    value = {'user': {'address': {'zip': '02110', 'city': 'Boston'}, 'tags': ['a', 'b']}}
+
+    def test_dotted_key(self):
+        self.assertTrue(K(['==', 'user.address.zip', '02110'], nested_keys=True).match(self.value))
+        self.assertFalse(K(['==', 'user.address.zip', '02111'], nested_keys=True).match(self.value))
+
+    def test_tuple_and_list_keys(self):
+        self.assertTrue(K(['=~', ('user', 'address', 'city'), '^Bos'], nested_keys=True).match(self.value))
+        self.assertTrue(K(['==', ['user', 'tags', 1], 'b'], nested_keys=True).match(self.value))
+
+    def test_list_key_changed_after_construction(self):
+        key = ['frozen', 'path']
+        k = K(['==', key, 1], nested_keys=True)
+        cached_k = K.cached(['==', key, 1], nested_keys=True)
+        lazy_k = K(['==', key, 1], nested_keys=True, lazy=True)
+        key.append('c')
+        value = {'frozen': {'path': 1}}
+        self.assertEqual(k.pattern, ['==', ['frozen', 'path'], 1])
+        self.assertEqual(k.field_keys, frozenset([('frozen', 'path')]))
+        self.assertTrue(k.match(value))
+        self.assertTrue(K(k, nested_keys=True).match(value))
+        self.assertTrue(lazy_k.match(value))
+        self.assertIs(K.cached(['==', ['frozen', 'path'], 1], nested_keys=True), cached_k)
+        self.assertEqual(cached_k.pattern, ['==', ['frozen', 'path'], 1])
+        with self.assertRaises(TypeError):
+            K(k).match({('frozen', 'path'): 1})
+
+    def test_list_index(self):
+        self.assertTrue(K(['==', 'user.tags.0', 'a'], nested_keys=True).match(self.value))
+        self.assertTrue(K(['==', 'a.0', 1], nested_keys=True).match({'a': {'0': 1}}))
+
+    def test_flat_keys_unchanged(self):
+        self.assertTrue(K(['==', 'a.b', 1]).match({'a.b': 1}))
+        self.assertTrue(K(['==', 'a', 1], nested_keys=True).match({'a': 1}))
+        with self.assertRaises(KeyError):
+            K(['==', 'a.b', 1]).match({'a': {'b': 1}})
+
+    def test_missing_path(self):
+        with self.assertRaises(KeyError) as context:
+            K(['==', 'user.address.state', 'MA'], nested_keys=True).match(self.value)
+        self.assertEqual(context.exception.args, ('user.address.state',))
+        with self.assertRaises(KeyError):
+            K(['==', 'user.tags.5', 'a'], nested_keys=True).match(self.value)
+        self.assertFalse(K(['==', 'user.other.zip', 1], nested_keys=True, suppress_key_errors=True).match(self.value))
+
+    def test_non_container_on_path(self):
+        with self.assertRaises(KeyError):
+            K(['==', 'user.address.zip.code', 1], nested_keys=True).match(self.value)
+        self.assertFalse(
+            K(['==', 'user.address.zip.code', 1], nested_keys=True, suppress_key_errors=True).match(self.value))
+        self.assertFalse(K(['?', 'a.b'], nested_keys=True).match({'a': 1}))
+        self.assertTrue(K(['!?', 'user.tags.x'], nested_keys=True).match(self.value))
+
+    def test_key_filters(self):
+        self.assertTrue(K(['?', 'user.address.zip'], nested_keys=True).match(self.value))
+        self.assertFalse(K(['?', 'user.other.zip'], nested_keys=True).match(self.value))
+        self.assertTrue(K(['!?', 'user.tags.2'], nested_keys=True).match(self.value))
+        self.assertFalse(K(['!?', 'user.tags.1'], nested_keys=True).match(self.value))
+
+    def test_shared_parent_looked_up_once(self):
+        k = K(['&', [
+            ['==', 'user.address.zip', '02110'],
+            ['?', 'user.address.city'],
+            ['!=', 'user.address.city', 'Cambridge'],
+            ['==', 'user.tags.0', 'a'],
+        ]], nested_keys=True)
+        value = CountingDict(user=CountingDict(address=CountingDict(zip='02110', city='Boston'), tags=['a']))
+        CountingDict.lookups = 0
+        self.assertTrue(k.match(value))
+        # One lookup for each of user and user.address, which every filter shares, one for each of the three filters
+        # on user.address and one for user.tags
+        self.assertEqual(CountingDict.lookups, 6)
+
+    def test_shared_prefix_looked_up_once(self):
+        k = K(['&', [['==', 'a.b.c', 1], ['==', 'a.b.d.e', 2], ['!?', 'a.x'], ['==', 'f', 3]]], nested_keys=True)
+        value = CountingDict(a=CountingDict(b=CountingDict(c=1, d=CountingDict(e=2))), f=3)
+        CountingDict.lookups = 0
+        self.assertTrue(k.match(value))
+        # a and a.b are looked up once, then c, d, e, x and f
+        self.assertEqual(CountingDict.lookups, 7)
+        with self.assertRaises(KeyError) as context:
+            k.match({'a': {'b': {'c': 1, 'd': 1}}, 'f': 3})
+        self.assertEqual(context.exception.args, ('a.b.d.e',))
+        self.assertFalse(k.match({'a': {'b': {'c': 1, 'd': {'e': 2}}, 'x': 1}, 'f': 3}))
+        with self.assertRaises(KeyError) as context:
+            k.match({'a': {'b': 1}})
+        self.assertEqual(context.exception.args, ('a.b.c',))
+        self.assertFalse(K(k, suppress_key_errors=True).match({'a': {'b': 1}}))
+
+    def test_shared_parent_missing(self):
+        k = K(['|', [['!?', 'a.b.d'], ['==', 'a.b.c', 1]]], nested_keys=True)
+        self.assertTrue(k.match({}))
+        self.assertFalse(k.match({'a': {'b': {'c': 2, 'd': 3}}}))
+        with self.assertRaises(KeyError):
+            k.match({'a': {'b': {'d': 3}}})
+        self.assertTrue(k.match({'a': None}))
+        suppressed_k = K(['|', [['==', 'a.b.c', 1], ['==', 'a.b.d', 1]]], nested_keys=True, suppress_exceptions=True)
+        self.assertFalse(suppressed_k.match({'a': None}))
+        self.assertTrue(suppressed_k.match({'a': {'b': {'d': 1}}}))
+
+    def test_shared_parent_reorder_filters(self):
+        k = K(['&', [['>', 'a.b', 1], ['<', 'a.c', 5]]], nested_keys=True, reorder_filters=True)
+        self.assertTrue(k.match({'a': {'b': 2, 'c': 3}}))
+        self.assertFalse(k.match({'a': {'b': 2, 'c': 6}}))
+
+    def test_get_field_keys(self):
+        k = K(['&', [['==', 'a.b', 1], ['?', ['c', 'd']], ['==', ('e', 0), 1]]], nested_keys=True)
+        self.assertEqual(k.get_field_keys(), set(['a.b', ('c', 'd'), ('e', 0)]))
+
+
+class KShortCircuitTest(TestCase):
+    """
+    Tests that & and | stop evaluating their operands once the result is known.
+    """
+    def test_and_stops_at_first_false(self):
+        self.assertFalse(K(['&', [['==', 'f', 1], ['==', 'missing', 1]]]).match({'f': 2}))
+
+    def test_and_evaluates_until_false(self):
+        with self.assertRaises(KeyError):
+            K(['&', [['==', 'f', 1], ['==', 'missing', 1]]]).match({'f': 1})
+
+    def test_or_stops_at_first_true(self):
+        self.assertTrue(K(['|', [['==', 'f', 1], ['==', 'missing', 1]]]).match({'f': 1}))
+
+    def test_or_evaluates_until_true(self):
+        with self.assertRaises(KeyError):
+            K(['|', [['==', 'f', 1], ['==', 'missing', 1]]]).match({'f': 2})
+
+    def test_or_suppressed_key_errors_unchanged(self):
+        k = K(['|', [['==', 'missing', 1], ['>', 'f', 1]]], suppress_key_errors=True)
+        self.assertTrue(k.match({'f': 2}))
+        self.assertFalse(k.match({'f': 1}))
+
+
+class KReorderFiltersTest(TestCase):
+    """
+    Tests the reorder_filters mode of K.
+    """
+    def test_cheap_filters_first(self):
+        k = K(['&', [['=~', 'f', 'hi'], ['==', 'g', 1], ['?', 'h']]], reorder_filters=True)
+        # The missing key filter runs first and decides the result before the missing values are accessed
+        self.assertFalse(k.match({}))
+
+    def test_nested_operator_cost(self):
+        k = K(['|', [
+            ['&', [['=~', 'f', 'hi'], ['!', ['=~', 'f', 'hello']]]],
+            ['?', 'g'],
+        ]], reorder_filters=True)
+        self.assertTrue(k.match({'g': 1}))
+        self.assertTrue(k.match({'f': 'hi'}))
+        self.assertFalse(k.match({'f': 'hello'}))
+
+    def test_reorders_by_observed_selectivity(self):
+        k = K(['|', [['==', 'a', 1], ['==', 'b', 1], ['==', 'missing', 1]]], reorder_filters=True)
+        for _ in range(K._REORDER_SAMPLE_SIZE):
+            self.assertTrue(k.match({'a': 0, 'b': 1, 'missing': 0}))
+        # 'b' almost always decides the result, so it now runs first and the missing key is never reached
+        self.assertTrue(k.match({'a': 0, 'b': 1}))
+        self.assertFalse(k.match({'a': 0, 'b': 0, 'missing': 0}))
+
+    def test_shared_between_threads(self):
+        k = K(['|', [['==', 'a', 1], ['==', 'b', 1]]], reorder_filters=True)
+        values = [{'a': 0, 'b': 1}] * K._REORDER_SAMPLE_SIZE
+        threads = [Thread(target=k.match_many, args=(values,)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        junction = k._matcher
+        self.assertLessEqual(junction._remaining_samples, 0)
+        # 'b' decided every sampled match, so it was moved first
+        self.assertEqual([operand({'a': 0, 'b': 1}) for operand in junction._operands], [True, False])
+        # A junction with no samples left never samples again
+        with patch.object(junction, '_sample') as mock_sample:
+            self.assertTrue(k.match({'a': 0, 'b': 1}))
+        self.assertFalse(mock_sample.called)
+
+    def test_and_results_unchanged(self):
+        pattern = ['&', [['>', 'a', 1], ['<', 'a', 10], ['!?', 'b']]]
+        k = K(pattern, reorder_filters=True, suppress_exceptions=True)
+        unordered_k = K(pattern, suppress_exceptions=True)
+        values = [{'a': i % 12, 'b': 0} if i % 5 == 0 else {'a': i % 12} for i in range(3 * K._REORDER_SAMPLE_SIZE)]
+        values.append({'a': None})
+        for value in values:
+            self.assertEqual(k.match(value), unordered_k.match(value))
+
+
+class KRegexFastPathTest(TestCase):
+    """
+    Tests that regex filters that only match literal text, and | of regex filters on one key, match exactly as the
+    regexes do.
+    """
+    regexes = [
+        'abc', '^abc', 'abc$', '^abc$', 'abc.*', '.*abc', '.*abc.*', '.*?abc.*?', '.*abc$', 'a\\.c', 'a\\$', 'a\\\\$',
+        '', '^', '$', '.*', '.*$', 'a.c', 'a\\d', '\\.*', 'ab+', '(?i)abc', 'abc\\Z',
+    ]
+    strings = ['', 'abc', 'abcd', 'xabc', 'abc\n', 'abc\n\n', 'ABC', 'a.c', 'a$', 'a\\', 'a1', '..', 'abbb', 'x\nabc']
+
+    def test_literal_regexes_match_as_regexes(self):
+        for regex in self.regexes:
+            compiled_regex = re.compile(regex, re.DOTALL)
+            k = K(['=~', 'f', regex])
+            for string in self.strings:
+                self.assertEqual(k.match({'f': string}), compiled_regex.match(string) is not None, (regex, string))
+
+    def test_or_of_regexes_matches_as_regexes(self):
+        for i, regex in enumerate(self.regexes):
+            for other_regex in self.regexes[i:]:
+                k = K(['|', [['=~', 'f', regex], ['=~', 'f', other_regex]]])
+                for string in self.strings:
+                    self.assertEqual(
+                        k.match({'f': string}),
+                        bool(re.match(regex, string, re.DOTALL) or re.match(other_regex, string, re.DOTALL)),
+                        (regex, other_regex, string))
+
+    def test_uncombinable_regexes(self):
+        k = K(['|', [['=~', 'f', '(a)\\1'], ['=~', 'f', '(b)\\1'], ['=~', 'f', '(?P<x>c)']]])
+        self.assertTrue(k.match({'f': 'aa'}))
+        self.assertTrue(k.match({'f': 'bb'}))
+        self.assertFalse(k.match({'f': 'ab'}))
+        k = K(['|', [['=~', 'f', '(?P<x>a)'], ['=~', 'f', '(?P<x>b)']]])
+        self.assertTrue(k.match({'f': 'b'}))
+
+    def test_non_string_values(self):
+        with self.assertRaises(TypeError):
+            K(['=~', 'f', '^abc']).match({'f': 1})
+        with self.assertRaises(TypeError):
+            K(['|', [['=~', 'f', 'a'], ['=~', 'f', 'b']]]).match({'f': b'a'})
+        self.assertFalse(K(['=~', 'f', '^abc'], suppress_exceptions=True).match({'f': 1}))
+        self.assertFalse(K(['|', [['=~', 'f', 'a'], ['=~', 'f', 'b']]]).match({'f': None}))
+
+    def test_bytes_regexes(self):
+        k = K(['|', [['=~', 'f', b'^a'], ['=~', 'f', b'c.$']]])
+        self.assertTrue(k.match({'f': b'ab'}))
+        self.assertTrue(k.match({'f': b'cb'}))
+        self.assertFalse(k.match({'f': b'dc'}))
+
+    def test_or_looks_up_field_once(self):
+        k = K(['|', [['=~', 'f', '^a'], ['=~', 'f', 'b$'], ['=~', 'g', 'c'], ['=~', 'f', 'd.*e']]])
+        CountingDict.lookups = 0
+        self.assertFalse(k.match(CountingDict(f='x', g='x')))
+        self.assertEqual(CountingDict.lookups, 3)
+
+    def test_shared_regex_cache(self):
+        self.assertIs(K(['=~', 'f', 'a+b'])._compiled_pattern[2], K(['=~', 'g', 'a+b'])._compiled_pattern[2])
+
+
+class KMembershipFilterTest(TestCase):
+    """
+    Tests the in and !in filters.
+    """
+    def test_in(self):
+        k = K(['in', 'f', [1, 'a', None, [2]]])
+        for value in [1, 1.0, True, 'a', None, [2]]:
+            self.assertTrue(k.match({'f': value}))
+        for value in [2, 'b', b'a', [1], {}]:
+            self.assertFalse(k.match({'f': value}))
+
+    def test_not_in(self):
+        k = K(['!in', 'f', (1, 'a')])
+        self.assertFalse(k.match({'f': 'a'}))
+        self.assertTrue(k.match({'f': 'b'}))
+        self.assertTrue(k.match({'f': [1]}))
+        self.assertTrue(K(['!in', 'f', [[1]]]).match({'f': 1}))
+
+    def test_set_filter_values(self):
+        self.assertTrue(K(['in', 'f', set([1, 2])]).match({'f': 2}))
+        self.assertTrue(K(['in', 'f', frozenset(['a'])]).match({'f': 'a'}))
+
+    def test_empty(self):
+        self.assertFalse(K(['in', 'f', []]).match({'f': 1}))
+        self.assertTrue(K(['!in', 'f', []]).match({'f': 1}))
+
+    def test_non_extant(self):
+        with self.assertRaises(KeyError):
+            K(['in', 'f', [1]]).match({})
+        self.assertFalse(K(['in', 'f', [1]], suppress_key_errors=True).match({}))
+        self.assertFalse(K(['!in', 'f', [1]], suppress_key_errors=True).match({}))
+
+    def test_nested_keys(self):
+        self.assertTrue(K(['in', 'a.b', [1, 2]], nested_keys=True).match({'a': {'b': 2}}))
+
+    def test_pattern(self):
+        pattern = ['|', [['in', 'f', [1, [2]]], ['!in', 'g', []]]]
+        k = K(pattern)
+        self.assertEqual(k.pattern, pattern)
+        self.assertIsNot(k.pattern[1][0][2][1], pattern[1][0][2][1])
+        self.assertEqual(K(['in', 'f', (1, 2)]).pattern, ['in', 'f', [1, 2]])
+
+    def test_filter_values_not_shared(self):
+        filter_values = [1]
+        k = K(['in', 'f', filter_values])
+        filter_values.append(2)
+        self.assertFalse(k.match({'f': 2}))
+
+    def test_get_field_keys(self):
+        self.assertEqual(K(['&', [['in', 'f', [1]], ['!in', 'g', [2]]]]).get_field_keys(), set(['f', 'g']))
+
+    def test_pickle(self):
+        k = pickle.loads(pickle.dumps(K(['in', 'f', [1, [2]]])))
+        self.assertTrue(k.match({'f': [2]}))
+        self.assertFalse(k.match({'f': 2}))
+
+
+class KMergedEqualFiltersTest(TestCase):
+    """
+    Tests that consecutive == filters on the same key in an | match as an in filter exactly as they do one by one.
+    """
+    def test_equal_filters(self):
+        k = K(['|', [['==', 'f', 1], ['==', 'f', 'a'], ['==', 'f', None], ['==', 'g', 2]]])
+        for value in [1, 1.0, True, 'a', None]:
+            self.assertTrue(k.match({'f': value, 'g': 0}))
+        for value in [2, 'b', b'a', [1], {}]:
+            self.assertFalse(k.match({'f': value, 'g': 0}))
+        self.assertTrue(k.match({'f': [1], 'g': 2}))
+
+    def test_unhashable_field(self):
+        k = K(['|', [['==', 'f', 1], ['==', 'f', 2], ['==', 'f', [1]]]])
+        self.assertTrue(k.match({'f': [1]}))
+        self.assertFalse(k.match({'f': [2]}))
+
+    def test_looks_up_field_once(self):
+        k = K(['|', [['==', 'f', 1], ['==', 'f', 2], ['==', 'f', 3]]])
+        CountingDict.lookups = 0
+        self.assertFalse(k.match(CountingDict(f=4)))
+        self.assertEqual(CountingDict.lookups, 1)
+        with self.assertRaises(KeyError):
+            k.match({})
+
+    def test_nan_is_not_merged(self):
+        nan = float('nan')
+        self.assertFalse(K(['|', [['==', 'f', nan], ['==', 'f', 1]]]).match({'f': nan}))
+
+
+class KDeepPatternTest(TestCase):
+    """
+    Tests patterns nested deeper than the tree of callables is built for, which are matched by a branch program.
+    """
+    def deep_pattern(self, depth, pattern=('?', 'a')):
+        pattern = list(pattern)
+        for i in range(depth):
+            if i % 2 == 0:
+                pattern = ['^', [['==', 'c', 1], pattern]]
+            else:
+                pattern = ['!', ['&', [['?', 'b'], pattern]]]
+        return pattern
+
+    def flatten(self, pattern):
+        items, stack = [], [pattern]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, list):
+                items.append(len(item))
+                stack.extend(reversed(item))
+            else:
+                items.append(item)
+        return items
+
+    def test_deep_pattern(self):
+        k = K(self.deep_pattern(10000))
+        self.assertTrue(k.match({'a': 1, 'b': 1, 'c': 1}))
+        self.assertTrue(k.match({'a': 1, 'b': 1, 'c': 2}))
+        self.assertFalse(k.match({'b': 1, 'c': 1}))
+        self.assertTrue(k.match({'c': 1}))
+        with self.assertRaises(KeyError):
+            k.match({'a': 1, 'b': 1})
+        self.assertTrue(K(k, suppress_key_errors=True).match({}))
+        self.assertEqual(k.field_keys, frozenset(['a', 'b', 'c']))
+        self.assertEqual(k.get_field_keys(self.deep_pattern(10000)), set(['a', 'b', 'c']))
+
+    def test_deep_pattern_is_rebuilt(self):
+        pattern = self.deep_pattern(5000, ['in', 'a', [1, [2]]])
+        self.assertEqual(self.flatten(K(pattern).pattern), self.flatten(pattern))
+
+    def test_deep_pattern_is_pickled(self):
+        pattern = self.deep_pattern(5000, ['in', 'a', [1, [2]]])
+        k = pickle.loads(pickle.dumps(K(pattern)))
+        self.assertEqual(self.flatten(k.pattern), self.flatten(pattern))
+        self.assertTrue(k.match({'a': [2], 'b': 1, 'c': 1}))
+
+    def test_deep_pattern_is_explained(self):
+        explanation = K(self.deep_pattern(5000)).explain({'a': 1, 'b': 1, 'c': 2})
+        self.assertTrue(explanation.result)
+        self.assertEqual(explanation.filters[-1].pattern, ['?', 'a'])
+        self.assertEqual(explanation.filters[-1].path, (0, 1, 1) * 2500)
+
+    def test_deep_invalid_pattern(self):
+        with self.assertRaises(ValueError):
+            K(self.deep_pattern(5000, ['?']))
+        with self.assertRaises(ValueError):
+            K(self.deep_pattern(5000, ['^', [['?', 'a']]]))
+        with self.assertRaises(ValueError):
+            K(['?', 'a']).get_field_keys(self.deep_pattern(5000, ['==', 'a']))
+
+    def test_empty_operators(self):
+        with patch.object(K, '_MAX_TREE_DEPTH', 0):
+            self.assertFalse(K(['&', [['|', []], ['&', []]]]).match({}))
+            self.assertTrue(K(['|', [['|', []], ['&', []]]]).match({}))
+
+    def test_shared_parent_path(self):
+        with patch.object(K, '_MAX_TREE_DEPTH', 0):
+            k = K(['&', [['==', 'c.d', 1], ['==', 'c.e', 2]]], nested_keys=True, suppress_key_errors=True)
+        CountingDict.lookups = 0
+        self.assertTrue(k.match({'c': CountingDict(d=1, e=2)}))
+        self.assertEqual(CountingDict.lookups, 2)
+        self.assertFalse(k.match({}))
+
+    def test_agrees_with_tree(self):
+        random = Random(0)
+        for _ in range(300):
+            kwargs = random_options(random)
+            try:
+                tree_k = K(random_pattern(random), **kwargs)
+            except ValueError:
+                # Regex filters on filter values that aren't strings
+                continue
+            with patch.object(K, '_MAX_TREE_DEPTH', 0):
+                program_k = K(tree_k, **kwargs)
+            for _ in range(10):
+                value = random_value(random)
+                self.assertEqual(match_or_error(program_k, value), match_or_error(tree_k, value))
+
+
+class KCodegenTest(TestCase):
+    """
+    Tests matching patterns with a generated Python function.
+    """
+    def test_source(self):
+        k = K(['&', [['==', 'a', 1], ['|', [['?', 'b'], ['!', ['<', 'c', 2.5]]]]]], codegen=True)
+        self.assertEqual(k.source, (
+            'def match(value):\n'
+            '    return True if (\n'
+            '        value[\'a\'] == 1\n'
+            '        and (\n'
+            '            \'b\' in value\n'
+            '            or not value[\'c\'] < 2.5\n'
+            '        )\n'
+            '    ) else False\n'
+        ))
+        self.assertTrue(k.match({'a': 1, 'c': 3}))
+        self.assertFalse(k.match({'a': 1, 'c': 2}))
+        with self.assertRaises(KeyError):
+            k.match({'a': 1})
+        self.assertIsNone(K(k).source)
+
+    def test_suppressed_errors(self):
+        k = K(['|', [['==', 'a', 1], ['>', 'b', 1]]], suppress_key_errors=True, codegen=True)
+        self.assertIn('except KeyError:', k.source)
+        self.assertFalse(k.match({}))
+        self.assertTrue(k.match({'b': 2}))
+        with self.assertRaises(TypeError):
+            k.match({'b': 'x'})
+        k = K(k, suppress_exceptions=True, codegen=True)
+        self.assertIn('except (KeyError, TypeError):', k.source)
+        self.assertFalse(k.match({'b': 'x'}))
+
+    def test_filter_values(self):
+        k = K(['|', [['==', 'a', [1]], ['==', 'a', float('nan')], ['>', 'b', 1.5], ['==', 'c', b'x']]], codegen=True)
+        self.assertNotIn('[1]', k.source)
+        self.assertIn('1.5', k.source)
+        self.assertTrue(k.match({'a': [1]}))
+        self.assertTrue(k.match({'a': 0, 'b': 2}))
+        self.assertTrue(k.match({'a': 0, 'b': 0, 'c': b'x'}))
+
+    def test_filter_value_is_a_copy(self):
+        filter_value = [1]
+        k = K(['==', 'a', filter_value], codegen=True)
+        filter_value.append(2)
+        self.assertTrue(k.match({'a': [1]}))
+
+    def test_deep_pattern(self):
+        pattern = ['?', 'a']
+        for _ in range(100):
+            pattern = ['!', ['!', pattern]]
+        k = K(pattern, codegen=True)
+        self.assertIsNone(k.source)
+        self.assertTrue(k.match({'a': 1}))
+
+    def test_profile_and_reorder_filters(self):
+        self.assertIsNone(K(['?', 'a'], codegen=True, profile=True).source)
+        self.assertIsNone(K(['?', 'a'], codegen=True, reorder_filters=True).source)
+
+    def test_pickle(self):
+        k = pickle.loads(pickle.dumps(K(['=~', 'a', '^x'], codegen=True)))
+        self.assertIn('def match', k.source)
+        self.assertTrue(k.match({'a': 'xy'}))
+
+    def test_optimize(self):
+        k = K(['!', ['!', ['==', 'a', 1]]], codegen=True).optimize()
+        self.assertEqual(k.source, 'def match(value):\n    return value[\'a\'] == 1\n')
+
+    def test_agrees_with_tree(self):
+        random = Random(1)
+        for _ in range(300):
+            kwargs = random_options(random)
+            try:
+                tree_k = K(random_pattern(random), **kwargs)
+            except ValueError:
+                # Regex filters on filter values that aren't strings
+                continue
+            codegen_k = K(tree_k, codegen=True, **kwargs)
+            for _ in range(10):
+                value = random_value(random)
+                self.assertEqual(match_or_error(codegen_k, value), match_or_error(tree_k, value))
+
+
+class KLazyTest(TestCase):
+    """
+    Tests compiling regexes and lowering branches when they are first evaluated.
+    """
+    def test_regexes_are_compiled_on_first_match(self):
+        with patch('kmatch.kmatch._compile_regex', wraps=_compile_regex) as mock_compile_regex:
+            k = K(['=~', 'f', '^a.*[0-9]$'], lazy=True)
+            self.assertFalse(mock_compile_regex.called)
+            self.assertTrue(k.match({'f': 'abc1'}))
+            self.assertFalse(k.match({'f': 'abc'}))
+        self.assertEqual(mock_compile_regex.call_count, 1)
+        self.assertEqual(k.pattern, ['=~', 'f', '^a.*[0-9]$'])
+
+    def test_invalid_regexes(self):
+        k = K(['|', [['==', 'a', 1], ['=~', 'f', '(']]], lazy=True)
+        self.assertTrue(k.match({'a': 1}))
+        with self.assertRaises(ValueError):
+            k.match({'a': 2, 'f': 'x'})
+        with self.assertRaises(ValueError):
+            K(['=~', 'f', 1], lazy=True)
+        with self.assertRaises(ValueError):
+            K(['=~', 'f', '('], lazy=True, validate_regexes=True)
+
+    def test_validated_regexes_are_cached(self):
+        k = K(['=~', 'f', '^a.*[0-9]$'], lazy=True, validate_regexes=True)
+        with patch('kmatch.kmatch.re.compile') as mock_compile:
+            self.assertTrue(k.match({'f': 'abc1'}))
+        self.assertFalse(mock_compile.called)
+
+    def test_regex_type_errors(self):
+        k = K(['=~', 'f', '^a.*[0-9]$'], lazy=True)
+        with self.assertRaises(TypeError):
+            k.match({'f': 1})
+        self.assertFalse(K(k, suppress_exceptions=True, lazy=True).match({'f': 1}))
+
+    def test_branches_are_lowered_on_first_evaluation(self):
+        k = K(['|', [['==', 'a', 1], ['&', [['==', 'b', 1], ['?', 'c']]], ['=~', 'd', '^x']]], lazy=True)
+        with patch.object(k, '_build_matcher', wraps=k._build_matcher) as mock_build_matcher:
+            self.assertTrue(k.match({'a': 1}))
+            self.assertEqual([call[0][0][0] for call in mock_build_matcher.call_args_list], ['|', '=='])
+            self.assertTrue(k.match({'a': 2, 'b': 1, 'c': 1}))
+            self.assertTrue(k.match({'a': 2, 'b': 1, 'c': 1}))
+            self.assertEqual(mock_build_matcher.call_count, 5)
+            self.assertTrue(k.match({'a': 2, 'b': 2, 'd': 'x'}))
+            self.assertEqual(mock_build_matcher.call_count, 6)
+
+    def test_profile_and_reorder_filters(self):
+        k = K(['|', [['==', 'a', 1], ['&', [['==', 'b', 1], ['?', 'c']]]]], lazy=True, profile=True)
+        self.assertTrue(k.match({'a': 1}))
+        self.assertEqual(k.profile_tree()['operands'][1]['evaluations'], 0)
+        k = K(k, lazy=True, reorder_filters=True)
+        self.assertTrue(k.match({'a': 2, 'b': 1, 'c': 1}))
+
+    def test_agrees_with_eager(self):
+        random = Random(0)
+        for _ in range(300):
+            kwargs = random_options(random)
+            try:
+                k = K(random_pattern(random), **kwargs)
+            except ValueError:
+                # Regex filters on filter values that aren't strings
+                continue
+            lazy_k = K(k.pattern, lazy=True, **kwargs)
+            for _ in range(10):
+                value = random_value(random)
+                self.assertEqual(match_or_error(lazy_k, value), match_or_error(k, value))
+
 
 class KInitTest(TestCase):
     """
     Tests the init function in K, which validates and compiles the pattern.
     """
+    def setUp(self):
+        _compile_regex.cache_clear()
+
     def test_empty(self):
         with self.assertRaises(ValueError):
             K([])
@@ -318,6 +1064,14 @@ class KInitTest(TestCase):
         with self.assertRaises(ValueError):
             K(['=~', 'f', []])
 
+    def test_invalid_membership_filter_values(self):
+        with self.assertRaises(ValueError):
+            K(['in', 'f', 'abc'])
+        with self.assertRaises(ValueError):
+            K(['!in', 'f', None])
+        with self.assertRaises(ValueError):
+            K(['?', 'f']).get_field_keys(['&', [['in', 'f', 1]]])
+
     def test_non_list_operand(self):
         with self.assertRaises(ValueError):
             K(['&', {}])
@@ -342,6 +1096,9 @@ class KInitTest(TestCase):
         with self.assertRaises(ValueError):
             K('aaa')
 
+    def test_tuple_pattern(self):
+        self.assertTrue(K(('&', (('?', 'f'), ('!', ('==', 'f', 1))))).match({'f': 2}))
+
     def test_invalid_xor(self):
         with self.assertRaises(ValueError):
             K([
@@ -359,28 +1116,30 @@ class KInitTest(TestCase):
                     ['?', 'a'],
                 ]
             ])
+        with self.assertRaises(ValueError):
+            K(['^', []])
 
-    @patch('kmatch.kmatch.re.compile', spec_set=True, side_effect=lambda x, flags: '{0}_compiled'.format(x))
+    @patch('kmatch.kmatch.re.compile', spec_set=True, wraps=re.compile)
     def test_unnested(self, mock_compile):
         k = K(['=~', 'field', 'hi'])
         self.assertEquals(mock_compile.call_count, 1)
-        self.assertEquals(k._compiled_pattern, ['=~', 'field', 'hi_compiled'])
+        self.assertEquals(k._compiled_pattern, ('=~', 'field', re.compile('hi', re.DOTALL)))
 
-    @patch('kmatch.kmatch.re.compile', spec_set=True, side_effect=lambda x, flags: '{0}_compiled'.format(x))
+    @patch('kmatch.kmatch.re.compile', spec_set=True, wraps=re.compile)
     def test_nested_list_of_single_dict(self, mock_compile):
         k = K(['!', ['=~', 'field', 'hi']])
         self.assertEquals(mock_compile.call_count, 1)
-        self.assertEquals(k._compiled_pattern, ['!', ['=~', 'field', 'hi_compiled']])
+        self.assertEquals(k._compiled_pattern, ('!', ('=~', 'field', re.compile('hi', re.DOTALL))))
 
-    @patch('kmatch.kmatch.re.compile', spec_set=True, side_effect=lambda x, flags: '{0}_compiled'.format(x))
+    @patch('kmatch.kmatch.re.compile', spec_set=True, wraps=re.compile)
     def test_nested_list_of_lists(self, mock_compile):
         k = K(['&', [['=~', 'f', 'hi'], ['=~', 'f', 'hello']]])
         self.assertEquals(mock_compile.call_count, 2)
         self.assertEquals(
             k._compiled_pattern,
-            ['&', [['=~', 'f', 'hi_compiled'], ['=~', 'f', 'hello_compiled']]])
+            ('&', (('=~', 'f', re.compile('hi', re.DOTALL)), ('=~', 'f', re.compile('hello', re.DOTALL)))))
 
-    @patch('kmatch.kmatch.re.compile', spec_set=True, side_effect=lambda x, flags: '{0}_compiled'.format(x))
+    @patch('kmatch.kmatch.re.compile', spec_set=True, wraps=re.compile)
     def test_triply_nested_list_of_dicts(self, mock_compile):
         k = K(['&', [
             ['=~', 'f', 'hi'],
@@ -394,14 +1153,14 @@ class KInitTest(TestCase):
             ]]
         ]])
         self.assertEquals(mock_compile.call_count, 5)
-        self.assertEquals(k._compiled_pattern, ['&', [
-            ['=~', 'f', 'hi_compiled'],
-            ['=~', 'f', 'hello_compiled'],
-            ['|', [
-                ['=~', 'f', 'or_hi_compiled'],
-                ['=~', 'f', 'or_hello_compiled'],
-                ['&', [
-                    ['=~', 'f', 'and_hi_compiled'],
-                ]]
-            ]]
-        ]])
+        self.assertEquals(k._compiled_pattern, ('&', (
+            ('=~', 'f', re.compile('hi', re.DOTALL)),
+            ('=~', 'f', re.compile('hello', re.DOTALL)),
+            ('|', (
+                ('=~', 'f', re.compile('or_hi', re.DOTALL)),
+                ('=~', 'f', re.compile('or_hello', re.DOTALL)),
+                ('&', (
+                    ('=~', 'f', re.compile('and_hi', re.DOTALL)),
+                )),
+            )),
+        )))
@@ -1,6 +1,7 @@
 import unittest
+from mock import patch
 
-from kmatch import KmatchTestMixin
+from kmatch import K, KmatchTestMixin
 
 
 class MixinTestUsingMixin(KmatchTestMixin, unittest.TestCase):
@@ -37,3 +38,40 @@ class MixinTestUsingMixin(KmatchTestMixin, unittest.TestCase):
         """
         with self.assertRaises(AssertionError):
             self.assertNotKmatches(['<=', 'f', 0], {'f': -1})
+
+    def test_failure_messages_explain_the_match(self):
+        """
+        Test failed assertions report the filters that decided the match
+        """
+        with self.assertRaises(AssertionError) as context:
+            self.assertKmatches(['&', [['<=', 'f', 0], ['?', 'g']]], {'f': 1, 'g': 1})
+        self.assertEqual(str(context.exception), (
+            "{'f': 1, 'g': 1} does not match ['&', [['<=', 'f', 0], ['?', 'g']]], decided by:\n"
+            "    ['<=', 'f', 0] at (0,) is False"
+        ))
+        with self.assertRaises(AssertionError) as context:
+            self.assertNotKmatches(['|', [['<=', 'f', 0], ['?', 'g']]], {'g': 1})
+        self.assertIn("matches ['|', [['<=', 'f', 0], ['?', 'g']]], decided by:\n    ['?', 'g'] at (1,) is True",
+                      str(context.exception))
+
+    def test_failure_messages_of_deep_patterns(self):
+        """
+        Test failed assertions show patterns nested deeper than repr can
+        """
+        pattern = ['==', 'f', 0]
+        for _ in range(5000):
+            pattern = ['!', ['!', pattern]]
+        with self.assertRaises(AssertionError) as context:
+            self.assertKmatches(pattern, {'f': 1})
+        self.assertTrue(str(context.exception).startswith(
+            "{'f': 1} does not match " + "['!', " * 10000 + "['==', 'f', 0]" + ']' * 10000 + ', decided by:\n'))
+
+    def test_matches_reuses_cached_pattern(self):
+        """
+        Test .assertMatches() only constructs a K object once for repeated patterns
+        """
+        with patch('kmatch.cache.K', wraps=K) as mock_k:
+            self.assertKmatches(['>=', 'f', 'mixin'], {'f': 'mixin'})
+            self.assertKmatches(['>=', 'f', 'mixin'], {'f': 'mixin'})
+            self.assertNotKmatches(['>=', 'f', 'mixin'], {'f': 'a'})
+        self.assertEqual(mock_k.call_count, 2)
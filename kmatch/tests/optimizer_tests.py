@@ -0,0 +1,131 @@
+from random import Random
+from unittest import TestCase
+
+from kmatch import K
+
+
+class KOptimizeTest(TestCase):
+    """
+    Tests the optimize option and method of K.
+    """
+    def assertOptimizesTo(self, pattern, optimized_pattern):
+        self.assertEqual(K(pattern, optimize=True).pattern, optimized_pattern)
+
+    def test_flatten(self):
+        self.assertOptimizesTo(
+            ['&', [['?', 'a'], ['&', [['?', 'b'], ['&', [['?', 'c']]]]], ['|', [['?', 'd'], ['|', [['?', 'e']]]]]]],
+            ['&', [['?', 'a'], ['?', 'b'], ['?', 'c'], ['|', [['?', 'd'], ['?', 'e']]]]])
+
+    def test_duplicates(self):
+        self.assertOptimizesTo(['|', [['?', 'a'], ['==', 'b', [1]], ['?', 'a'], ['==', 'b', [1]]]],
+                               ['|', [['?', 'a'], ['==', 'b', [1]]]])
+        self.assertOptimizesTo(['&', [['=~', 'a', '^x'], ['=~', 'a', '^x']]], ['=~', 'a', '^x'])
+
+    def test_double_negation(self):
+        self.assertOptimizesTo(['!', ['!', ['>', 'a', 1]]], ['>', 'a', 1])
+        self.assertOptimizesTo(['!', ['>', 'a', 1]], ['!', ['>', 'a', 1]])
+
+    def test_de_morgan(self):
+        self.assertOptimizesTo(
+            ['!', ['&', [['!', ['?', 'a']], ['|', [['?', 'b'], ['!', ['?', 'c']]]]]]],
+            ['|', [['?', 'a'], ['&', [['!', ['?', 'b']], ['?', 'c']]]]])
+        self.assertOptimizesTo(['!', ['^', [['?', 'a'], ['?', 'b']]]], ['^', [['!', ['?', 'a']], ['?', 'b']]])
+
+    def test_merge_ranges(self):
+        self.assertOptimizesTo(['&', [['>', 'x', 5], ['?', 'y'], ['>', 'x', 10], ['<=', 'x', 20], ['<', 'x', 20]]],
+                               ['&', [['>', 'x', 10], ['?', 'y'], ['<', 'x', 20]]])
+        self.assertOptimizesTo(['|', [['>', 'x', 5], ['>=', 'x', 10], ['>=', 'x', 5], ['<', 'x', 'm']]],
+                               ['|', [['>=', 'x', 5], ['<', 'x', 'm']]])
+        self.assertOptimizesTo(['&', [['>', 'x', 5], ['>', 'x', 'm'], ['>', 'y', 6]]],
+                               ['&', [['>', 'x', 5], ['>', 'x', 'm'], ['>', 'y', 6]]])
+        self.assertOptimizesTo(['&', [['>=', 'x', 5], ['<=', 'x', 5], ['==', 'x', 5]]],
+                               ['&', [['>=', 'x', 5], ['<=', 'x', 5], ['==', 'x', 5]]])
+
+    def test_never_matches(self):
+        for pattern in [
+            ['&', [['>', 'x', 5], ['<', 'x', 3]]],
+            ['&', [['>', 'x', 5], ['<=', 'x', 5]]],
+            ['&', [['==', 'x', 'a'], ['==', 'x', 'b']]],
+            ['&', [['==', 'x', 1], ['>', 'x', 1]]],
+            ['&', [['?', 'x'], ['!', ['?', 'x']]]],
+            ['^', [['?', 'x'], ['?', 'x']]],
+            ['&', [['?', 'y'], ['|', [['&', [['>', 'x', 5], ['<', 'x', 3]]], ['&', [['<', 'z', 1], ['>=', 'z', 1]]]]]]],
+        ]:
+            self.assertOptimizesTo(pattern, ['|', []])
+            self.assertFalse(K(pattern, optimize=True).match({'x': 4, 'y': 1}))
+
+    def test_always_matches(self):
+        for pattern in [
+            ['|', [['?', 'x'], ['!', ['?', 'x']]]],
+            ['!', ['&', [['>', 'x', 5], ['<', 'x', 3]]]],
+            ['^', [['?', 'x'], ['!', ['?', 'x']]]],
+            ['^', [['!', ['?', 'x']], ['?', 'x']]],
+            ['|', [['==', 'x', [1]], ['!', ['==', 'x', [1]]]]],
+        ]:
+            self.assertOptimizesTo(pattern, ['&', []])
+            self.assertTrue(K(pattern, optimize=True).match({}))
+
+    def test_xor_with_constants(self):
+        never = ['&', [['?', 'x'], ['!', ['?', 'x']]]]
+        always = ['!', never]
+        self.assertOptimizesTo(['^', [never, ['?', 'y']]], ['?', 'y'])
+        self.assertOptimizesTo(['^', [['?', 'y'], always]], ['!', ['?', 'y']])
+        self.assertOptimizesTo(['^', [always, ['?', 'y']]], ['!', ['?', 'y']])
+        self.assertOptimizesTo(['^', [['?', 'y'], never]], ['?', 'y'])
+
+    def test_constants_fold_away(self):
+        never = ['&', [['?', 'x'], ['!', ['?', 'x']]]]
+        self.assertOptimizesTo(['|', [never, ['?', 'y']]], ['?', 'y'])
+        self.assertOptimizesTo(['&', [['!', never], ['?', 'y'], ['?', 'z']]], ['&', [['?', 'y'], ['?', 'z']]])
+
+    def test_equal_filters_merged(self):
+        self.assertOptimizesTo(
+            ['|', [['==', 'x', 1], ['?', 'y'], ['==', 'z', 1], ['in', 'x', [3, [4]]], ['==', 'x', 2],
+                   ['==', ['a', 'b'], 1], ['==', 'x', [5]], ['==', ['a', 'b'], 2]]],
+            ['|', [['in', 'x', [1, 3, [4], 2]], ['?', 'y'], ['==', 'z', 1], ['==', ['a', 'b'], 1], ['==', 'x', [5]],
+                   ['==', ['a', 'b'], 2]]])
+        self.assertOptimizesTo(['|', [['in', 'x', [1]], ['in', 'x', [1]]]], ['in', 'x', [1]])
+
+    def test_optimize_method(self):
+        k = K(['!', ['!', ['>', 'x', 1]]], suppress_key_errors=True, nested_keys=True)
+        optimized_k = k.optimize()
+        self.assertEqual(optimized_k.pattern, ['>', 'x', 1])
+        self.assertEqual(k.pattern, ['!', ['!', ['>', 'x', 1]]])
+        self.assertFalse(optimized_k.match({}))
+
+    def test_deep_pattern(self):
+        pattern = ['==', 'f', 1]
+        for i in range(5000):
+            pattern = ['!', ['&' if i % 3 else '|', [['?', 'g'], pattern]]]
+        k, optimized_k = K(pattern), K(pattern, optimize=True)
+        for value in [{'f': 1, 'g': 1}, {'f': 2, 'g': 1}, {'f': 1}]:
+            self.assertEqual(optimized_k.match(value), k.match(value))
+        self.assertOptimizesTo(['^', [pattern, K(pattern).pattern]], ['|', []])
+        self.assertOptimizesTo(['&', [pattern, ['!', K(pattern).pattern]]], ['|', []])
+
+    def test_agrees_with_unoptimized(self):
+        random = Random(0)
+        keys = ['a', 'b', 'c']
+        filter_values = [0, 1, 2, 3, 'x', 'y', None]
+
+        def random_pattern(depth):
+            choice = random.randint(0, 9 if depth < 4 else 5)
+            if choice < 4:
+                return [random.choice(['==', '!=', '<', '<=', '>', '>=']), random.choice(keys),
+                        random.choice(filter_values)]
+            elif choice == 4:
+                return ['?', random.choice(keys)]
+            elif choice == 5:
+                return ['!?', random.choice(keys)]
+            elif choice == 6:
+                return ['!', random_pattern(depth + 1)]
+            elif choice == 7:
+                return ['^', [random_pattern(depth + 1), random_pattern(depth + 1)]]
+            return [random.choice('&|'), [random_pattern(depth + 1) for _ in range(random.randint(1, 5))]]
+
+        values = [dict((key, random.choice(filter_values)) for key in keys if random.random() < 0.8)
+                  for _ in range(100)]
+        for _ in range(300):
+            pattern = random_pattern(0)
+            k, optimized_k = K(pattern, suppress_exceptions=True), K(pattern, suppress_exceptions=True, optimize=True)
+            self.assertEqual(optimized_k.match_many(values), k.match_many(values), pattern)
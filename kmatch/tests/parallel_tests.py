@@ -0,0 +1,51 @@
+from random import Random
+from unittest import TestCase
+
+from kmatch import K
+from kmatch import parallel
+
+
+def generate_values(num_values):
+    random = Random(0)
+    return [
+        dict((key, random.choice([0, 1, 2, 'a', None])) for key in 'abc' if random.random() < 0.8)
+        for _ in range(num_values)
+    ]
+
+
+class ParallelTest(TestCase):
+    """
+    Tests the match_parallel and filter_parallel functions in K.
+    """
+    k = K(['|', [['&', [['>', 'a', 0], ['!=', 'b', 'a']]], ['=~', 'c', '^a']]], suppress_exceptions=True)
+
+    def test_match_parallel(self):
+        values = generate_values(1000)
+        self.assertEqual(
+            list(self.k.match_parallel(values, workers=2, chunksize=64)), [self.k.match(value) for value in values])
+
+    def test_match_parallel_empty(self):
+        self.assertEqual(list(self.k.match_parallel([], workers=2)), [])
+
+    def test_filter_parallel(self):
+        values = generate_values(1000)
+        self.assertEqual(
+            list(self.k.filter_parallel(iter(values), workers=2, chunksize=50)), list(self.k.filter(values)))
+
+    def test_filter_parallel_unordered(self):
+        values = [dict(value, i=i) for i, value in enumerate(generate_values(1000))]
+        matches = list(self.k.filter_parallel(values, workers=2, chunksize=10, ordered=False))
+        self.assertEqual(sorted(matches, key=lambda value: value['i']), list(self.k.filter(values)))
+
+    def test_key_error(self):
+        with self.assertRaises(KeyError):
+            list(K(['==', 'a', 1]).match_parallel([{'a': 1}, {}], workers=1))
+
+    def test_default_workers(self):
+        self.assertEqual(list(K(['?', 'a']).match_parallel([{'a': 1}, {}])), [True, False])
+
+    def test_worker_functions(self):
+        # The worker functions run in other processes, so they are also tested directly
+        parallel._initialize_worker(self.k)
+        self.assertEqual(parallel._match_chunk([{'c': 'a'}, {}]), [True, False])
+        self.assertEqual(parallel._filter_chunk([{'c': 'a'}, {}]), [{'c': 'a'}])
@@ -0,0 +1,83 @@
+import pickle
+from unittest import TestCase
+
+from kmatch import K, NodeProfile
+
+
+class KProfileTest(TestCase):
+    """
+    Tests the profile option of K.
+    """
+    pattern = ['&', [['>', 'n', 1], ['|', [['==', 's', 'a'], ['=~', 's', '^b']]]]]
+    values = [{'n': 2, 's': 'a'}, {'n': 2, 's': 'b'}, {'n': 2, 's': 'c'}, {'n': 0, 's': 'a'}, {'s': 'a'}]
+
+    def test_not_profiling(self):
+        k = K(self.pattern)
+        self.assertIsNone(k.profile)
+        self.assertIsNone(k.profile_tree())
+        k.reset_profile()
+
+    def test_counts(self):
+        k = K(self.pattern, suppress_key_errors=True, profile=True)
+        self.assertEqual([k.match(value) for value in self.values], [True, True, False, False, False])
+        self.assertEqual(list(k.profile), [(), (0,), (1,), (1, 0), (1, 1)])
+        self.assertEqual(
+            [(node.evaluations, node.matches, node.suppressed_errors) for node in k.profile.values()],
+            [(5, 2, 0), (5, 3, 1), (3, 2, 0), (3, 1, 0), (2, 1, 0)])
+        self.assertEqual(k.profile[(1, 1)].pattern, ['=~', 's', '^b'])
+        self.assertEqual(k.profile[(0,)].true_rate, 0.6)
+        self.assertEqual(k.profile[(0,)].false_rate, 0.4)
+        self.assertTrue(k.profile[()].time >= k.profile[(1,)].time > 0)
+
+    def test_errors(self):
+        k = K(['!', ['>', 'n', 1]], profile=True)
+        with self.assertRaises(KeyError):
+            k.match({})
+        self.assertFalse(k.match({'n': 2}))
+        self.assertEqual([(node.evaluations, node.errors) for node in k.profile.values()], [(2, 1), (2, 1)])
+        self.assertEqual(k.profile[()].false_rate, 0.5)
+
+    def test_profile_tree(self):
+        k = K(['^', [['!', ['?', 'a']], ['?', 'b']]], profile=True)
+        self.assertTrue(k.match({'b': 1}) is False)
+        tree = k.profile_tree()
+        self.assertEqual(tree['path'], ())
+        self.assertEqual(tree['evaluations'], 1)
+        self.assertEqual(tree['operands'][0]['pattern'], ['!', ['?', 'a']])
+        self.assertEqual(tree['operands'][0]['operands'][0]['path'], (0, 0))
+        self.assertEqual(tree['operands'][0]['operands'][0]['false_rate'], 1.0)
+        self.assertNotIn('operands', tree['operands'][1])
+
+    def test_reset_profile(self):
+        k = K(self.pattern, suppress_key_errors=True, profile=True)
+        k.match_many(self.values)
+        k.reset_profile()
+        self.assertEqual(k.profile[(0,)].as_dict(), {
+            'path': (0,), 'pattern': ['>', 'n', 1], 'evaluations': 0, 'matches': 0, 'true_rate': None,
+            'false_rate': None, 'suppressed_errors': 0, 'errors': 0, 'time': 0.0,
+        })
+
+    def test_reorder_filters(self):
+        k = K(['|', [['=~', 's', '^b'], ['?', 'n']]], reorder_filters=True, profile=True)
+        self.assertTrue(k.match({'n': 1}))
+        self.assertEqual(k.profile[(0,)].evaluations, 0)
+        self.assertEqual(k.profile[(1,)].evaluations, 1)
+
+    def test_shared_lookups_not_merged(self):
+        k = K(['|', [['=~', 'a.b', '^x'], ['=~', 'a.b', '^y'], ['==', 'a.c', 1]]], nested_keys=True, profile=True)
+        self.assertTrue(k.match({'a': {'b': 'y', 'c': 0}}))
+        self.assertEqual([node.evaluations for node in k.profile.values()], [1, 1, 1, 0])
+
+    def test_setter_and_pickle_restart_profile(self):
+        k = K(['>', 'n', 1], profile=True)
+        k.match({'n': 2})
+        unpickled_k = pickle.loads(pickle.dumps(k))
+        self.assertEqual(unpickled_k.profile[()].evaluations, 0)
+        k.suppress_exceptions = True
+        self.assertFalse(k.match({}))
+        self.assertEqual((k.profile[()].evaluations, k.profile[()].suppressed_errors), (1, 1))
+
+    def test_repr(self):
+        node_profile = NodeProfile((1,), ['?', 'a'])
+        self.assertEqual(
+            repr(node_profile), 'NodeProfile(path=(1,), evaluations=0, matches=0, suppressed_errors=0, time=0.000000)')
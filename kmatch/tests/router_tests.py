@@ -0,0 +1,131 @@
+from collections import Counter
+from random import Random
+from unittest import TestCase
+
+from mock import patch
+
+from kmatch import K, KRouter
+from kmatch.tests.kmatch_tests import match_or_error, random_options, random_pattern, random_value
+
+
+class LookupCountingDict(dict):
+    """
+    A dictionary that counts how many times each of its items is looked up.
+    """
+    def __init__(self, *args, **kwargs):
+        super(LookupCountingDict, self).__init__(*args, **kwargs)
+        self.lookups = Counter()
+
+    def __getitem__(self, key):
+        self.lookups[key] += 1
+        return super(LookupCountingDict, self).__getitem__(key)
+
+
+def route_or_error(route, value):
+    """
+    Returns the result of routing the value, or the type of the exception raised.
+    """
+    try:
+        return route(value)
+    except (KeyError, TypeError) as error:
+        return type(error)
+
+
+class KRouterTest(TestCase):
+    """
+    Tests the KRouter class.
+    """
+    def test_empty(self):
+        router = KRouter(default='default')
+        self.assertEqual(len(router), 0)
+        self.assertEqual(router.route({'f': 1}), 'default')
+        self.assertEqual(router.route_all({'f': 1}), [])
+
+    def test_route(self):
+        router = KRouter([(K(['>', 'f', 5]), 'a'), (K(['>', 'f', 0]), 'b'), (K(['?', 'g']), 'c')], default='d')
+        self.assertEqual(len(router), 3)
+        self.assertEqual(router.route({'f': 6}), 'a')
+        self.assertEqual(router.route({'f': 1}), 'b')
+        self.assertEqual(router.route({'f': 0}), 'd')
+        self.assertEqual(router.route_all({'f': 6, 'g': 1}), ['a', 'b', 'c'])
+        self.assertEqual(router.route_all({'f': 1, 'g': 1}), ['b', 'c'])
+
+    def test_add_after_route(self):
+        router = KRouter([(K(['==', 'f', 1]), 'a')])
+        self.assertIsNone(router.route({'f': 2}))
+        router.add(K(['==', 'f', 2]), 'b')
+        self.assertEqual(router.route({'f': 2}), 'b')
+
+    def test_shared_filters_are_evaluated_once(self):
+        router = KRouter([
+            (K(['&', [['==', 'env', 'prod'], ['==', 'shard', i]]]), i) for i in range(5)
+        ] + [(K(['|', [['!', ['==', 'env', 'prod']], ['>', 'shard', 3]]]), 'last')])
+        value = LookupCountingDict({'env': 'prod', 'shard': 4})
+        self.assertEqual(router.route_all(value), [4, 'last'])
+        self.assertEqual(value.lookups['env'], 1)
+        value = LookupCountingDict({'env': 'prod', 'shard': 2})
+        self.assertEqual(router.route(value), 2)
+        self.assertEqual(value.lookups['env'], 1)
+        self.assertEqual(value.lookups['shard'], 3)
+
+    def test_shared_operators_are_evaluated_once(self):
+        shared = ['|', [['==', 'region', 'eu'], ['==', 'region', 'us']]]
+        router = KRouter([
+            (K(['&', [shared, ['==', 'shard', 1]]]), 'a'),
+            (K(['&', [['==', 'shard', 2], shared]]), 'b'),
+            (K(['^', [shared, ['?', 'x']]]), 'c'),
+        ])
+        value = LookupCountingDict({'region': 'us', 'shard': 2})
+        self.assertEqual(router.route_all(value), ['b', 'c'])
+        # The | is matched by the callable of its K object, which merges its == filters
+        self.assertEqual(value.lookups['region'], 1)
+
+    def test_unshared_patterns_use_their_matchers(self):
+        k = K(['|', [['==', 'f', 1], ['==', 'f', 2]]])
+        router = KRouter([(k, 'a'), (K(['==', 'g', 1]), 'b')])
+        with patch.object(k, '_build_matcher', wraps=k._build_matcher) as mock_build_matcher:
+            self.assertEqual(router.route({'f': 2}), 'a')
+        self.assertEqual(mock_build_matcher.call_args_list[0][0], (k._compiled_pattern,))
+
+    def test_filters_with_different_options_are_not_shared(self):
+        router = KRouter([(K(['==', 'f', 1], suppress_key_errors=True), 'a'), (K(['==', 'f', 1]), 'b')])
+        self.assertEqual(router.route({'f': 1}), 'a')
+        with self.assertRaises(KeyError):
+            router.route({})
+        router = KRouter([(K(['==', 'f', 1]), 'a'), (K(['==', 'f', True]), 'b')])
+        self.assertEqual(router.route_all({'f': 1}), ['a', 'b'])
+
+    def test_unhashable_filter_values(self):
+        router = KRouter([(K(['==', 'f', [1]]), 'a'), (K(['==', 'f', [1]]), 'b')])
+        self.assertEqual(router.route_all({'f': [1]}), ['a', 'b'])
+
+    def test_patterns_matched_whole(self):
+        deep = ['&', [['==', 'f', 1]]]
+        for _ in range(10):
+            deep = ['!', ['!', deep]]
+        ks = [K(['==', 'f', 1], profile=True), K(['==', 'f', 1], reorder_filters=True), K(deep)]
+        router = KRouter((k, i) for i, k in enumerate(ks))
+        self.assertEqual(router.route_all({'f': 1}), [0, 1, 2])
+        self.assertEqual(ks[0].profile[()].evaluations, 1)
+
+    def test_agrees_with_match(self):
+        random = Random(0)
+        for _ in range(100):
+            ks = []
+            while len(ks) < 10:
+                try:
+                    ks.append(K(random_pattern(random, depth=2), **random_options(random)))
+                except ValueError:
+                    # Regex filters on filter values that aren't strings
+                    continue
+            router = KRouter((k, i) for i, k in enumerate(ks))
+            for _ in range(10):
+                value = random_value(random)
+                results = [match_or_error(k, value) for k in ks]
+                errors = [result for result in results if result not in (True, False)]
+                self.assertEqual(
+                    route_or_error(router.route_all, value),
+                    errors[0] if errors else [i for i, result in enumerate(results) if result])
+                first = next((result if result not in (True, False) else i for i, result in enumerate(results)
+                              if result is not False), None)
+                self.assertEqual(route_or_error(router.route, value), first)
@@ -0,0 +1,152 @@
+import gc
+from io import BytesIO
+import mmap
+import os
+import pickle
+from random import Random
+from tempfile import NamedTemporaryFile
+from unittest import TestCase
+
+from mock import patch
+
+from kmatch import K, KIndex
+from kmatch.kmatch import _LazyRegex
+from kmatch.serialization import dump, dumps, load, loads
+from kmatch.tests.kmatch_tests import match_or_error, random_options, random_pattern, random_value
+
+
+class SerializationTest(TestCase):
+    """
+    Tests the dump, dumps, load and loads functions.
+    """
+    def test_k(self):
+        k = K(['&', [['=~', 'f', '^a'], ['in', 'g', [1, [2]]], ['!', ['?', 'h']], ['^', [['>', 'n', 1], ['!?', 'm']]]]])
+        loaded_k = loads(dumps(k))
+        self.assertIsInstance(loaded_k, K)
+        self.assertEqual(loaded_k.pattern, k.pattern)
+        self.assertEqual(loaded_k.get_field_keys(), k.get_field_keys())
+        self.assertTrue(loaded_k.match({'f': 'abc', 'g': [2], 'n': 2, 'm': 1}))
+        self.assertFalse(loaded_k.match({'f': 'abc', 'g': 3, 'n': 2, 'm': 1}))
+
+    def test_list_keys(self):
+        k = K(['&', [['==', ['a', 'b'], 1], ['?', ['a', 'c']], ['==', ('a', 'd'), 2]]], nested_keys=True)
+        data = dumps(k)
+        self.assertNotIn(b'_ListKey', data)
+        loaded_k = loads(data)
+        self.assertEqual(loaded_k.pattern, k.pattern)
+        self.assertTrue(loaded_k.match({'a': {'b': 1, 'c': 1, 'd': 2}}))
+
+    def test_list(self):
+        ks = [K(['==', 'f', 1]), K(['==', 'f', [1]], suppress_key_errors=True)]
+        loaded_ks = loads(dumps(iter(ks)))
+        self.assertEqual([k.pattern for k in loaded_ks], [k.pattern for k in ks])
+        self.assertFalse(loaded_ks[1].match({}))
+        with self.assertRaises(KeyError):
+            loaded_ks[0].match({})
+
+    def test_index(self):
+        ks = [K(['==', 'f', 1]), K(['>', 'f', 0]), K(['=~', 'g', '^a'])]
+        index = loads(dumps(KIndex(ks)))
+        self.assertIsInstance(index, KIndex)
+        self.assertEqual([k.pattern for k in index.match({'f': 1, 'g': 'b'})], [ks[0].pattern, ks[1].pattern])
+
+    def test_options(self):
+        for options in [{'suppress_exceptions': True}, {'reorder_filters': True}, {'nested_keys': True},
+                        {'optimize': True}, {'codegen': True}, {'profile': True}]:
+            loaded_k = loads(dumps(K(['&', [['==', 'a.b', 1], ['==', 'a.b', 1]]], **options)))
+            self.assertEqual(loaded_k._options(), K(['?', 'f'], **options)._options())
+
+    def test_shared_patterns(self):
+        k = K(['|', [['=~', 'f', '^a'], ['=~', 'g', '^a']]])
+        loaded_k, loaded_copy = loads(dumps([k, K(k, suppress_key_errors=True)]))
+        self.assertIs(loaded_copy._compiled_pattern, loaded_k._compiled_pattern)
+        self.assertIs(loaded_copy._field_key_usage, loaded_k._field_key_usage)
+        self.assertTrue(loaded_copy._suppress_key_errors)
+        # Equal regexes share a regex
+        self.assertIs(loaded_k._compiled_pattern[1][0][2], loaded_k._compiled_pattern[1][1][2])
+
+    def test_deep_pattern(self):
+        pattern = ['in', 'f', [1, [2]]]
+        for _ in range(5000):
+            pattern = ['!', ['^', [['?', 'g'], pattern]]]
+        k = K(pattern)
+        loaded_k = loads(dumps(k))
+        self.assertEqual(loaded_k._flatten(loaded_k._compiled_pattern), k._flatten(k._compiled_pattern))
+        for value in [{'f': [2], 'g': 1}, {'f': 3, 'g': 1}, {'f': 1}]:
+            self.assertEqual(loaded_k.match(value), k.match(value))
+
+    def test_matchers_and_regexes_are_built_on_first_match(self):
+        data = dumps(K(['=~', 'f', '^a.*[0-9]$']))
+        with patch('kmatch.kmatch._compile_regex') as mock_compile_regex:
+            loaded_k = loads(data)
+            self.assertFalse(mock_compile_regex.called)
+        with patch.object(K, '_rebuild_matcher', wraps=loaded_k._rebuild_matcher) as mock_rebuild_matcher:
+            self.assertTrue(loaded_k.match({'f': 'abc1'}))
+            self.assertFalse(loaded_k.match({'f': 'abc'}))
+        self.assertEqual(mock_rebuild_matcher.call_count, 1)
+        self.assertNotIsInstance(loaded_k._compiled_pattern[2].match, type(loaded_k.match))
+
+    def test_profile_and_source_before_first_match(self):
+        loaded_k = loads(dumps(K(['==', 'f', 1], profile=True)))
+        self.assertEqual(loaded_k.profile_tree()['evaluations'], 0)
+        loaded_k = loads(dumps(K(['==', 'f', 1], codegen=True)))
+        self.assertIn('def match(value)', loaded_k.source)
+
+    def test_pickle_before_first_match(self):
+        loaded_k = pickle.loads(pickle.dumps(loads(dumps(K(['=~', 'f', '^a'])))))
+        self.assertTrue(loaded_k.match({'f': 'a'}))
+
+    def test_lazy_regex(self):
+        regex = _LazyRegex('^a')
+        self.assertEqual(regex, _LazyRegex('^a'))
+        self.assertNotEqual(regex, _LazyRegex('^b'))
+        self.assertEqual(hash(regex), hash(_LazyRegex('^a')))
+        self.assertEqual(pickle.loads(pickle.dumps(regex)), regex)
+
+    def test_garbage_collection_is_restored(self):
+        data = dumps(K(['?', 'f']))
+        with patch('kmatch.serialization.gc') as mock_gc:
+            mock_gc.isenabled.return_value = True
+            loads(data)
+            mock_gc.disable.assert_called_once_with()
+            mock_gc.enable.assert_called_once_with()
+        gc.disable()
+        try:
+            loads(data)
+            self.assertFalse(gc.isenabled())
+        finally:
+            gc.enable()
+
+    def test_files(self):
+        ks = [K(['==', 'f', 1]), K(['?', 'g'])]
+        with NamedTemporaryFile(delete=False) as rules_file:
+            dump(ks, rules_file)
+        try:
+            with open(rules_file.name, 'rb') as rules_file:
+                self.assertEqual([k.pattern for k in load(rules_file)], [k.pattern for k in ks])
+                with mmap.mmap(rules_file.fileno(), 0, access=mmap.ACCESS_READ) as rules_map:
+                    self.assertEqual([k.pattern for k in load(rules_map)], [k.pattern for k in ks])
+        finally:
+            os.remove(rules_file.name)
+
+    def test_invalid_data(self):
+        with self.assertRaises(ValueError):
+            loads(pickle.dumps([K(['?', 'f'])]))
+        with self.assertRaises(ValueError):
+            load(BytesIO(pickle.dumps(('kmatch', 2, 'k', []))))
+
+    def test_agrees_with_constructed(self):
+        random = Random(0)
+        for _ in range(200):
+            kwargs = random_options(random)
+            try:
+                k = K(random_pattern(random), **kwargs)
+            except ValueError:
+                # Regex filters on filter values that aren't strings
+                continue
+            loaded_k = loads(dumps(k))
+            self.assertEqual(loaded_k.pattern, k.pattern)
+            self.assertEqual(loaded_k.get_field_keys(), k.get_field_keys())
+            for _ in range(10):
+                value = random_value(random)
+                self.assertEqual(match_or_error(loaded_k, value), match_or_error(k, value))
@@ -0,0 +1,159 @@
+from random import Random
+import sqlite3
+from unittest import TestCase
+
+from mock import MagicMock, patch
+
+from kmatch import K
+from kmatch.sql import register_regexp, to_sql
+
+
+ROWS = [
+    {'id': 1, 'status': 'error', 'n': 3, 'path': '/a/b'},
+    {'id': 2, 'status': 'ok', 'n': 5, 'path': None},
+    {'id': 3, 'status': None, 'n': None, 'path': '/c'},
+    {'id': 4, 'status': 'Error', 'n': 9, 'path': '/a\nb'},
+]
+
+
+class ToSqlTest(TestCase):
+    """
+    Tests translating patterns into SQL WHERE clauses, run against an in-memory SQLite database.
+    """
+    def setUp(self):
+        self.connection = sqlite3.connect(':memory:')
+        self.connection.row_factory = sqlite3.Row
+        register_regexp(self.connection)
+        self.connection.execute('CREATE TABLE rows (id INTEGER, status TEXT, n INTEGER, path TEXT)')
+        self.connection.executemany('INSERT INTO rows VALUES (:id, :status, :n, :path)', ROWS)
+
+    def tearDown(self):
+        self.connection.close()
+
+    def select(self, sql_where):
+        rows = [dict(row) for row in self.connection.execute(
+            'SELECT * FROM rows WHERE {0} ORDER BY id'.format(sql_where.where), sql_where.params)]
+        if sql_where.residual is not None:
+            rows = list(sql_where.residual.filter(rows))
+        return [row['id'] for row in rows]
+
+    def test_comparisons(self):
+        k = K(['&', [['>', 'n', 2], ['<=', 'n', 5], ['!=', 'status', 'ok']]])
+        sql_where = to_sql(k)
+        self.assertEqual(sql_where.where, (
+            '("n" IS NOT NULL AND "n" > ?) AND ("n" IS NOT NULL AND "n" <= ?) AND ("status" IS NULL OR "status" <> ?)'
+        ))
+        self.assertEqual(sql_where.params, [2, 5, 'ok'])
+        self.assertIsNone(sql_where.residual)
+        self.assertEqual(self.select(sql_where), [1])
+
+    def test_null(self):
+        self.assertEqual(self.select(to_sql(K(['==', 'status', None]))), [3])
+        self.assertEqual(self.select(to_sql(K(['!=', 'status', None]))), [1, 2, 4])
+        self.assertEqual(self.select(to_sql(K(['!', ['==', 'status', 'ok']]))), [1, 3, 4])
+        self.assertEqual(self.select(to_sql(K(['!', ['<', 'n', 4]], suppress_exceptions=True))), [2, 3, 4])
+
+    def test_operators(self):
+        k = K(['|', [['^', [['==', 'status', 'ok'], ['>', 'n', 4]]], ['&', []], ['|', []]]], suppress_exceptions=True)
+        self.assertEqual(self.select(to_sql(k)), [1, 2, 3, 4])
+        k = K(['|', [['^', [['==', 'status', 'ok'], ['>', 'n', 4]]], ['|', []]]], suppress_exceptions=True)
+        self.assertEqual(self.select(to_sql(k)), [4])
+
+    def test_membership(self):
+        self.assertEqual(self.select(to_sql(K(['in', 'status', ['ok', 'error']]))), [1, 2])
+        self.assertEqual(self.select(to_sql(K(['in', 'status', ['ok', None]]))), [2, 3])
+        self.assertEqual(self.select(to_sql(K(['!in', 'status', ['ok', None]]))), [1, 4])
+        self.assertEqual(self.select(to_sql(K(['in', 'status', [None]]))), [3])
+        self.assertEqual(self.select(to_sql(K(['!in', 'status', []]))), [1, 2, 3, 4])
+
+    def test_key_filters(self):
+        self.assertEqual(to_sql(K(['?', 'status']), columns=['status']).where, '1 = 1')
+        self.assertEqual(to_sql(K(['!?', 'status'])).where, '1 = 0')
+        self.assertEqual(to_sql(K(['?', 'missing']), columns=['status']).where, '1 = 0')
+        self.assertEqual(to_sql(K(['!?', 'missing']), columns=['status']).where, '1 = 1')
+
+    def test_missing_columns(self):
+        k = K(['|', [['==', 'missing', 1], ['==', 'status', 'ok']]])
+        sql_where = to_sql(k, columns=['status'])
+        self.assertEqual(sql_where.where, '1 = 1')
+        self.assertEqual(sql_where.residual.pattern, k.pattern)
+        with self.assertRaises(KeyError):
+            self.select(sql_where)
+        sql_where = to_sql(K(k, suppress_key_errors=True), columns=['status'])
+        self.assertIsNone(sql_where.residual)
+        self.assertEqual(self.select(sql_where), [2])
+
+    def test_regex(self):
+        k = K(['=~', 'path', '^/a.b'], suppress_exceptions=True)
+        sql_where = to_sql(k)
+        self.assertEqual(sql_where.where, '1 = 1')
+        self.assertIs(sql_where.residual.suppress_exceptions, True)
+        self.assertEqual(self.select(sql_where), [1, 4])
+        sql_where = to_sql(k, regexp=True)
+        self.assertEqual(sql_where.where, '("path" IS NOT NULL AND "path" REGEXP ?)')
+        self.assertIsNone(sql_where.residual)
+        self.assertEqual(self.select(sql_where), [1, 4])
+        self.assertEqual(self.select(to_sql(K(['=~', 'n', '3'], suppress_exceptions=True), regexp=True)), [])
+        self.assertEqual(to_sql(K(['=~', 'path', b'^/a']), regexp=True).where, '1 = 1')
+
+    def test_register_regexp_before_python_38(self):
+        connection = MagicMock()
+        with patch('kmatch.sql.sys.version_info', (3, 7, 9)):
+            register_regexp(connection)
+        self.assertEqual(connection.create_function.call_args[1], {})
+        register_regexp(connection)
+        self.assertEqual(connection.create_function.call_args[1], {'deterministic': True})
+
+    def test_residual(self):
+        k = K(['&', [['>', 'n', 2], ['&', [['==', 'path.x', 1], ['==', 'status', [1]]]], ['<', 'n', float('inf')],
+                     ['in', 'status', [('error',)]], ['==', 'status', 'error']]], nested_keys=True)
+        sql_where = to_sql(k)
+        self.assertEqual(sql_where.where, '("n" IS NOT NULL AND "n" > ?) AND ("status" IS NOT NULL AND "status" = ?)')
+        self.assertEqual(sql_where.params, [2, 'error'])
+        self.assertEqual(sql_where.residual.pattern, ['&', [
+            ['==', 'path.x', 1], ['==', 'status', [1]], ['<', 'n', float('inf')], ['in', 'status', [('error',)]]]])
+        self.assertEqual(to_sql(K(['<', 'n', None])).residual.pattern, ['<', 'n', None])
+        self.assertEqual(to_sql(K(['==', ('n',), 1])).where, '1 = 1')
+
+    def test_quoted_columns(self):
+        self.assertEqual(to_sql(K(['==', 'a"b', 1])).where, '("a""b" IS NOT NULL AND "a""b" = ?)')
+
+    def test_paramstyle(self):
+        k = K(['in', 'status', ['ok', 'error']])
+        self.assertEqual(k.to_sql(paramstyle='format').where, '("status" IS NOT NULL AND "status" IN (%s, %s))')
+        self.assertEqual(K(['==', 'disk%used', 5]).to_sql(paramstyle='format').where,
+                         '("disk%%used" IS NOT NULL AND "disk%%used" = %s)')
+        self.assertEqual(K(['==', 'disk%used', 5]).to_sql().where, '("disk%used" IS NOT NULL AND "disk%used" = ?)')
+        with self.assertRaises(ValueError):
+            k.to_sql(paramstyle='pyformat')
+
+    def test_deep_pattern(self):
+        pattern = ['==', 'n', 3]
+        for _ in range(5000):
+            pattern = ['!', pattern]
+        self.assertTrue(to_sql(K(pattern)).where.startswith('NOT (NOT ('))
+
+    def test_agrees_with_match(self):
+        random = Random(0)
+        filter_values = {'status': ['ok', 'error', 'x', None], 'n': [0, 3, 5, 9.5, None], 'missing': [1]}
+
+        def random_pattern(depth):
+            choice = random.randint(0, 7 if depth < 3 else 3)
+            key = random.choice(['status', 'n', 'n', 'missing'])
+            if choice < 2:
+                return [random.choice(['==', '!=', '<', '<=', '>', '>=']), key, random.choice(filter_values[key])]
+            elif choice == 2:
+                return [random.choice(['in', '!in']), key, random.sample(filter_values[key], 1 + choice % 2)]
+            elif choice == 3:
+                return [random.choice(['?', '!?']), key]
+            elif choice == 4:
+                return ['!', random_pattern(depth + 1)]
+            elif choice == 5:
+                return ['^', [random_pattern(depth + 1), random_pattern(depth + 1)]]
+            return [random.choice('&|'), [random_pattern(depth + 1) for _ in range(random.randint(0, 3))]]
+
+        rows = [dict(row) for row in self.connection.execute('SELECT * FROM rows ORDER BY id')]
+        for _ in range(300):
+            k = K(random_pattern(0), suppress_exceptions=True)
+            sql_where = to_sql(k, columns=['id', 'status', 'n', 'path'])
+            self.assertEqual(self.select(sql_where), [row['id'] for row in rows if k.match(row)])
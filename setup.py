@@ -38,6 +38,9 @@ setup(
     ],
     license='MIT',
     install_requires=[],
+    extras_require={
+        'numpy': ['numpy'],
+    },
     include_package_data=True,
     test_suite='nose.collector',
     tests_require=[